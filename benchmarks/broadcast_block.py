@@ -0,0 +1,80 @@
+"""Measures how long the node's /broadcast-block endpoint takes to add a new
+block on top of a chain of 10k and 100k blocks (through the Flask test
+client, so no network is involved).
+
+Run it from the repository root (it works in a temporary directory):
+
+    python benchmarks/broadcast_block.py --heights 10000 100000 --blocks 20
+"""
+
+import os
+import sys
+import tempfile
+from argparse import ArgumentParser
+from statistics import median
+from time import perf_counter, time
+
+from synthetic_chain import build_chain
+
+
+def mine(blockchain, public_key):
+    """Mine a block (with only the mining reward) on top of a node's chain,
+    the way a peer would send it."""
+    import utility.constants as constants
+    from block import Block
+    from transaction import Transaction
+    from utility.hash_util import merkle_root
+    from utility.verification import Verification
+    parent = blockchain.get_last_blockchain_value()
+    difficulty = blockchain.get_difficulty()
+    transactions = [Transaction(constants.MINING, public_key, '',
+                                constants.MINING_REWARD, time())]
+    root = merkle_root(transactions)
+    proof = blockchain.miner.mine_prefix(
+        Verification.merkle_proof_prefix(root, parent.hash), difficulty)
+    return Block(parent.index + 1, parent.hash, transactions, proof, time(),
+                 difficulty, merkle_root=root)
+
+
+def main():
+    parser = ArgumentParser(description='Measure the /broadcast-block endpoint.')
+    parser.add_argument('--heights', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--blocks', type=int, default=20,
+                        help='blocks sent per height')
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp())
+
+    import blockChain
+    # node.py imports the module as 'blockchain' (the file is blockChain.py,
+    # which only resolves on case-insensitive file systems)
+    sys.modules['blockchain'] = blockChain
+    import node
+    from wallet import Wallet
+
+    wallet = Wallet(1)
+    wallet.create_keys()
+    client = node.app.test_client()
+    print('{:>7} {:>10} {:>10} {:>10}'.format('height', 'p50', 'max', 'setup'))
+    for node_id, height in enumerate(args.heights, 1):
+        start = perf_counter()
+        blockchain = blockChain.Blockchain(wallet.public_key, node_id)
+        blockchain.chain = build_chain(height)
+        blockchain.save_chain()
+        setup = perf_counter() - start
+        node.wallet = wallet
+        node.blockchain = blockchain
+        latencies = []
+        for _ in range(args.blocks):
+            block = mine(blockchain, wallet.public_key)
+            start = perf_counter()
+            response = client.post('/broadcast-block', json={'block': block.to_dict()})
+            latencies.append(perf_counter() - start)
+            if response.status_code != 201:
+                raise AssertionError('block {} was refused: {}'.format(
+                    block.index, response.get_json()))
+        print('{:>7} {:>8.2f}ms {:>8.2f}ms {:>9.1f}s'.format(
+            height, median(latencies) * 1000, max(latencies) * 1000, setup))
+
+
+if __name__ == '__main__':
+    main()
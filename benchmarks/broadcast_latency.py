@@ -0,0 +1,123 @@
+"""Measures how long a broadcast to 2 to 50 peers takes: one request after
+the other (how the node used to send), with the Broadcaster waiting for the
+answers, and with the Broadcaster firing and forgetting (the time until the
+call returns and until the last peer got the message).
+
+The peers are HTTP servers in this process, each answering after a fixed
+delay (the time a node needs to handle the message).
+
+Run it from the repository root:
+
+    python benchmarks/broadcast_latency.py --delay 0.02 --rounds 5
+"""
+
+import os
+import sys
+import threading
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import median
+from time import perf_counter, sleep
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PEER_COUNTS = (2, 5, 10, 20, 50)
+PAYLOAD = {'block': {'index': 1, 'transactions': []}}
+
+
+class Peer:
+    """An HTTP server which counts the messages it received.
+
+    Attributes:
+        :node: The address of the peer (host:port).
+        :received: The number of messages received.
+    """
+
+    def __init__(self, delay):
+        peer = self
+        self.received = 0
+        self.__lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                sleep(delay)
+                peer.count()
+                self.send_response(201)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.__server.daemon_threads = True
+        self.node = '127.0.0.1:{}'.format(self.__server.server_address[1])
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def count(self):
+        with self.__lock:
+            self.received += 1
+
+    def shutdown(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+def sequential(nodes):
+    for node in nodes:
+        requests.post('http://{}/broadcast-block'.format(node), json=PAYLOAD)
+
+
+def wait_for(peers, expected):
+    while sum(peer.received for peer in peers) < expected:
+        sleep(0.0005)
+
+
+def main():
+    parser = ArgumentParser(description='Measure the broadcast latency to '
+                                        'in-process peers.')
+    parser.add_argument('--delay', type=float, default=0.02,
+                        help='seconds a peer takes to answer')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    from utility.broadcaster import Broadcaster
+
+    print('{:>5} {:>12} {:>12} {:>14} {:>14}'.format(
+        'peers', 'sequential', 'wait', 'forget call', 'forget done'))
+    for count in PEER_COUNTS:
+        peers = [Peer(args.delay) for _ in range(count)]
+        nodes = [peer.node for peer in peers]
+        broadcaster = Broadcaster()
+        # Open the keep-alive sessions first, as a running node has them
+        broadcaster.post(nodes, '/broadcast-block', PAYLOAD)
+        times = {'sequential': [], 'wait': [], 'call': [], 'done': []}
+        for _ in range(args.rounds):
+            start = perf_counter()
+            sequential(nodes)
+            times['sequential'].append(perf_counter() - start)
+
+            start = perf_counter()
+            broadcaster.post(nodes, '/broadcast-block', PAYLOAD)
+            times['wait'].append(perf_counter() - start)
+
+            expected = sum(peer.received for peer in peers) + count
+            start = perf_counter()
+            broadcaster.post(nodes, '/broadcast-block', PAYLOAD, wait=False)
+            times['call'].append(perf_counter() - start)
+            wait_for(peers, expected)
+            times['done'].append(perf_counter() - start)
+        print('{:>5} {:>11.1f}ms {:>11.1f}ms {:>13.2f}ms {:>13.1f}ms'.format(
+            count, *(median(times[key]) * 1000
+                     for key in ('sequential', 'wait', 'call', 'done'))))
+        for peer in peers:
+            peer.shutdown()
+
+
+if __name__ == '__main__':
+    main()
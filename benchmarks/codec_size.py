@@ -0,0 +1,64 @@
+"""Compares the binary block encoding (utility.codec) with JSON: the encoded
+size and the encode and decode speed of a batch of blocks (as the node sends
+them when syncing) and of a batch of transactions.
+
+Run it from the repository root:
+
+    python benchmarks/codec_size.py --blocks 1000
+"""
+
+import json
+from argparse import ArgumentParser
+from time import perf_counter
+
+from synthetic_chain import build_chain
+
+
+def best_time(function, argument, rounds):
+    best = None
+    for _ in range(rounds):
+        start = perf_counter()
+        function(argument)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def compare(name, values, encode, decode, rounds):
+    json_payload = json.dumps(values).encode()
+    binary_payload = encode(values)
+    if decode(binary_payload) != values:
+        raise AssertionError('the binary encoding changed the values')
+    timings = [best_time(lambda v: json.dumps(v).encode(), values, rounds),
+               best_time(encode, values, rounds),
+               best_time(json.loads, json_payload, rounds),
+               best_time(decode, binary_payload, rounds)]
+    print('{}: {:.0f}kB JSON, {:.0f}kB binary ({:.0%})'.format(
+        name, len(json_payload) / 1000, len(binary_payload) / 1000,
+        len(binary_payload) / len(json_payload)))
+    print('  encode {:.1f}ms JSON, {:.1f}ms binary'.format(timings[0] * 1000,
+                                                       timings[1] * 1000))
+    print('  decode {:.1f}ms JSON, {:.1f}ms binary'.format(timings[2] * 1000,
+                                                       timings[3] * 1000))
+
+
+def main():
+    parser = ArgumentParser(description='Compare the binary encoding with JSON.')
+    parser.add_argument('--blocks', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=2,
+                        help='transactions per block besides the reward')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    from utility import codec
+
+    blocks = [block.to_dict() for block in build_chain(args.blocks, args.transactions)]
+    transactions = [tx for block in blocks for tx in block['transactions'][:-1]]
+    compare('{} blocks'.format(len(blocks)), blocks, codec.encode_blocks,
+            codec.decode_blocks, args.rounds)
+    compare('{} transactions'.format(len(transactions)), transactions,
+            codec.encode_transactions, codec.decode_transactions, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Simulates how a mined block spreads over a network of 20 nodes and counts
+the messages it takes, with flooding (how blocks were relayed before the
+gossip layer) and with gossip (utility.gossip, as the node relays them now).
+
+A peer answers a relayed block with the status code /broadcast-block gives:
+
+- legacy: the endpoint before the gossip layer, which answered 201 for a
+  block after its tip and 409 for any block it had already. The sender
+  waited for the answers and a 409 made it sync with all of its peers (a
+  /tip request each, and a push of the block to the peers which miss it).
+- current: the endpoint answers 201 for a block it adds and 200 for one it
+  has already (202 for side blocks and 409 for invalid ones, which this
+  simulation doesn't produce). The block is relayed without waiting for the
+  answers, so no answer makes the sender sync.
+
+Flooding: a node which adds a new block sends it to all of its peers.
+
+Gossip: a node relays a block the first time it sees it, to at most
+GOSSIP_FANOUT peers which aren't known to have it.
+
+Messages travel in hops: every message sent in one hop arrives in the
+next one.
+
+Run it from the repository root:
+
+    python benchmarks/gossip_simulation.py --nodes 20 --blocks 200
+"""
+
+import os
+import random
+import sys
+from argparse import ArgumentParser
+from statistics import mean
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SimulatedNode:
+    """A node of the simulated network.
+
+    Attributes:
+        :peers: The ids of the connected nodes.
+        :gossip: The relay decisions of the node (for the gossip mode).
+        :blocks: The ids of the blocks the node has.
+    """
+
+    def __init__(self, peers, gossip):
+        self.peers = peers
+        self.gossip = gossip
+        self.blocks = set()
+
+
+def build_network(count, degree, seed):
+    """Return the peers of each node: every node connects to degree random
+    other nodes (connections go both ways, so some nodes get more)."""
+    rng = random.Random(seed)
+    peers = [set() for _ in range(count)]
+    for node in range(count):
+        for other in rng.sample([other for other in range(count) if other != node],
+                                degree):
+            peers[node].add(other)
+            peers[other].add(node)
+    return [sorted(node_peers) for node_peers in peers]
+
+
+def answer(receiver, block_id, legacy):
+    """Return the status code the receiver answers a relayed block with, and
+    add the block if it's new."""
+    if block_id in receiver.blocks:
+        return 409 if legacy else 200
+    receiver.blocks.add(block_id)
+    return 201
+
+
+def propagate(nodes, miner, block_id, flood, legacy):
+    """Spread a block mined by the miner and return the number of block
+    messages, the number of sync messages, the hops until the last node had
+    the block and the number of nodes which got it."""
+    block_messages = sync_messages = hops = 0
+    nodes[miner].blocks.add(block_id)
+    if not flood:
+        nodes[miner].gossip.mark_seen(block_id)
+    # The nodes which added the block in the last hop, with the peer they
+    # got it from
+    frontier = [(miner, None)]
+    while frontier:
+        deliveries = []
+        for node, source in frontier:
+            if flood:
+                targets = nodes[node].peers
+            else:
+                targets = nodes[node].gossip.targets(nodes[node].peers, block_id,
+                                                     source)
+            block_messages += len(targets)
+            deliveries.extend((target, node) for target in targets)
+        if not deliveries:
+            break
+        hops += 1
+        frontier = []
+        conflicts = set()
+        for target, sender in deliveries:
+            receiver = nodes[target]
+            if not flood:
+                receiver.gossip.learned(sender, block_id)
+            status = answer(receiver, block_id, legacy)
+            if status == 201:
+                if not flood:
+                    receiver.gossip.mark_seen(block_id)
+                frontier.append((target, sender))
+            elif status == 409 and legacy:
+                # Only the legacy relay waited for the answers
+                conflicts.add(sender)
+        # Every sender which got a 409 syncs with all of its peers once
+        for sender in conflicts:
+            for peer in nodes[sender].peers:
+                sync_messages += 1
+                if block_id not in nodes[peer].blocks:
+                    # Pushed blocks are applied, but not relayed
+                    sync_messages += 1
+                    nodes[peer].blocks.add(block_id)
+    reached = sum(1 for node in nodes if block_id in node.blocks)
+    return block_messages, sync_messages, hops, reached
+
+
+def simulate(peers, blocks, flood, legacy, seed):
+    from utility.gossip import Gossip
+    rng = random.Random(seed)
+    nodes = [SimulatedNode(node_peers, Gossip()) for node_peers in peers]
+    results = [propagate(nodes, rng.randrange(len(nodes)), 'block-{}'.format(i),
+                         flood, legacy)
+               for i in range(blocks)]
+    return [mean(values) for values in zip(*results)]
+
+
+def main():
+    parser = ArgumentParser(description='Simulate block propagation with '
+                                        'flooding and with gossip.')
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--degrees', type=int, nargs='+', default=[19, 6],
+                        help='peers each node connects to (nodes - 1 is a '
+                             'full mesh)')
+    parser.add_argument('--blocks', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import utility.constants as constants
+
+    print('{} nodes, fanout {}, averages per mined block'.format(
+        args.nodes, constants.GOSSIP_FANOUT))
+    print('{:>6} {:>7} {:>8} {:>14} {:>14} {:>9} {:>6} {:>8}'.format(
+        'degree', 'mode', 'codes', 'block messages', 'sync messages', 'total',
+        'hops', 'reached'))
+    for degree in args.degrees:
+        peers = build_network(args.nodes, min(degree, args.nodes - 1), args.seed)
+        for mode, flood, legacy in (('flood', True, True), ('flood', True, False),
+                                    ('gossip', False, False)):
+            block_messages, sync_messages, hops, reached = simulate(
+                peers, args.blocks, flood, legacy, args.seed)
+            print(('{:>6} {:>7} {:>8} {:>14.1f} {:>14.1f} {:>9.1f} {:>6.2f} '
+                   '{:>8.2f}').format(
+                degree, mode, 'legacy' if legacy else 'current', block_messages,
+                sync_messages, block_messages + sync_messages, hops, reached))
+
+
+if __name__ == '__main__':
+    main()
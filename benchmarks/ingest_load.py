@@ -0,0 +1,100 @@
+"""Load generator for the transaction ingestion: submits pre-signed
+transactions to a node's ingestor (at a fixed rate or as fast as its queue
+takes them) and reports the sustained admission rate and the latency from
+submitting a transaction to its result.
+
+Run it from the repository root (it works in a temporary directory):
+
+    python benchmarks/ingest_load.py --transactions 20000 --rate 0
+"""
+
+import os
+import queue
+import sys
+import tempfile
+from argparse import ArgumentParser
+from time import perf_counter, sleep, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = ArgumentParser(description='Measure the transaction admission '
+                                        'rate and latency.')
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=0,
+                        help='transactions per second (0 submits as fast as '
+                             'the queue takes them)')
+    parser.add_argument('--senders', type=int, default=4)
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp())
+
+    from wallet import Wallet
+    from blockChain import Blockchain
+    from transaction import Transaction
+
+    wallets = []
+    for node_id in range(1, args.senders + 1):
+        wallet = Wallet(node_id)
+        wallet.create_keys()
+        wallets.append(wallet)
+    blockchain = Blockchain(wallets[0].public_key, 1)
+    # Fund every sender with the reward of a mined block
+    for wallet in wallets:
+        blockchain.public_key = wallet.public_key
+        blockchain.mine_block()
+    # The time isn't signed, so one signature per sender serves all of its
+    # transactions (they differ by their time)
+    amount = 1 / args.transactions
+    signatures = [wallet.sign_transaction(wallet.public_key, 'load', amount)
+                  for wallet in wallets]
+    transactions = [Transaction(wallets[i % len(wallets)].public_key, 'load',
+                                signatures[i % len(wallets)], amount, time() + i * 1e-6)
+                    for i in range(args.transactions)]
+
+    latencies = []
+
+    def submit(transaction):
+        submitted = perf_counter()
+        while True:
+            try:
+                future = blockchain.ingestor.submit(transaction)
+                break
+            except queue.Full:
+                sleep(0.001)
+        future.add_done_callback(
+            lambda future: latencies.append((perf_counter() - submitted,
+                                             future.result())))
+        return future
+
+    start = perf_counter()
+    futures = []
+    for i, transaction in enumerate(transactions):
+        if args.rate > 0:
+            delay = start + i / args.rate - perf_counter()
+            if delay > 0:
+                sleep(delay)
+        futures.append(submit(transaction))
+    for future in futures:
+        future.result()
+    elapsed = perf_counter() - start
+    blockchain.ingestor.stop()
+
+    admitted = sum(1 for _, result in latencies if result)
+    ordered = sorted(latency for latency, _ in latencies)
+    print('transactions:  {} ({} admitted, {} rejected, {} refused by the full '
+          'queue)'.format(len(transactions), admitted, len(latencies) - admitted,
+                          blockchain.ingestor.refused))
+    print('batches:       {}'.format(blockchain.ingestor.batches))
+    print('sustained:     {:.0f} tx/s over {:.2f}s'.format(admitted / elapsed, elapsed))
+    print('latency:       p50 {:.1f}ms  p99 {:.1f}ms  max {:.1f}ms'.format(
+        percentile(ordered, 0.5) * 1000, percentile(ordered, 0.99) * 1000,
+        ordered[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
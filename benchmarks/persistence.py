@@ -0,0 +1,72 @@
+"""Measures what saving one new block costs at a chain height of 1k, 10k and
+100k blocks: appending its record to the block store (and saving the open
+transactions, as the node does) against rewriting the whole chain to the old
+single JSON file (blockchain-<node_id>.txt, which every save used to do).
+
+Run it from the repository root (it works in a temporary directory):
+
+    python benchmarks/persistence.py --heights 1000 10000 100000
+"""
+
+import json
+import os
+import sys
+import tempfile
+from argparse import ArgumentParser
+from statistics import median
+from time import perf_counter
+
+from synthetic_chain import build_chain
+
+
+def legacy_save(node_id, chain, open_transactions, peer_nodes):
+    """Save the way the node did before the block store: the whole chain,
+    the open transactions and the peer nodes as one file."""
+    with open('blockchain-{}.txt'.format(node_id), mode='w') as f:
+        f.write(json.dumps([block.to_dict() for block in chain]))
+        f.write('\n')
+        f.write(json.dumps([tx.to_dict() for tx in open_transactions]))
+        f.write('\n')
+        f.write(json.dumps(list(peer_nodes)))
+
+
+def main():
+    parser = ArgumentParser(description='Measure the cost of saving a block.')
+    parser.add_argument('--heights', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--saves', type=int, default=20,
+                        help='blocks saved per measurement')
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp())
+
+    from utility.block_store import BlockStore
+
+    print('{:>7} {:>14} {:>14} {:>10} {:>12}'.format(
+        'height', 'block store', 'old format', 'speedup', 'old file'))
+    for node_id, height in enumerate(args.heights, 1):
+        chain = build_chain(height + args.saves)
+        dicts = [block.to_dict() for block in chain]
+        store = BlockStore(node_id)
+        for block in dicts[:height]:
+            store.append_block(block)
+        store_times = []
+        for block in dicts[height:]:
+            start = perf_counter()
+            store.append_block(block)
+            store.save_open_transactions([])
+            store_times.append(perf_counter() - start)
+        # A rewrite of the whole file takes seconds at large heights, a few
+        # of them are enough
+        legacy_times = []
+        for end in range(height, height + min(args.saves, 5)):
+            start = perf_counter()
+            legacy_save(node_id, chain[:end + 1], [], [])
+            legacy_times.append(perf_counter() - start)
+        store_time, legacy_time = median(store_times), median(legacy_times)
+        print('{:>7} {:>12.3f}ms {:>12.1f}ms {:>9.0f}x {:>10.1f}MB'.format(
+            height, store_time * 1000, legacy_time * 1000, legacy_time / store_time,
+            os.path.getsize('blockchain-{}.txt'.format(node_id)) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Measures how long a node takes to start (load its chain from the block
+store and rebuild its balances) by chain length, from the latest checkpoint
+(only the headers of the blocks it covers are read) and without one (every
+block is read with its transactions).
+
+Run it from the repository root (it works in a temporary directory):
+
+    python benchmarks/startup.py --heights 1000 10000 100000
+"""
+
+import os
+import sys
+import tempfile
+from argparse import ArgumentParser
+from time import perf_counter
+
+from synthetic_chain import build_chain
+
+
+def start_node(blockChain, public_key, node_id):
+    start = perf_counter()
+    blockchain = blockChain.Blockchain(public_key, node_id)
+    return perf_counter() - start, blockchain
+
+
+def main():
+    parser = ArgumentParser(description='Measure the startup time of a node.')
+    parser.add_argument('--heights', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp())
+
+    import blockChain
+    from wallet import Wallet
+
+    wallet = Wallet(1)
+    wallet.create_keys()
+    print('{:>7} {:>16} {:>18}'.format('height', 'with checkpoint',
+                                       'without checkpoint'))
+    for node_id, height in enumerate(args.heights, 1):
+        blockchain = blockChain.Blockchain(wallet.public_key, node_id)
+        blockchain.chain = build_chain(height)
+        blockchain.save_chain()
+        checkpoint = os.path.join('blockchain-{}'.format(node_id), 'checkpoint.json')
+        with_checkpoint, loaded = start_node(blockChain, wallet.public_key, node_id)
+        if loaded.get_height() != height or not loaded.check_ledger():
+            raise AssertionError('the chain was not loaded from the checkpoint')
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        without_checkpoint, loaded = start_node(blockChain, wallet.public_key, node_id)
+        if loaded.get_height() != height or not loaded.check_ledger():
+            raise AssertionError('the chain was not loaded')
+        print('{:>7} {:>15.2f}s {:>17.2f}s'.format(height, with_checkpoint,
+                                                   without_checkpoint))
+
+
+if __name__ == '__main__':
+    main()
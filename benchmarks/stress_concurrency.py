@@ -0,0 +1,129 @@
+"""Stress test of the blockchain's locking: reader threads query the balance,
+the open transactions and chain snapshots while writer threads mine blocks
+and add transactions. It fails if a reader sees a broken chain, a thread
+raises or the balance index drifts from a fresh rebuild, and reports the
+slowest read.
+
+Run it from the repository root (it works in a temporary directory):
+
+    python benchmarks/stress_concurrency.py --seconds 10 --readers 8
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import traceback
+from argparse import ArgumentParser
+from time import perf_counter, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def check_snapshot(chain):
+    """Return an error message if the snapshot's blocks aren't linked up."""
+    for index, block in enumerate(chain.iter_blocks()):
+        if block.index != index:
+            return 'block {} has index {}'.format(index, block.index)
+        if index and block.previous_hash != chain.block(index - 1).hash:
+            return 'block {} does not link to its parent'.format(index)
+    return None
+
+
+def main():
+    parser = ArgumentParser(description='Stress the blockchain with concurrent '
+                                        'readers and writers.')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=20,
+                        help='transactions added per write')
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp())
+
+    from wallet import Wallet
+    from blockChain import Blockchain
+    from transaction import Transaction
+
+    wallet = Wallet(1)
+    wallet.create_keys()
+    recipients = []
+    for node_id in range(2, 5):
+        recipient = Wallet(node_id)
+        recipient.create_keys()
+        recipients.append(recipient.public_key)
+    blockchain = Blockchain(wallet.public_key, 1)
+    for _ in range(3):
+        blockchain.mine_block()
+    # The time isn't signed, so one signature per recipient serves every
+    # transaction (they differ by their time)
+    signatures = [wallet.sign_transaction(wallet.public_key, recipient, 0.01)
+                  for recipient in recipients]
+
+    stop = threading.Event()
+    errors = []
+    read_latencies = []
+    counts = {'blocks': 0, 'transactions': 0, 'reads': 0}
+
+    def run(worker):
+        try:
+            while not stop.is_set():
+                worker()
+        except Exception:
+            errors.append(traceback.format_exc())
+            stop.set()
+
+    def mine():
+        if blockchain.mine_block() is not None:
+            counts['blocks'] += 1
+
+    def add_transactions():
+        transactions = [Transaction(wallet.public_key, recipients[i % len(recipients)],
+                                    signatures[i % len(recipients)], 0.01, time())
+                        for i in range(args.batch)]
+        _, added = blockchain.add_transactions(transactions)
+        counts['transactions'] += len(added)
+
+    def read():
+        start = perf_counter()
+        if blockchain.get_balance() < 0:
+            raise AssertionError('negative balance')
+        for recipient in recipients:
+            blockchain.get_balance(recipient)
+        blockchain.get_open_transactions()
+        error = check_snapshot(blockchain.chain)
+        read_latencies.append(perf_counter() - start)
+        counts['reads'] += 1
+        if error is not None:
+            raise AssertionError(error)
+
+    threads = [threading.Thread(target=run, args=(mine,)),
+               threading.Thread(target=run, args=(add_transactions,))]
+    threads.extend(threading.Thread(target=run, args=(read,))
+                   for _ in range(args.readers))
+    for thread in threads:
+        thread.start()
+    stop.wait(args.seconds)
+    stop.set()
+    blockchain.miner.cancel()
+    for thread in threads:
+        thread.join()
+
+    for error in errors:
+        print(error)
+    consistent = blockchain.check_ledger()
+    read_latencies.sort()
+    print('blocks mined:       {}'.format(counts['blocks']))
+    print('transactions added: {}'.format(counts['transactions']))
+    print('reads:              {}'.format(counts['reads']))
+    if read_latencies:
+        print('read latency:       p50 {:.4f}s  p99 {:.4f}s  max {:.4f}s'.format(
+            read_latencies[len(read_latencies) // 2],
+            read_latencies[int(len(read_latencies) * 0.99)],
+            read_latencies[-1]))
+    print('ledger consistent:  {}'.format(consistent))
+    if errors or not consistent:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
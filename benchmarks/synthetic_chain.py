@@ -0,0 +1,55 @@
+"""Builds synthetic chains for the benchmarks.
+
+The blocks are linked and hashed like real ones and have transactions of
+real size (keys and signatures are random hex of the length RSA 1024 gives),
+but their proofs and signatures aren't valid. The timestamps are
+TARGET_BLOCK_TIME apart and end in the past, so the difficulty stays at
+INITIAL_DIFFICULTY and a block mined now has a valid timestamp on top.
+"""
+
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utility.constants as constants
+from block import Block
+from transaction import Transaction
+from utility.hash_util import merkle_root
+
+# The hex length of an RSA 1024 public key (DER) and of a signature
+KEY_LENGTH = 324
+SIGNATURE_LENGTH = 256
+
+
+def random_hex(length):
+    return os.urandom(length // 2).hex()
+
+
+def build_chain(height, transactions_per_block=2, addresses=20):
+    """Return a chain of the given number of blocks (with the genesis block
+    every node starts with).
+
+    Arguments:
+        :height: The number of blocks.
+        :transactions_per_block: The number of transactions besides the
+        mining reward.
+        :addresses: The number of different senders and recipients.
+    """
+    keys = [random_hex(KEY_LENGTH) for _ in range(addresses)]
+    start = time() - height * constants.TARGET_BLOCK_TIME
+    chain = [Block(0, '', [], 100, 0)]
+    for index in range(1, height):
+        timestamp = start + index * constants.TARGET_BLOCK_TIME
+        transactions = [
+            Transaction(keys[(index + i) % addresses],
+                        keys[(index + i + 1) % addresses],
+                        random_hex(SIGNATURE_LENGTH), 1.5, timestamp - 1, 0.25)
+            for i in range(transactions_per_block)]
+        fees = sum(tx.fee for tx in transactions)
+        transactions.append(Transaction(constants.MINING, keys[index % addresses],
+                                        '', constants.MINING_REWARD + fees, timestamp))
+        chain.append(Block(index, chain[-1].hash, transactions, index, timestamp,
+                           merkle_root=merkle_root(transactions)))
+    return chain
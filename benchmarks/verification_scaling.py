@@ -0,0 +1,65 @@
+"""Measures the signature verification throughput of the BatchVerifier by
+the number of verifying processes (1 verifies in this process).
+
+Run it from the repository root:
+
+    python benchmarks/verification_scaling.py --processes 1 2 4 8
+"""
+
+import os
+import sys
+from argparse import ArgumentParser
+from time import perf_counter, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = ArgumentParser(description='Measure the signature verification '
+                                        'throughput by process count.')
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--senders', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    from wallet import Wallet
+    from transaction import Transaction
+    from utility.batch_verification import BatchVerifier
+
+    wallets = []
+    for node_id in range(args.senders):
+        wallet = Wallet(node_id)
+        wallet.create_keys()
+        wallets.append(wallet)
+    transactions = []
+    for i in range(args.transactions):
+        wallet = wallets[i % len(wallets)]
+        amount = 1 + i // len(wallets)
+        transactions.append(Transaction(
+            wallet.public_key, 'recipient',
+            wallet.sign_transaction(wallet.public_key, 'recipient', amount),
+            amount, time()))
+
+    print('cores: {}'.format(os.cpu_count()))
+    print('{:>9} {:>10} {:>9}'.format('processes', 'tx/s', 'speedup'))
+    baseline = None
+    for processes in args.processes:
+        verifier = BatchVerifier(processes=processes, min_batch=1)
+        # Starts the pool (and fills the key caches)
+        if not all(verifier.verify(transactions)):
+            raise AssertionError('a valid signature was rejected')
+        best = None
+        for _ in range(args.rounds):
+            start = perf_counter()
+            verifier.verify(transactions)
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        rate = len(transactions) / best
+        baseline = baseline or rate
+        print('{:>9} {:>10.0f} {:>8.2f}x'.format(processes, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,19 @@
 from time import time
 
 from utility.printable import Printable
+from utility.hash_util import hash_block, merkle_root
 from transaction import Transaction
+import utility.constants as constants
+
+NUMBER = (int, float)
+# The types of the fields of a received block and of its transactions (the
+# optional ones may be missing)
+BLOCK_FIELD_TYPES = {'index': int, 'previous_hash': str, 'timestamp': NUMBER,
+                     'proof': int, 'transactions': list}
+OPTIONAL_BLOCK_FIELD_TYPES = {'difficulty': int, 'merkle_root': str, 'hash': str}
+TRANSACTION_FIELD_TYPES = {'sender': str, 'recipient': str, 'signature': str,
+                           'amount': NUMBER, 'time': NUMBER}
+OPTIONAL_TRANSACTION_FIELD_TYPES = {'fee': NUMBER}
 
 
 class Block(Printable):
@@ -14,51 +26,125 @@ class Block(Printable):
         default).
         :transactions: A list of transaction which are included in the block.
         :proof: The proof of work number that yielded this block.
+        :difficulty: The difficulty the proof of work had to meet.
+        :merkle_root: The root of the Merkle tree over the ids of the
+        transactions (None for blocks from before Merkle roots, their hash
+        and proof of work cover the transactions directly).
+        :hash: The hash of the block (computed once, blocks don't change
+        after they were created).
     """
 
-    def __init__(self, index, previous_hash, transactions, proof, time=time()):
+    __slots__ = ('index', 'previous_hash', 'timestamp', 'transactions', 'proof',
+                 'difficulty', 'merkle_root', 'hash')
+
+    def __init__(self, index, previous_hash, transactions, proof, time=time(),
+                 difficulty=constants.INITIAL_DIFFICULTY, block_hash=None,
+                 merkle_root=None):
         self.index = index
         self.previous_hash = previous_hash
         self.timestamp = time
         self.transactions = transactions
         self.proof = proof
+        self.difficulty = difficulty
+        self.merkle_root = merkle_root
+        self.hash = block_hash if block_hash is not None else hash_block(self)
 
+    def header(self):
+        """Return the fields of this block besides its transactions and hash
+        as a dictionary."""
+        header = {'index': self.index,
+                  'previous_hash': self.previous_hash,
+                  'timestamp': self.timestamp,
+                  'proof': self.proof,
+                  'difficulty': self.difficulty}
+        if self.merkle_root is not None:
+            header['merkle_root'] = self.merkle_root
+        return header
 
-
+    def to_dict(self):
+        """Converts this block (and its transactions) into a dictionary, e.g.
+        to send it as JSON."""
+        block = self.header()
+        block['transactions'] = [tx.to_dict() for tx in self.transactions]
+        block['hash'] = self.hash
+        return block
 
     @staticmethod
-    def convert_from_json(jsonBlock):
+    def convert_from_json(jsonBlock, trusted=False):
+        """Create a block from its dictionary. The stored hash (and Merkle
+        root) is only reused for trusted blocks (the ones we stored
+        ourselves), it's recomputed for blocks received from peers.
+
+        Raises ValueError if a field is missing or has the wrong type (a
+        block which can't be stored or hashed must never reach the chain)."""
+        check_block_fields(jsonBlock)
+        if jsonBlock['index'] < 0 or jsonBlock.get('difficulty', 1) < 1:
+            raise ValueError('invalid index or difficulty')
+        for tx in jsonBlock['transactions']:
+            check_transaction_fields(tx)
+        transactions = [Transaction.to_transaction_from_dict(tx)
+                        for tx in jsonBlock['transactions']]
+        root = jsonBlock.get('merkle_root')
+        if root is not None and not trusted:
+            root = merkle_root(transactions)
         block = Block(jsonBlock['index'],
         jsonBlock['previous_hash'],
-        [Transaction.to_transaction_from_dict(tx) for tx in jsonBlock['transactions']],
+        transactions,
         jsonBlock['proof'],
-        jsonBlock['timestamp'])
+        jsonBlock['timestamp'],
+        jsonBlock.get('difficulty', constants.INITIAL_DIFFICULTY),
+        jsonBlock.get('hash') if trusted else None,
+        root)
         return block
 
 
     @staticmethod
     def Contains_Block(chain, block):
-        index = block['index']
+        """Check whether the chain already holds the block at its index."""
+        index = block.index
         if len(chain) <= index:
             return False
-        elementBlock = chain[index]
-        if (elementBlock.index == index and
-           elementBlock.previous_hash == block['previous_hash'] and
-           elementBlock.timestamp == block['timestamp'] and
-           elementBlock.proof == bock['proof'] and
-           Transaction.compare_transactions(elementBlock.transactions, block['transactions'])):
-                return True
-        return False
+        return chain[index].hash == block.hash
 
 
     @staticmethod
     def sameBlock(block1, block2):
-        if (block1.index != block2.index or
-        block1.previous_hash != block2.previous_hash or
-        block1.timestamp != block2.timestamp or
-        block1.proof != block2.proof or
-        not Transaction.compare_transactions_list(block1.transactions, block2.transactions)):
-            return False
-        return True 
+        # The hash covers every field and transaction of a block
+        return block1.hash == block2.hash
+
+
+def check_block_fields(values):
+    """Raise ValueError unless values is a block dictionary whose header
+    fields have the right types (its transactions aren't checked)."""
+    _check_fields(values, BLOCK_FIELD_TYPES, OPTIONAL_BLOCK_FIELD_TYPES)
+
+
+def check_transaction_fields(values):
+    """Raise ValueError unless values is a transaction dictionary with all
+    fields of the right types (checked before a received transaction is
+    created, a transaction which can't be stored must never be admitted)."""
+    _check_fields(values, TRANSACTION_FIELD_TYPES, OPTIONAL_TRANSACTION_FIELD_TYPES)
+
+
+def valid_transaction_fields(values):
+    """Return True if values is a transaction dictionary with all fields of
+    the right types, False otherwise (see check_transaction_fields)."""
+    try:
+        check_transaction_fields(values)
+    except ValueError:
+        return False
+    return True
 
 
+def _check_fields(values, types, optional_types):
+    """Raise ValueError unless values is a dictionary with the given fields
+    (and optionally the optional ones) of the given types."""
+    if not isinstance(values, dict):
+        raise ValueError('not a dictionary')
+    for field, field_type in list(types.items()) + list(optional_types.items()):
+        if field not in values and field in optional_types:
+            continue
+        value = values.get(field)
+        # bool is a subclass of int, but never a valid number here
+        if isinstance(value, bool) or not isinstance(value, field_type):
+            raise ValueError('invalid field {}'.format(field))
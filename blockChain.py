@@ -1,25 +1,43 @@
-from functools import reduce
 import hashlib as hl
 
 import json
+import os
 import pickle
-import requests
+import threading
+from itertools import islice
 
 # Import two functions from our hash_util.py file. Omit the ".py" in the import
-from utility.hash_util import hash_block
 from utility.verification import Verification
-from utility.broadcast import broadcast_transaction
+from utility.ledger import Ledger
+from utility.chain_view import ChainSnapshot, BranchView
+from utility.block_tree import BlockTree
+from utility.checkpoint import Checkpoint
+from utility.tx_index import TxIndex
+from utility.rw_lock import ReadWriteLock
+try:
+    from utility.analytics import ChainColumns
+except ImportError:
+    # NumPy is optional, only the analytics need it
+    ChainColumns = None
+from utility.mempool import Mempool
+from utility.block_template import BlockTemplate
+from utility.block_store import BlockStore
+from utility.miner import Miner
+from utility.mining_service import MiningService
+from utility.ingestion import TransactionIngestor
+from utility.difficulty import next_difficulty, block_interval
+from utility.hash_util import hash_transaction, merkle_proof
 from utility.broadcast import broadcast_block
+from utility.broadcast import forward_block
 from utility.broadcast import broadcast_chain
 from utility.broadcast import broadcast_open_transactions
-from utility.broadcast import broadcast_chain_all_nodes
-from block import Block
+from utility.broadcast import sync_chain
+from utility.broadcast import gossip
+from block import Block, valid_transaction_fields
 from transaction import Transaction
-from wallet import Wallet
 
 import utility.constants as constants
 from time import time
-from copy import deepcopy
 from flask import jsonify
 
 # The reward we give to miners (for creating a new block)
@@ -33,109 +51,318 @@ class Blockchain:
     transactions and the node on which it's running.
 
     Attributes:
-        :chain: The list of blocks
-        :open_transactions (private): The list of open transactions
+        :chain: A read-only snapshot of the list of blocks
+        :open_transactions (private): The pool of open transactions
         :hosting_node: The connected node (which runs the blockchain).
+        :ledger (private): The balance index of the chain and open
+        transactions.
+        :store (private): The append-only store the node persists to.
+        :tree (private): The index of all known blocks (including side
+        branches and orphans) by hash.
+        :base (private): The checkpoint the chain was loaded from (None if
+        every block was loaded with its transactions). The blocks it covers
+        are held as headers only.
+        :checkpoint (private): The latest checkpoint.
+        :tx_index (private): The index of the transactions of the chain by
+        id and address (stored next to the blocks).
+        :analytics (private): The chain as NumPy columns for the analytics
+        (built when they're first asked for, None until then).
+        :fast_sync: Whether a new node starts from a peer's checkpoint
+        instead of fetching (and verifying) the whole chain.
+        :lock (private): Guards the chain, open transactions and peer nodes.
+        Readers share it, changes take it alone (but never while mining or
+        talking to peers).
+        :mining_lock (private): Lets only one thread mine at a time.
+        :last_orphan_sync (private): When an orphan block last started a sync
+        with the peers.
+        :mining_service: Mines blocks in the background.
+        :ingestor: Validates received transactions in batches.
+        :miner: The proof of work miner (shared by all instances, so there is
+        only one pool of mining processes).
     """
 
-    def __init__(self, public_key, node_id):
+    miner = Miner()
+
+    def __init__(self, public_key, node_id, fast_sync=False):
         """The constructor of the Blockchain class."""
+        self.__ledger = Ledger()
+        self.__tree = BlockTree()
+        self.__checkpoint = None
+        self.__analytics = None
+        self.__analytics_lock = threading.Lock()
         # Our starting block for the blockchain
         genesis_block = Block(0, '', [], 100, 0)
         # Initializing our (empty) blockchain list
         self.chain = [genesis_block]
         # Unhandled transactions
-        self.__open_transactions = []
+        self.__open_transactions = Mempool()
+        # The transactions selected for the next block (rebuilt when the tip
+        # or the open transactions change)
+        self.__template = None
         self.public_key = public_key
         self.__peer_nodes = set()
         self.node_id = node_id
+        self.fast_sync = fast_sync
         self.resolve_conflicts = False
+        self.__lock = ReadWriteLock()
+        self.__mining_lock = threading.Lock()
+        self.__last_orphan_sync = 0
+        self.__orphan_sync_lock = threading.Lock()
+        self.mining_service = MiningService(self)
+        self.ingestor = TransactionIngestor(self)
+        self.__store = BlockStore(node_id)
+        self.__tx_index = TxIndex(os.path.join(self.__store.directory,
+                                               'tx-index.log'))
         self.load_data()
+        self.__update_index()
 
     # This turns the chain attribute into a property with a getter (the method
-    # below) and a setter (@chain.setter)
+    # below) and a setter (@chain.setter). The getter doesn't copy the chain,
+    # blocks are only appended to the list in place (replacing blocks
+    # replaces the list), so the snapshot never changes.
     @property
     def chain(self):
-        return self.__chain[:]
+        return ChainSnapshot(self.__chain)
 
     # The setter for the chain property
     @chain.setter
     def chain(self, val):
         self.__chain = val
+        self.__base = None
+        self.__analytics = None
+        self.__ledger.rebuild(val)
+        self.__tree.reset(val)
+
+    def __start_from(self, checkpoint, blocks):
+        """Use a chain whose leading blocks are covered by a checkpoint (and
+        held without their transactions): the balances are taken from the
+        checkpoint, only the later blocks are booked."""
+        self.__chain = blocks
+        self.__base = checkpoint
+        self.__checkpoint = checkpoint
+        self.__analytics = None
+        self.__ledger.restore(checkpoint.balances, blocks[checkpoint.height:])
+        self.__tree.reset(blocks)
+
+    def __full_from(self):
+        # The blocks below the checkpoint we started from are headers only
+        return self.__base.height if self.__base else 0
+
+    def __pruned(self):
+        # The blocks below this index aren't stored with their transactions
+        # either (the node was bootstrapped from a peer's checkpoint)
+        return self.__base.pruned if self.__base else 0
 
     def get_open_transactions(self):
         """Returns a copy of the open transactions list."""
-        return self.__open_transactions[:]
+        with self.__lock.read():
+            return self.__open_transactions.transactions()
 
     def load_data(self):
-        """Initialize blockchain + open transactions data from a file."""
+        """Initialize blockchain + open transactions data from the block
+        store.
+
+        Raises IOError if the chain doesn't match the store afterwards (e.g.
+        the store couldn't be read), new blocks would be stored at the wrong
+        index then.
+        """
         try:
-            with open('blockchain-{}.txt'.format(self.node_id), mode='r') as f:
-                file_content = f.readlines()
-                #convert from json to list
-                blockchain = json.loads(file_content[0][:-1])
-                # We need to convert  the loaded data because Transactions
-                # should use OrderedDict
-                updated_blockchain = []
-                for block in blockchain:
-                    converted_tx = [Transaction.to_transaction_from_dict(tx) for tx in block['transactions']]
-                    updated_block = Block(
-                        block['index'],
-                        block['previous_hash'],
-                        converted_tx,
-                        block['proof'],
-                        block['timestamp'])
-                    updated_blockchain.append(updated_block)
-                self.chain = updated_blockchain
-                open_transactions = json.loads(file_content[1][:-1])
-                # We need to convert  the loaded data because Transactions
-                # should use OrderedDict
-                updated_transactions = []
-                for tx in open_transactions:
-                    updated_transaction = Transaction.to_transaction_from_dict(tx)
-                    updated_transactions.append(updated_transaction)
-                self.__open_transactions = updated_transactions
-                peer_nodes = json.loads(file_content[2])
-                self.__peer_nodes = set(peer_nodes)
-        except (IOError, IndexError):
-            if len(self.chain) > 1:
-                print('error accured while loading data!')
+            if self.__store.height == 0:
+                self.load_legacy_data()
+            else:
+                self.__load_chain(Checkpoint.from_dict(
+                    self.__store.load_checkpoint()))
+                self.__open_transactions.replace(self.convert_open_tx_from_json(
+                    self.__store.load_open_transactions()))
+                self.__ledger.reset_pending(self.__open_transactions)
+                self.__peer_nodes = set(self.__store.load_peer_nodes())
+        except (IOError, ValueError):
+            print('error accured while loading data!')
         finally:
             print('loading data completed!')
+        if len(self.__chain) != self.__store.height:
+            raise IOError('the block store holds {} blocks, {} were loaded'.format(
+                self.__store.height, len(self.__chain)))
+
+    def __load_chain(self, checkpoint):
+        """Load the chain from the block store. Only the headers of the
+        blocks a (valid) checkpoint covers are read.
 
-    def save_data(self):
-        """Save blockchain + open transactions snapshot to a file."""
+        The store is truncated after the last block which loads and links to
+        the blocks before it (e.g. a record a faulty version stored), so the
+        chain and the store always hold the same blocks.
+        """
+        if checkpoint is not None and checkpoint.height <= self.__store.height:
+            blocks = self.__read_chain(
+                [], islice(self.__store.read_blocks(headers_only=True),
+                           checkpoint.height))
+            if checkpoint.matches(blocks):
+                self.__read_chain(blocks, self.__store.read_blocks(checkpoint.height))
+                self.__drop_stored_from(len(blocks))
+                self.__start_from(checkpoint, blocks)
+                return
+        blocks = self.__read_chain([], self.__store.read_blocks())
+        self.__drop_stored_from(len(blocks))
+        if blocks:
+            self.chain = blocks
+        else:
+            # Not even the genesis block loads, start over from it
+            self.save_chain()
+
+    @staticmethod
+    def __read_chain(blocks, records):
+        """Append stored blocks to a list of blocks until one can't be
+        loaded or doesn't link to the one before it. Returns the list."""
         try:
-            with open('blockchain-{}.txt'.format(self.node_id), mode='w') as f:
-                saveable_chain = [
-                    block.__dict__ for block in
-                    [
-                        Block(block_el.index,
-                              block_el.previous_hash,
-                              [tx.__dict__ for tx in block_el.transactions],
-                              block_el.proof,
-                              block_el.timestamp) for block_el in self.__chain
-                    ]
-                ]
-                f.write(json.dumps(saveable_chain))
-                f.write('\n')
-                saveable_tx = [tx.__dict__ for tx in self.__open_transactions]
-                f.write(json.dumps(saveable_tx))
-                f.write('\n')
-                f.write(json.dumps(list(self.__peer_nodes)))
+            for record in records:
+                block = Block.convert_from_json(record, trusted=True)
+                if (block.index != len(blocks) or
+                        (blocks and block.previous_hash != blocks[-1].hash)):
+                    break
+                blocks.append(block)
+        except ValueError:
+            pass
+        return blocks
+
+    def __drop_stored_from(self, height):
+        """Truncate the block store to the blocks which were loaded."""
+        if height < self.__store.height:
+            print('The block store is corrupt from block {}, dropping the '
+                  'blocks after it!'.format(height))
+            self.__store.truncate(height)
+
+    def load_legacy_data(self):
+        """Import the chain from the old single-file format (or store the
+        genesis block for a new node) into the block store."""
+        try:
+            with open('blockchain-{}.txt'.format(self.node_id), mode='r') as f:
+                file_content = f.readlines()
+                self.chain = self.convert_chain_from_json(
+                    json.loads(file_content[0][:-1]))
+                self.__open_transactions.replace(self.convert_open_tx_from_json(
+                    json.loads(file_content[1][:-1])))
+                self.__ledger.reset_pending(self.__open_transactions)
+                self.__peer_nodes = set(json.loads(file_content[2]))
+        except (IOError, IndexError, ValueError):
+            pass
+        self.save_chain()
+        self.save_open_transactions()
+        self.save_peer_nodes()
+
+    def save_chain(self):
+        """Append the blocks which aren't stored yet to the block store."""
+        try:
+            for block in self.__chain[self.__store.height:]:
+                self.__store.append_block(self.prepare_chain_to_json([block])[0])
         except IOError:
             print('Saving failed!')
+        self.__update_checkpoint()
+        self.__update_index()
+        if self.__analytics is not None:
+            self.__follow_chain(self.__analytics)
+
+    def __update_index(self):
+        """Bring the transaction index in line with the chain."""
+        self.__follow_chain(self.__tx_index)
 
-    def proof_of_work(self):
-        """Generate a proof of work for the open transactions, the hash of the
-        previous block and a random number (which is guessed until it fits)."""
-        last_block = self.__chain[-1]
-        last_hash = hash_block(last_block)
-        proof = 0
-        # Try different PoW numbers and return the first valid one
-        while not Verification.valid_proof(self.__open_transactions, last_hash, proof):
-            proof += 1
-        return proof
+    def __follow_chain(self, follower):
+        """Bring a follower of the chain (the transaction index or the
+        analytics columns) in line with it: drop the blocks a reorganisation
+        replaced and add the new ones."""
+        height = min(follower.height, len(self.__chain))
+        while height and follower.block_hash(height - 1) != self.__chain[height - 1].hash:
+            height -= 1
+        follower.truncate(height)
+        # The blocks held as headers only are read from the block store
+        full_from = self.__full_from()
+        if height < full_from:
+            for block in islice(self.__store.read_blocks(height), full_from - height):
+                follower.add(Block.convert_from_json(block, trusted=True))
+            height = full_from
+        for block in self.__chain[height:]:
+            follower.add(block)
+
+    def save_checkpoint(self):
+        """Save the latest checkpoint to the block store."""
+        if self.__checkpoint is None:
+            return
+        try:
+            self.__store.save_checkpoint(self.__checkpoint.to_dict())
+        except IOError:
+            print('Saving failed!')
+
+    def __update_checkpoint(self):
+        """Write a new checkpoint every CHECKPOINT_INTERVAL blocks. It's
+        MAX_BRANCH_DEPTH blocks below the tip, so no reorganisation drops
+        its blocks."""
+        interval = constants.CHECKPOINT_INTERVAL
+        height = (len(self.__chain) - constants.MAX_BRANCH_DEPTH) // interval * interval
+        if self.__checkpoint is not None and height <= self.__checkpoint.height:
+            return
+        # The balances are found by rolling back the blocks after the
+        # height, which needs their transactions
+        if 0 < height and self.__full_from() <= height:
+            self.__checkpoint = Checkpoint(
+                height, self.__chain[height - 1].hash,
+                self.__ledger.snapshot(self.__chain[height:]), self.__pruned())
+        else:
+            # A reorganisation dropped the last checkpoint, the one we
+            # started from still holds
+            self.__checkpoint = self.__base
+        self.save_checkpoint()
+
+    def save_open_transactions(self):
+        """Save the open transactions snapshot to the block store."""
+        try:
+            self.__store.save_open_transactions(
+                self.prepare_transactions_List_to_json(self.__open_transactions))
+        except IOError:
+            print('Saving failed!')
+
+    def save_peer_nodes(self):
+        """Save the peer nodes to the block store."""
+        try:
+            self.__store.save_peer_nodes(list(self.__peer_nodes))
+        except IOError:
+            print('Saving failed!')
+
+    def proof_of_work(self, transactions=None):
+        """Generate a proof of work for the open transactions (or the given
+        ones), the hash of the previous block and a random number (which is
+        guessed until it fits)."""
+        with self.__lock.read():
+            if transactions is None:
+                transactions = self.__open_transactions.transactions()
+            last_hash = self.__chain[-1].hash
+            difficulty = self.get_difficulty()
+        # Try different PoW numbers and return the first valid one (None if
+        # mining was cancelled because of a competing block)
+        return self.miner.mine(transactions, last_hash, difficulty)
+
+    def get_block_template(self):
+        """Return the transactions selected for the next block. Their
+        signatures were checked when they were admitted, so the lock is only
+        held for the selection."""
+        with self.__lock.write():
+            last_hash = self.__chain[-1].hash
+            if (self.__template is None or
+                    not self.__template.is_current(last_hash, self.__open_transactions)):
+                self.__template = BlockTemplate.assemble(
+                    self.__open_transactions,
+                    self.__ledger.get_confirmed_balance,
+                    last_hash,
+                    self.get_difficulty(),
+                    self.public_key)
+            return self.__template
+
+    def get_difficulty(self):
+        """Return the difficulty the next block has to meet."""
+        return next_difficulty(self.chain)
+
+    def get_block_interval(self):
+        """Return the average time between the last blocks (None if there
+        are not enough blocks yet)."""
+        return block_interval(self.chain)
 
     def get_balance(self, sender=None):
         """Calculate and return the balance for a participant.
@@ -146,43 +373,18 @@ class Blockchain:
             participant = self.public_key
         else:
             participant = sender
-        # Fetch a list of all sent coin amounts for the given person (empty
-        # lists are returned if the person was NOT the sender)
-        # This fetches sent amounts of transactions that were already included
-        # in blocks of the blockchain
-        tx_sender = [[tx.amount for tx in block.transactions
-                      if tx.sender == participant] for block in self.__chain]
-        # Fetch a list of all sent coin amounts for the given person (empty
-        # lists are returned if the person was NOT the sender)
-        # This fetches sent amounts of open transactions (to avoid double
-        # spending)
-        open_tx_sender = [
-            tx.amount for tx in self.__open_transactions
-            if tx.sender == participant
-        ]
-        tx_sender.append(open_tx_sender)
-        amount_sent = self.get_sum_of_sums_list(input_list = tx_sender)
-        # This fetches received coin amounts of transactions that were already
-        # included in blocks of the blockchain
-        # We ignore open transactions here because you shouldn't be able to
-        # spend coins before the transaction was confirmed + included in a
-        # block
-        tx_recipient = [
-            [
-                tx.amount for tx in block.transactions
-                if tx.recipient == participant
-            ] for block in self.__chain
-        ]
-        amount_received = self.get_sum_of_sums_list(input_list = tx_recipient)
-        # Return the total balance
-        return amount_received - amount_sent
-
-
-    def get_sum_of_sums_list(self, input_list, initial_value=0):
-        '''returns the sum of all the sums in an input list of lists'''
-        return reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                                if len(tx_amt) > 0 else tx_sum + 0, #if inner list is empty add 0 and continue
-                                input_list, initial_value)
+        # The ledger books every block once when it's appended and reserves
+        # the amounts of open transactions (to avoid double spending)
+        with self.__lock.read():
+            return self.__ledger.get_balance(participant)
+
+    def check_ledger(self):
+        """Rebuild the balance index from scratch and return True if it
+        matches the incrementally maintained one, False otherwise."""
+        with self.__lock.read():
+            return self.__ledger.is_consistent(self.__chain,
+                                               self.__open_transactions,
+                                               self.__base)
 
     def get_last_blockchain_value(self):
         """ Returns the last value of the current blockchain. """
@@ -193,17 +395,49 @@ class Blockchain:
 
 
 
-    def add_transaction(self, recipient, sender, signature, amount, timeStamp):
-        """ Append a new value as well as the last blockchain value to the blockchain."""
-        
-        transaction = Transaction(sender, recipient, signature, amount, timeStamp)
-        if not Verification.verify_transaction(transaction, self.get_balance):
-            return False
-        if not Transaction.contains_transaction(self.__open_transactions, transaction):
-            self.__open_transactions.append(transaction)
-            self.save_data()
-            return broadcast_transaction(self.__peer_nodes, deepcopy(transaction))
-        return True
+    def add_transactions(self, transactions):
+        """Validate a batch of transactions and add the valid ones to the
+        open transactions (without sending them to the peers).
+
+        The signatures are checked in parallel before the chain is locked,
+        the funds in the order of the batch (so a sender can't overspend
+        within the batch either). The open transactions are saved once.
+
+        Returns a list with the result of each transaction (True if it's
+        open now, also if it was already) and the list of the transactions
+        which were added.
+
+        Arguments:
+            :transactions: The transactions that should be added.
+        """
+        # Known transactions don't need their signature checked again
+        fresh = [tx for tx in transactions
+                 if Verification.valid_fields(tx) and
+                 Verification.valid_amounts(tx) and
+                 tx not in self.__open_transactions]
+        signatures = dict(zip(map(id, fresh),
+                              Verification.batch_verifier.verify(fresh)))
+        results = []
+        added = []
+        with self.__lock.write():
+            for transaction in transactions:
+                if transaction in self.__open_transactions:
+                    results.append(True)
+                    continue
+                if (not signatures.get(id(transaction)) or
+                        self.__ledger.get_balance(transaction.sender) <
+                        transaction.amount + transaction.fee):
+                    results.append(False)
+                    continue
+                evicted = self.__open_transactions.add(transaction)
+                self.__ledger.add_pending(transaction)
+                for tx in evicted:
+                    self.__ledger.remove_pending(tx)
+                results.append(True)
+                added.append(transaction)
+            if added:
+                self.save_open_transactions()
+        return results, added
 
 
 
@@ -212,127 +446,552 @@ class Blockchain:
         # Fetch the currently last block of the blockchain
         if self.public_key is None:
             return None
-        last_block = self.__chain[-1]
-        # Hash the last block (=> to be able to compare it to the stored hash
-        # value)
-        hashed_block = hash_block(last_block)
-        proof = self.proof_of_work()
-
-        reward_transaction = Transaction(
-            constants.MINING, self.public_key, '', constants.MINING_REWARD, time())
-        # Copy transaction instead of manipulating the original
-        # open_transactions list
-        # This ensures that if for some reason the mining should fail,
-        # we don't have the reward transaction stored in the open transactions
-        copied_transactions = self.__open_transactions[:]
-        for tx in copied_transactions:
-            if not Wallet.verify_transaction(tx):
+        with self.__mining_lock:
+            block = self.__mine_block()
+        if block is None:
+            return None
+        return broadcast_block(self.get_peer_nodes(), block)
+
+    def __mine_block(self):
+        """Mine a block on top of the current tip and append it. The chain
+        isn't locked while mining, so reads (and received blocks) don't wait
+        for the proof of work."""
+        # The template holds a copy of the selected transactions, so
+        # transactions arriving while mining don't change the proof
+        template = self.get_block_template()
+        proof = self.miner.mine_prefix(template.prefix, template.difficulty)
+        if proof is None:
+            return None
+        with self.__lock.write():
+            # The chain may have moved on while mining
+            last_block = self.__chain[-1]
+            if last_block.hash != template.previous_hash:
                 return None
-        copied_transactions.append(reward_transaction)
-        block = Block(len(self.__chain), hashed_block, copied_transactions, proof)
-        self.__chain.append(block)
-        self.__open_transactions = []
-        self.save_data()
-        block, self.resolve_conflicts = broadcast_block(self.__peer_nodes, block)
-        if self.resolve_conflicts:
-            self.resolve()
+            block_transactions = template.transactions + [template.reward]
+            block = Block(len(self.__chain), last_block.hash, block_transactions,
+                          proof, time(), template.difficulty,
+                          merkle_root=template.merkle_root)
+            self.__chain.append(block)
+            self.__tree.extend(block)
+            self.__ledger.apply_block(block)
+            for tx in self.__open_transactions.remove_transactions(template.transactions):
+                self.__ledger.remove_pending(tx)
+            self.save_chain()
+            self.save_open_transactions()
         return block
 
-    def add_block(self, block):
-        """Add a block which was received via broadcasting."""
-        #if already has it
-        if Block.Contains_Block(self.chain, block):
-            return True
-        
-        # Create a list of transaction objects
-        transactions = [Transaction(
-            tx['sender'],
-            tx['recipient'],
-            tx['signature'],
-            tx['amount'],
-            tx['time']) for tx in block['transactions']]
+    def add_block(self, block, source=None):
+        """Add a block which was received via broadcasting. Returns
+        BLOCK_ADDED if the block is part of our chain afterwards, BLOCK_KNOWN
+        if we held it already, BLOCK_KEPT if it was kept as a side block or
+        orphan and False if it's invalid.
+
+        A block extending our tip is appended. A block extending another
+        known block is kept in the block tree as a side branch, which
+        replaces our blocks from the fork point on once it has more work. A
+        block whose parent is unknown is kept as an orphan until the parent
+        arrives (and the missing blocks are fetched from the peers).
+
+        Arguments:
+            :block: The block as a dictionary.
+            :source: The peer the block came from (it isn't sent back).
+        """
+        # Create a Block object (its hash is computed from the received
+        # content)
+        try:
+            converted_block = Block.convert_from_json(block)
+        except ValueError:
+            return False
+        #if already has it (checked again once the chain is locked)
+        if converted_block.hash in self.__tree:
+            gossip.learned(source, converted_block.hash)
+            return constants.BLOCK_KNOWN
+        transactions = converted_block.transactions
         # Validate the proof of work of the block and store the result (True
         # or False) in a variable
-        proof_is_valid = Verification.valid_proof(transactions[:-1], #the last tx is the mining so it's ignored
-                                                 block['previous_hash'], 
-                                                 block['proof'])
-        # Check if previous_hash stored in the block is equal to the local
-        # blockchain's last block's hash and store the result in a block
-        hashes_match = hash_block(self.chain[-1]) == block['previous_hash']
-        if not proof_is_valid or not hashes_match:
+        proof_is_valid = Verification.valid_block_proof(converted_block)
+        if not proof_is_valid:
             return False
-        # Create a Block object
-        converted_block = Block(
-            block['index'],
-            block['previous_hash'],
-            transactions,
-            block['proof'],
-            block['timestamp'])
-        self.__chain.append(converted_block)
-        stored_transactions = self.__open_transactions[:]
-        # Check which open transactions were included in the received block
-        # and remove them
-
-        for itx in block['transactions']:
-            for opentx in stored_transactions:
-                if (opentx.sender == itx['sender'] and
-                        opentx.recipient == itx['recipient'] and
-                        opentx.amount == itx['amount'] and
-                        opentx.signature == itx['signature'] and
-                        opentx.time == itx['time']):
-                    try:
-                        self.__open_transactions.remove(opentx)
-                    except ValueError:
-                        print('Item was already removed')
-        self.save_data()
+        if not (all(map(Verification.valid_amounts, transactions[:-1])) and
+                Verification.verify_signatures(transactions[:-1])):
+            return False
+        with self.__lock.write():
+            if converted_block.hash in self.__tree:
+                return constants.BLOCK_KNOWN
+            if self.__tree.work(converted_block.previous_hash) is None:
+                # The branch of an orphan is unknown, it has to meet at least
+                # the difficulty of our chain
+                if converted_block.difficulty < self.get_difficulty():
+                    return False
+                self.__tree.add_orphan(converted_block)
+                orphan = True
+            elif self.__chain[-1].hash == converted_block.previous_hash:
+                orphan = False
+                if not self.__append_block(converted_block):
+                    return False
+            else:
+                orphan = False
+                # A side block has to meet the difficulty of its own branch,
+                # or blocks claiming a trivial one would fill the tree
+                branch = self.__branch_view(converted_block.previous_hash)
+                if (branch is None or converted_block.index != len(branch) or
+                        converted_block.difficulty != next_difficulty(branch)):
+                    return False
+                self.__choose_tip(self.__tree.connect(converted_block))
+            added = Block.Contains_Block(self.__chain, converted_block)
+        if orphan:
+            # Fetch the blocks we miss from the peers
+            if self.__orphan_sync_due():
+                self.resolve()
+            if Block.Contains_Block(self.chain, converted_block):
+                return constants.BLOCK_ADDED
+            return constants.BLOCK_KEPT
+        if not added:
+            return constants.BLOCK_KEPT
         #broadcast the new block to other peer nodes
+        forward_block(self.get_peer_nodes(), block, converted_block.hash, source)
+        return constants.BLOCK_ADDED
 
-        for node in self.__peer_nodes:
-            url = 'http://{}/broadcast-block'.format(node)
-            farward_block = deepcopy(block)
-            try:
-                response = requests.post(url, json={'block': farward_block})
-                if response.status_code == 400 or response.status_code == 500:
-                    print('Block declined, needs resolving')
-                if response.status_code == 409:
-                    self.resolve_conflicts = True
-                    self.resolve()
-                    self.resolve_conflicts = False
-            except requests.exceptions.ConnectionError:
-                continue
-
+    def __append_block(self, block):
+        """Append a block which extends our tip (and the orphans which
+        descend from it). Returns False if the block is invalid."""
+        # The block has to follow our last block, meet the difficulty our
+        # chain requires next and carry a plausible timestamp
+        if (block.index != len(self.__chain) or
+                block.difficulty != self.get_difficulty() or
+                not Verification.valid_timestamp(block, self.__chain)):
+            return False
+        # Mining on top of the previous block is pointless now
+        self.miner.cancel()
+        self.__chain.append(block)
+        self.__tree.extend(block)
+        self.__ledger.apply_block(block)
+        # Remove the open transactions which were included in the received
+        # block
+        for tx in self.__open_transactions.remove_transactions(block.transactions):
+            self.__ledger.remove_pending(tx)
+        self.save_chain()
+        self.save_open_transactions()
+        # Orphans waiting for this block may extend the chain further
+        children = self.__tree.connect_orphans(block)
+        if children:
+            self.__choose_tip(children)
         return True
 
+    def __orphan_sync_due(self):
+        """Return True if an orphan block may start a sync with the peers
+        (at most one every ORPHAN_SYNC_INTERVAL seconds)."""
+        with self.__orphan_sync_lock:
+            now = time()
+            if now - self.__last_orphan_sync < constants.ORPHAN_SYNC_INTERVAL:
+                return False
+            self.__last_orphan_sync = now
+            return True
 
+    def __branch_view(self, tip_hash):
+        """Return the branch of the block tree ending in a known block as a
+        view on top of our chain (None if the branch can't be followed back
+        to our chain). The write lock has to be held."""
+        branch = self.__tree.branch(tip_hash, self.__chain)
+        if branch is None:
+            return None
+        return BranchView(self.__chain, *branch)
+
+    def __choose_tip(self, candidates):
+        """Switch our chain to the branch ending in the candidate block with
+        the most work, if it has more work than our chain. Branches which
+        turn out to be invalid are dropped from the tree."""
+        best = max(candidates, key=lambda block: self.__tree.work(block.hash))
+        if self.__tree.work(best.hash) <= self.__tree.work(self.__chain[-1].hash):
+            return False
+        branch = self.__tree.branch(best.hash, self.__chain)
+        if branch is None:
+            return False
+        fork, blocks = branch
+        if not self.__reorganize(fork, blocks):
+            self.__tree.remove(blocks)
+            return False
+        return True
 
     def replace_chain(self, input_chain, input_open_tx):
-        if Blockchain.sameChains(input_chain, self.chain):
-            return True
+        # Open transactions are only admitted with a valid signature (the
+        # block template relies on it)
+        signatures = Verification.batch_verifier.verify(input_open_tx)
+        input_open_tx = [tx for tx, signature_is_valid in zip(input_open_tx, signatures)
+                         if signature_is_valid and Verification.valid_fields(tx) and
+                         Verification.valid_amounts(tx)]
+        with self.__lock.write():
+            if Blockchain.sameChains(input_chain, self.__chain):
+                return True
 
-        if len(input_chain) > len(self.chain):
-            self.chain = input_chain
-            self.__open_transactions = input_open_tx
-            self.save_data()
+            # Only the blocks after the fork point are verified and applied
+            fork = self.__common_length(input_chain)
+            if self.apply_blocks(input_chain[fork:]):
+                self.__open_transactions.replace(input_open_tx)
+                self.__ledger.reset_pending(self.__open_transactions)
+                self.save_open_transactions()
 
-        broadcast_chain_all_nodes(self.__peer_nodes, self.__chain, self.__open_transactions, Blockchain)
-        
+        self.resolve()
 
+    def get_height(self):
+        """Return the number of blocks of the chain."""
+        return len(self.__chain)
 
-    def resolve(self):
-        """Checks all peer nodes' blockchains and replaces the local one with
-        longer valid ones."""
-        # Initialize the winner chain with the local chain
-        # winner_chain,winner_open_transactions, replace  = broadcast_chain(self.__peer_nodes, self.__chain,self.__open_transactions)
-        # self.resolve_conflicts = False
-        # Replace the local chain with the winner chain
-        # self.chain = winner_chain
-        # if replace:
-            # self.__open_transactions = []
-            # self.__open_transactions = winner_open_transactions
-        # self.replace_chain(self.chain, self.__open_transactions)
-        return broadcast_chain_all_nodes(self.__peer_nodes,self.__chain,self.__open_transactions, Blockchain)
-        # return replace
+    def get_block(self, index):
+        """Return the block at the given index."""
+        if not 0 <= index < len(self.__chain):
+            raise IndexError('block index out of range')
+        return self.__chain[index]
+
+    def get_analytics(self, top=constants.ANALYTICS_TOP):
+        """Return the analytics of the chain (see ChainColumns.report), None
+        if NumPy isn't installed. The columns are built on the first call
+        and kept up to date as blocks are added afterwards.
+
+        Arguments:
+            :top: The number of addresses listed per ranking.
+        """
+        if ChainColumns is None:
+            return None
+        with self.__lock.read():
+            if self.__analytics is None:
+                # Readers share the lock, only one of them builds the columns
+                with self.__analytics_lock:
+                    if self.__analytics is None:
+                        # A node bootstrapped from a peer's checkpoint has no
+                        # transactions before it
+                        columns = ChainColumns(self.__base if self.__pruned() else None)
+                        self.__follow_chain(columns)
+                        self.__analytics = columns
+            return self.__analytics.report(top)
+
+    def get_tip(self):
+        """Return the height and last block hash of the chain, with a locator
+        to find the fork point with another chain."""
+        chain = self.chain
+        return {
+            'height': len(chain),
+            'hash': chain.tip.hash,
+            'work': self.__tree.work(chain.tip.hash),
+            'locator': Blockchain.__locator(chain)
+        }
+
+    def get_locator(self):
+        """Return a list of indices and hashes of our blocks, dense near the
+        tip and exponentially sparser towards the genesis block."""
+        return Blockchain.__locator(self.chain)
+
+    @staticmethod
+    def __locator(chain):
+        locator = []
+        step = 1
+        index = len(chain) - 1
+        while index > 0:
+            locator.append({'index': index, 'hash': chain[index].hash})
+            if len(locator) >= constants.LOCATOR_DENSE_BLOCKS:
+                step *= 2
+            index -= step
+        locator.append({'index': 0, 'hash': chain[0].hash})
+        return locator
+
+    def find_fork_point(self, locator):
+        """Return the index of the last block of a locator which our chain
+        has as well.
+
+        Arguments:
+            :locator: The locator of the other chain (tip first).
+        """
+        chain = self.chain
+        for entry in locator:
+            index = entry['index']
+            if index < len(chain) and chain[index].hash == entry['hash']:
+                return index
+        return 0
+
+    def get_blocks(self, start, end=None):
+        """Return the blocks from the start index up to (excluding) the end
+        index. The blocks held as headers only are read from the block store
+        (the ones a bootstrapped node never had are left out)."""
+        chain = self.chain
+        start, end, _ = slice(max(start, self.__pruned()), end).indices(len(chain))
+        stored = min(end, self.__full_from())
+        blocks = [Block.convert_from_json(block, trusted=True)
+                  for block in self.__read_stored(start, stored)]
+        return blocks + chain.blocks(max(start, stored), end)
+
+    def iter_block_dicts(self, chain, start=0, end=None):
+        """Yield the blocks of a chain snapshot from the start index up to
+        (excluding) the end index as dictionaries. The blocks held as headers
+        only are read from the block store, SYNC_BATCH blocks at a time.
+
+        Arguments:
+            :chain: The snapshot of the chain.
+            :start: The index of the first block.
+            :end: The index after the last block (by default the tip).
+        """
+        start, end, _ = slice(start, end).indices(len(chain))
+        stored = min(end, self.__full_from())
+        while start < stored:
+            batch = self.__read_stored(start, min(start + constants.SYNC_BATCH, stored))
+            if not batch:
+                break
+            yield from batch
+            start += len(batch)
+        for block in chain.iter_blocks(start, end):
+            yield block.to_dict()
+
+    def __read_stored(self, start, end):
+        """Return the stored blocks from the start index up to (excluding)
+        the end index as dictionaries."""
+        if start >= end:
+            return []
+        # The block store is only changed with the write lock held
+        with self.__lock.read():
+            return list(islice(self.__store.read_blocks(start), end - start))
+
+    def get_transaction(self, tx_id):
+        """Return the transaction with the given id as a dictionary, with the
+        index, hash and position of its block and its number of
+        confirmations (None if the chain and the open transactions don't
+        hold it).
+
+        Arguments:
+            :tx_id: The id of the transaction (see hash_transaction).
+        """
+        with self.__lock.read():
+            location = self.__tx_index.locate(tx_id)
+            if location is None:
+                tx = self.__open_transactions.get(tx_id)
+                if tx is None:
+                    return None
+                return {'tx_id': tx_id, 'transaction': tx.to_dict(),
+                        'block_index': None, 'confirmations': 0}
+            return self.__describe(tx_id, *location)
+
+    def get_address_history(self, address, limit=constants.HISTORY_PAGE_SIZE,
+                            cursor=None):
+        """Return the transactions of the chain an address sent or received,
+        newest first, and the cursor of the next page (None if there is
+        none).
+
+        Arguments:
+            :address: The address (public key).
+            :limit: The maximal number of transactions.
+            :cursor: The cursor returned with the previous page (raises
+            ValueError if it's malformed).
+        """
+        limit = max(1, min(limit, constants.HISTORY_MAX_PAGE_SIZE))
+        before = None
+        if cursor is not None:
+            before = tuple(int(part) for part in cursor.split(':'))
+            if len(before) != 2:
+                raise ValueError('malformed cursor')
+        with self.__lock.read():
+            # One more is fetched to find out whether there is a next page
+            refs = self.__tx_index.history(address, limit + 1, before)
+            page = [self.__describe(None, *ref) for ref in refs[:limit]]
+        next_cursor = None
+        if len(refs) > limit:
+            next_cursor = '{}:{}'.format(*refs[limit - 1])
+        return page, next_cursor
+
+    def __describe(self, tx_id, block_index, position):
+        """Return an indexed transaction as a dictionary (the read lock has
+        to be held)."""
+        block = self.__chain[block_index]
+        if block_index < self.__full_from():
+            # Held as header only
+            tx = Transaction.to_transaction_from_dict(
+                self.__store.read_block(block_index)['transactions'][position])
+        else:
+            tx = block.transactions[position]
+        return {'tx_id': tx_id or hash_transaction(tx),
+                'transaction': tx.to_dict(),
+                'block_index': block_index,
+                'block_hash': block.hash,
+                'position': position,
+                'confirmations': len(self.__chain) - block_index}
+
+    def get_merkle_proof(self, tx_id):
+        """Return the proof that a block of our chain holds a transaction:
+        the header of the block (its hash covers the Merkle root), the
+        block hash and the sibling hashes from the transaction id up to the
+        root (see Verification.verify_inclusion). None if no block with a
+        Merkle root holds the transaction.
+
+        Arguments:
+            :tx_id: The id of the transaction (see hash_transaction).
+        """
+        with self.__lock.read():
+            location = self.__tx_index.locate(tx_id)
+            if location is None:
+                return None
+            index, position = location
+            block = self.__chain[index]
+            if block.merkle_root is None:
+                return None
+            transactions = block.transactions
+            if index < self.__full_from():
+                # Held as header only
+                transactions = [Transaction.to_transaction_from_dict(tx) for tx in
+                                self.__store.read_block(index)['transactions']]
+        return {'tx_id': tx_id,
+                'block_index': index,
+                'block_hash': block.hash,
+                'header': block.header(),
+                'position': position,
+                'proof': merkle_proof(transactions, position)}
+
+    def get_checkpoint(self):
+        """Return the latest checkpoint as a dictionary, with the headers of
+        the blocks it covers (None if there is no checkpoint yet)."""
+        with self.__lock.read():
+            checkpoint = self.__checkpoint
+            chain = self.chain
+        if checkpoint is None:
+            return None
+        response = checkpoint.to_dict()
+        response['headers'] = [dict(block.header(), hash=block.hash)
+                               for block in chain.iter_blocks(0, checkpoint.height)]
+        return response
+
+    def load_checkpoint(self, values):
+        """Start a new node from the checkpoint of a peer (see
+        get_checkpoint), so only the blocks after it have to be fetched. The
+        peer is trusted for the blocks the checkpoint covers, they are kept
+        as headers only. Returns True if the checkpoint was used.
+
+        Arguments:
+            :values: The checkpoint as a dictionary, with the headers.
+        """
+        checkpoint = Checkpoint.from_dict(values)
+        try:
+            blocks = [Block.convert_from_json(dict(header, transactions=[]),
+                                              trusted=True)
+                      for header in values['headers']]
+        except (KeyError, TypeError, ValueError):
+            return False
+        if (checkpoint is None or len(blocks) != checkpoint.height or
+                not checkpoint.matches(blocks)):
+            return False
+        for index, block in enumerate(blocks):
+            if block.index != index or (index and
+                                        block.previous_hash != blocks[index - 1].hash):
+                return False
+        with self.__lock.write():
+            # Only a new node (which has nothing but the genesis block) starts
+            # over from a checkpoint
+            if len(self.__chain) != 1 or self.__chain[0].hash != blocks[0].hash:
+                return False
+            checkpoint.pruned = checkpoint.height
+            self.miner.cancel()
+            self.__start_from(checkpoint, blocks)
+            self.__ledger.reset_pending(self.__open_transactions)
+            self.save_chain()
+            self.save_checkpoint()
+        return True
 
+    def apply_blocks(self, blocks):
+        """Add a branch of consecutive blocks (e.g. fetched from a peer) to
+        the block tree and switch our chain to it if the blocks are valid and
+        the branch has more work than our chain. Returns True if our chain
+        was changed.
+
+        Arguments:
+            :blocks: The consecutive blocks received from a peer.
+        """
+        with self.__lock.write():
+            # Skip the blocks we have already
+            start = 0
+            while start < len(blocks) and blocks[start].hash in self.__tree:
+                start += 1
+            blocks = blocks[start:]
+            if not blocks or self.__tree.work(blocks[0].previous_hash) is None:
+                return False
+            branch = self.__branch_view(blocks[0].previous_hash)
+            if branch is None:
+                return False
+            # Only branches whose blocks meet the difficulty of the branch and
+            # carry their proof of work are kept
+            connected = []
+            for block in blocks:
+                if (block.previous_hash != branch[-1].hash or
+                        block.index != len(branch) or
+                        block.difficulty != next_difficulty(branch) or
+                        not Verification.valid_block_proof(block)):
+                    self.__tree.remove(connected)
+                    return False
+                connected.extend(self.__tree.connect(block))
+                branch.blocks.append(block)
+            return self.__choose_tip(blocks[-1:])
+
+    def __reorganize(self, fork, blocks):
+        """Roll back our blocks from the fork index and apply the blocks of
+        another branch, if they are valid. The transactions of the rolled
+        back blocks which aren't part of the branch go back to the open
+        transactions."""
+        # The blocks held as headers only can't be rolled back
+        if fork < self.__full_from():
+            return False
+        if not Verification.verify_chain(self.__chain[:fork] + blocks, fork):
+            return False
+        displaced = self.__chain[fork:]
+        for block in reversed(displaced):
+            self.__ledger.revert_block(block)
+        for block in blocks:
+            self.__ledger.apply_block(block)
+        self.miner.cancel()
+        # Snapshots may still hold the old list, so it isn't changed in place
+        self.__chain = self.__chain[:fork] + blocks
+        self.__tree.switch(displaced, blocks, len(self.__chain))
+        # Open transactions which made it into the new blocks are done
+        for block in blocks:
+            for tx in self.__open_transactions.remove_transactions(block.transactions):
+                self.__ledger.remove_pending(tx)
+        self.__restore_transactions(displaced, blocks)
+        if self.__checkpoint is not None and not self.__checkpoint.matches(self.__chain):
+            self.__checkpoint = None
+        # Only the blocks after the fork point are rewritten
+        self.__store.truncate(fork)
+        self.save_chain()
+        self.save_open_transactions()
+        return True
+
+    def __restore_transactions(self, displaced, blocks):
+        """Return the transactions of rolled back blocks which the applied
+        blocks don't include to the open transactions (if the sender still
+        has the funds)."""
+        included = set(hash_transaction(tx) for block in blocks
+                       for tx in block.transactions)
+        for block in displaced:
+            # The last transaction is the mining reward of the dropped block
+            for tx in block.transactions[:-1]:
+                if (hash_transaction(tx) in included or
+                        self.__ledger.get_balance(tx.sender) < tx.amount + tx.fee):
+                    continue
+                for evicted in self.__open_transactions.add(tx):
+                    self.__ledger.remove_pending(evicted)
+                self.__ledger.add_pending(tx)
+
+    def __common_length(self, other_chain):
+        """Return the number of leading blocks both chains share."""
+        # Every block hash covers the previous one, so the shared blocks are
+        # a prefix and can be found by bisection
+        low = 0
+        high = min(len(self.__chain), len(other_chain))
+        while low < high:
+            middle = (low + high + 1) // 2
+            if Block.sameBlock(self.__chain[middle - 1], other_chain[middle - 1]):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def resolve(self):
+        """Syncs with all peer nodes: fetches the missing blocks from longer
+        chains and sends the blocks shorter ones miss. Returns True if the
+        local chain was replaced."""
+        return sync_chain(self.get_peer_nodes(), self)
 
     def add_peer_node(self, node):
         """Adds a new node to the peer node set.
@@ -340,9 +999,10 @@ class Blockchain:
         Arguments:
             :node: The node URL which should be added.
         """
-        self.__peer_nodes.add(node)
+        with self.__lock.write():
+            self.__peer_nodes.add(node)
+            self.save_peer_nodes()
         self.resolve()
-        self.save_data()
 
     def remove_peer_node(self, node):
         """Removes a node from the peer node set.
@@ -350,26 +1010,25 @@ class Blockchain:
         Arguments:
             :node: The node URL which should be removed.
         """
-        self.__peer_nodes.discard(node)
-        self.save_data()
+        with self.__lock.write():
+            self.__peer_nodes.discard(node)
+            self.save_peer_nodes()
+        gossip.forget_peer(node)
 
     def get_peer_nodes(self):
         """Return a list of all connected peer nodes."""
-        return list(self.__peer_nodes)
+        with self.__lock.read():
+            return list(self.__peer_nodes)
     
 
     @staticmethod
     def prepare_chain_to_json(inputChain):
-        dict_chain = [block.__dict__.copy() for block in inputChain]
-        for dict_block in dict_chain:
-            dict_block['transactions'] = [
-                tx.__dict__ for tx in dict_block['transactions']]
-        return dict_chain
+        return [block.to_dict() for block in inputChain]
     
     
     @staticmethod
     def prepare_transactions_List_to_json(inputTxList):
-        return [tx.__dict__ for tx in inputTxList]
+        return [tx.to_dict() for tx in inputTxList]
 
     @staticmethod
     def convert_chain_from_json(inputChain):
@@ -378,20 +1037,18 @@ class Blockchain:
 
     @staticmethod
     def convert_open_tx_from_json(inputTx):
-        open_tx = [Transaction.to_transaction_from_dict(tx) for tx in inputTx]
+        # Malformed entries (e.g. from a peer) are left out one by one
+        open_tx = [Transaction.to_transaction_from_dict(tx) for tx in inputTx
+                   if valid_transaction_fields(tx)]
         return open_tx
     
     
     @staticmethod
     def sameChains(chain1 , chain2):
-        len1 = len(chain1)        
-        len2 = len(chain2)
-        if len1 is not len2:
+        if len(chain1) != len(chain2):
             return False
-        for i in range(len1):
-            # print('sameChains')
-            # print(chain1[i])
-            # print(chain2[i])
-            if not Block.sameBlock(chain1[i],chain2[i]):
-                return False
-        return True
\ No newline at end of file
+        if len(chain1) == 0:
+            return True
+        # Every block hash covers the previous one, so equal tips mean equal
+        # chains
+        return Block.sameBlock(chain1[-1], chain2[-1])
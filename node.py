@@ -1,15 +1,80 @@
-from flask import Flask, jsonify, request, send_from_directory
+import queue
+import threading
+from concurrent import futures
+
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 
 from wallet import Wallet
 from blockchain import Blockchain
+from block import Block, valid_transaction_fields
+from transaction import Transaction
 
 from utility.message_handler import single_line_response
 from time import time
 from utility import constants
 from utility import broadcast
+from utility import codec
+from utility.gossip import NODE_PORT_HEADER, source_peer
 app = Flask(__name__)
 CORS(app)
+# Requests are served by several threads, creating or loading a wallet
+# (which replaces the blockchain) happens one at a time
+wallet_lock = threading.Lock()
+# Whether a new node starts from a peer's checkpoint (see --fast-sync)
+fast_sync = False
+
+
+def wants_binary():
+    """Check whether the client asked for the binary encoding."""
+    return codec.CONTENT_TYPE in request.headers.get('Accept', '')
+
+
+def binary_response(payload):
+    return Response(payload, status=constants.STATUS_200,
+                    mimetype=codec.CONTENT_TYPE)
+
+
+def request_source():
+    """Return the peer node the current request came from (None if it
+    didn't come from one of our peers)."""
+    return source_peer(blockchain.get_peer_nodes(), request.remote_addr,
+                       request.headers.get(NODE_PORT_HEADER))
+
+
+def wait_for(future, deadline):
+    """Return the result of a queued transaction (None if it isn't validated
+    before the deadline)."""
+    try:
+        return future.result(timeout=max(deadline - time(), 0))
+    except futures.TimeoutError:
+        return None
+
+
+def ingest(transaction, source=None):
+    """Queue a transaction for validation and return a response for it."""
+    try:
+        future = blockchain.ingestor.submit(transaction, source)
+    except queue.Full:
+        response = single_line_response('Too many transactions, try again later.')
+        return jsonify(response), constants.STATUS_503
+    success = wait_for(future, time() + constants.INGEST_TIMEOUT)
+    if success is None:
+        response = {
+            'message': 'Transaction queued.',
+            'transaction': transaction.to_dict()
+        }
+        return jsonify(response), constants.STATUS_202
+    if success:
+        response = {
+            'message': 'Successfully added transaction.',
+            'transaction': transaction.to_dict()
+        }
+        if transaction.sender == wallet.public_key:
+            response['funds'] = blockchain.get_balance()
+        return jsonify(response), constants.STATUS_201
+    response = single_line_response('Creating a transaction failed.')
+    return jsonify(response), constants.STATUS_500
 
 
 @app.route('/', methods=['GET'])
@@ -24,10 +89,15 @@ def get_network_ui():
 
 @app.route('/wallet', methods=['POST'])
 def create_keys():
-    wallet.create_keys()
-    if wallet.save_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
+    global blockchain
+    with wallet_lock:
+        wallet.create_keys()
+        saved = wallet.save_keys()
+        if saved:
+            blockchain.mining_service.stop()
+            blockchain.ingestor.stop()
+            blockchain = Blockchain(wallet.public_key, port, fast_sync)
+    if saved:
         response = {
             'public_key': wallet.public_key,
             'private_key': wallet.private_key,
@@ -43,9 +113,14 @@ def create_keys():
 
 @app.route('/wallet', methods=['GET'])
 def load_keys():
-    if wallet.load_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
+    global blockchain
+    with wallet_lock:
+        loaded = wallet.load_keys()
+        if loaded:
+            blockchain.mining_service.stop()
+            blockchain.ingestor.stop()
+            blockchain = Blockchain(wallet.public_key, port, fast_sync)
+    if loaded:
         response = {
             'public_key': wallet.public_key,
             'private_key': wallet.private_key,
@@ -86,32 +161,54 @@ def broadcast_transaction():
     if not all(key in values for key in required):
         response = single_line_response('Some data is missing.')
         return jsonify(response), constants.STATUS_400
-    success = blockchain.add_transaction(
-        values['recipient'],
-        values['sender'],
-        values['signature'],
-        values['amount'],
-        values['time'])
-    if success:
-        response = {
-            'message': 'Successfully added transaction.',
-            'transaction': {
-                'sender': values['sender'],
-                'recipient': values['recipient'],
-                'amount': values['amount'],
-                'signature': values['signature'],
-                'time': values['time']
-            }
-        }
-        return jsonify(response), constants.STATUS_201
+    if not valid_transaction_fields(values):
+        response = single_line_response('Invalid transaction.')
+        return jsonify(response), constants.STATUS_400
+    return ingest(Transaction.to_transaction_from_dict(values), request_source())
+
+
+@app.route('/broadcast-transactions', methods=['POST'])
+def broadcast_transactions():
+    """Add a list of transactions (e.g. relayed by a peer). The result of
+    each transaction is True, False or None if it's still queued."""
+    if codec.is_binary(request.get_data()):
+        try:
+            values = {'transactions': codec.decode_transactions(request.get_data())}
+        except ValueError:
+            values = None
     else:
-        response = single_line_response('Creating a transaction failed.')
-        return jsonify(response), constants.STATUS_500
+        values = request.get_json()
+    if not values or not isinstance(values.get('transactions'), list):
+        response = single_line_response('No transactions found.')
+        return jsonify(response), constants.STATUS_400
+    transactions = [Transaction.to_transaction_from_dict(tx)
+                    if valid_transaction_fields(tx) else None
+                    for tx in values['transactions']]
+    queued = iter(blockchain.ingestor.submit_many(
+        [tx for tx in transactions if tx is not None], request_source()))
+    deadline = time() + constants.INGEST_TIMEOUT
+    results = []
+    for tx in transactions:
+        future = next(queued) if tx is not None else None
+        # Malformed transactions and the ones which didn't fit into the
+        # queue weren't added
+        results.append(wait_for(future, deadline) if future is not None else False)
+    response = {
+        'message': 'Transactions received.',
+        'results': results
+    }
+    return jsonify(response), constants.STATUS_200
 
 
 @app.route('/broadcast-block', methods=['POST'])
 def broadcast_block():
-    values = request.get_json()
+    if request.mimetype == codec.CONTENT_TYPE:
+        try:
+            values = {'block': codec.decode_block(request.get_data())}
+        except ValueError:
+            values = None
+    else:
+        values = request.get_json()
     if not values:
         response = single_line_response('No data found.')
         return jsonify(response), constants.STATUS_400
@@ -119,22 +216,20 @@ def broadcast_block():
         response = single_line_response('Some data is missing.')
         return jsonify(response), constants.STATUS_400
     block = values['block']
-    if block['index'] == blockchain.chain[-1].index + 1: #if it's the next block for my chain
-        if blockchain.add_block(block):
-            response = single_line_response('Block added')
-            return jsonify(response), constants.STATUS_201
-        else:
-            response = single_line_response('Block seems invalid.')
-            return jsonify(response), constants.STATUS_409
-    elif block['index'] > blockchain.chain[-1].index: # block is way a head
-        response = single_line_response('Blockchain seems to differ from local blockchain.')
-        blockchain.resolve_conflicts = True
-        resolve_conflicts()
-        blockchain.resolve_conflicts = False
+    # Blocks of side branches and orphans are kept by the blockchain, which
+    # switches to them (or fetches their missing parents) as needed
+    result = blockchain.add_block(block, request_source())
+    if result == constants.BLOCK_ADDED:
+        response = single_line_response('Block added')
+        return jsonify(response), constants.STATUS_201
+    elif result == constants.BLOCK_KNOWN:
+        response = single_line_response('Block already known')
         return jsonify(response), constants.STATUS_200
+    elif result == constants.BLOCK_KEPT:
+        response = single_line_response('Block kept on a side branch')
+        return jsonify(response), constants.STATUS_202
     else:
-        response = {
-            'message': 'Blockchain seems to be shorter, block not added'}
+        response = single_line_response('Block seems invalid.')
         return jsonify(response), constants.STATUS_409
 
 
@@ -156,25 +251,16 @@ def add_transaction():
         
     recipient = values['recipient']
     amount = values['amount']
-    signature = wallet.sign_transaction(wallet.public_key, recipient, amount)
+    fee = values.get('fee', 0)
     timeStamp = time()
-    success = blockchain.add_transaction(recipient, wallet.public_key, signature, amount, timeStamp)
-    if success:
-        response = {
-            'message': 'Successfully added transaction.',
-            'transaction': {
-                'sender': wallet.public_key,
-                'recipient': recipient,
-                'amount': amount,
-                'signature': signature,
-                'time': timeStamp
-            },
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), constants.STATUS_201
-    else:
-        response = single_line_response('Creating a transaction failed.')
-        return jsonify(response), constants.STATUS_500
+    if not valid_transaction_fields({'sender': wallet.public_key, 'recipient': recipient,
+                                     'amount': amount, 'fee': fee, 'signature': '',
+                                     'time': timeStamp}):
+        response = single_line_response('Invalid transaction.')
+        return jsonify(response), constants.STATUS_400
+    signature = wallet.sign_transaction(wallet.public_key, recipient, amount, fee)
+    return ingest(Transaction(wallet.public_key, recipient, signature, amount,
+                              timeStamp, fee))
 
 
 @app.route('/mine', methods=['POST'])
@@ -183,23 +269,80 @@ def mine():
         # response = {'message': 'Resolve conflicts first, block not added!'}
         resolve_conflicts()
         # return jsonify(response), constants.STATUS_409
-    block = blockchain.mine_block()
-    if block is not None:
-        dict_block = block.__dict__.copy()
-        dict_block['transactions'] = [
-            tx.__dict__ for tx in dict_block['transactions']]
-        response = {
-            'message': 'Block added successfully.',
-            'block': dict_block,
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), constants.STATUS_201
-    else:
+    if blockchain.public_key is None:
         response = {
             'message': 'Adding a block failed.',
-            'wallet_set_up': wallet.public_key is not None
+            'wallet_set_up': False
         }
         return jsonify(response), constants.STATUS_500
+    # The block is mined in the background, the job tells when it's done
+    values = request.get_json(silent=True) or {}
+    job = blockchain.mining_service.start(bool(values.get('continuous')))
+    response = {
+        'message': 'Mining started.',
+        'job': job.to_dict(),
+        'funds': blockchain.get_balance()
+    }
+    return jsonify(response), constants.STATUS_202
+
+
+@app.route('/mine', methods=['GET'])
+def get_mining_status():
+    return jsonify(blockchain.mining_service.status()), constants.STATUS_200
+
+
+@app.route('/mine/<int:job_id>', methods=['GET'])
+def get_mining_job(job_id):
+    job = blockchain.mining_service.get_job(job_id)
+    if job is None:
+        response = single_line_response('No such mining job.')
+        return jsonify(response), constants.STATUS_404
+    response = {
+        'job': job.to_dict(),
+        'funds': blockchain.get_balance()
+    }
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/mine/<int:job_id>', methods=['DELETE'])
+def stop_mining_job(job_id):
+    job = blockchain.mining_service.stop(job_id)
+    if job is None:
+        response = single_line_response('No such mining job.')
+        return jsonify(response), constants.STATUS_404
+    response = {
+        'message': 'Mining stopped.',
+        'job': job.to_dict()
+    }
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    response = {
+        'height': blockchain.get_height(),
+        'difficulty': blockchain.get_difficulty(),
+        'block_interval': blockchain.get_block_interval(),
+        'target_block_time': constants.TARGET_BLOCK_TIME,
+        'hashrate': blockchain.miner.hashrate,
+        'last_block_latency': blockchain.mining_service.last_block_latency,
+        'messages_sent': broadcast.broadcaster.sent,
+        'key_cache': {
+            'hits': Wallet.key_cache.hits,
+            'misses': Wallet.key_cache.misses
+        }
+    }
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/stats/analytics', methods=['GET'])
+def get_analytics():
+    top = request.args.get('top', constants.ANALYTICS_TOP, type=int)
+    response = blockchain.get_analytics(max(top, 0))
+    if response is None:
+        response = single_line_response('NumPy is not installed.')
+        return jsonify(response), constants.STATUS_503
+    return jsonify(response), constants.STATUS_200
 
 
 @app.route('/resolve-conflicts', methods=['POST'])
@@ -215,33 +358,174 @@ def resolve_conflicts():
 @app.route('/transactions', methods=['GET'])
 def get_open_transaction():
     transactions = blockchain.get_open_transactions()
-    dict_transactions = [tx.__dict__ for tx in transactions]
+    dict_transactions = [tx.to_dict() for tx in transactions]
+    if wants_binary():
+        return binary_response(codec.encode_transactions(dict_transactions))
     return jsonify(dict_transactions), constants.STATUS_200
 
 
+def stream_json_blocks(blocks):
+    """Serialize block dictionaries to a JSON list one block at a time."""
+    yield '['
+    for position, block in enumerate(blocks):
+        if position:
+            yield ','
+        yield app.json.dumps(block)
+    yield ']'
+
+
 @app.route('/chain', methods=['GET'])
 def get_chain():
+    """Return the blocks of the chain, streamed one at a time.
+
+    The optional 'from' index, 'since_hash' cursor (the blocks after the
+    block with that hash) and 'limit' select a range of blocks, all of them
+    are returned by default.
+    """
     chain_snapshot = blockchain.chain
-    # dict_chain = blockchain.prepare_chain_to_json(chain_snapshot)
-    dict_chain = [block.__dict__.copy() for block in chain_snapshot]
-    for dict_block in dict_chain:
-        dict_block['transactions'] = [
-            tx.__dict__ for tx in dict_block['transactions']]
-    return jsonify(dict_chain), constants.STATUS_200
+    binary = wants_binary()
+    # The tip hash covers every block, so it identifies the whole chain
+    etag = chain_snapshot.tip.hash + ('-binary' if binary else '')
+    if request.if_none_match.contains(etag):
+        response = Response(status=constants.STATUS_304)
+        response.set_etag(etag)
+        return response
+    start = max(request.args.get('from', 0, type=int), 0)
+    since_hash = request.args.get('since_hash')
+    if since_hash is not None:
+        index = chain_snapshot.index_of(since_hash)
+        if index is None:
+            response = single_line_response('Unknown block hash.')
+            return jsonify(response), constants.STATUS_404
+        start = max(start, index + 1)
+    limit = request.args.get('limit', type=int)
+    end = None if limit is None else start + max(limit, 0)
+    start, end, _ = slice(start, end).indices(len(chain_snapshot))
+    count = max(end - start, 0)
+    blocks = blockchain.iter_block_dicts(chain_snapshot, start, end)
+    if binary:
+        response = Response(codec.iter_encode_blocks(blocks, count),
+            status=constants.STATUS_200, mimetype=codec.CONTENT_TYPE)
+    else:
+        response = Response(stream_json_blocks(blocks),
+                            status=constants.STATUS_200,
+                            mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 @app.route('/chain', methods=['POST'])
 def post_chain():
     
     values = request.get_json()
+    if (not values or not isinstance(values.get('chain'), list) or
+            not isinstance(values.get('open_tx'), list)):
+        response = single_line_response('Invalid chain.')
+        return jsonify(response), constants.STATUS_400
     chain_received = values['chain']
     open_tx_received = values['open_tx']
 
    
-    blockchain.replace_chain(blockchain.convert_chain_from_json(chain_received), blockchain.convert_open_tx_from_json(open_tx_received))
+    try:
+        chain_received = blockchain.convert_chain_from_json(chain_received)
+    except ValueError:
+        response = single_line_response('Invalid chain.')
+        return jsonify(response), constants.STATUS_400
+    blockchain.replace_chain(chain_received, blockchain.convert_open_tx_from_json(open_tx_received))
     return 'somthing'
     # todo fix the transforamtion from json and object
 
 
+@app.route('/tip', methods=['GET'])
+def get_tip():
+    response = blockchain.get_tip()
+    # Tell the peers which encodings we understand
+    response['content_types'] = [codec.CONTENT_TYPE, 'application/json']
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/tx/<tx_id>', methods=['GET'])
+def get_transaction(tx_id):
+    response = blockchain.get_transaction(tx_id)
+    if response is None:
+        response = single_line_response('Transaction not found.')
+        return jsonify(response), constants.STATUS_404
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/address/<key>/history', methods=['GET'])
+def get_address_history(key):
+    """Return the transactions of the chain an address sent or received,
+    newest first. The 'cursor' of a response fetches the next page."""
+    limit = request.args.get('limit', constants.HISTORY_PAGE_SIZE, type=int)
+    try:
+        transactions, cursor = blockchain.get_address_history(
+            key, limit, request.args.get('cursor'))
+    except ValueError:
+        response = single_line_response('Invalid cursor.')
+        return jsonify(response), constants.STATUS_400
+    response = {'transactions': transactions, 'cursor': cursor}
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/merkle-proof/<tx_id>', methods=['GET'])
+def get_merkle_proof(tx_id):
+    """Return the proof that a block of the chain holds the transaction, so
+    a light client can check it against the block hash alone."""
+    response = blockchain.get_merkle_proof(tx_id)
+    if response is None:
+        response = single_line_response('Transaction not found in a block.')
+        return jsonify(response), constants.STATUS_404
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/checkpoint', methods=['GET'])
+def get_checkpoint():
+    response = blockchain.get_checkpoint()
+    if response is None:
+        response = single_line_response('No checkpoint yet.')
+        return jsonify(response), constants.STATUS_404
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/fork-point', methods=['POST'])
+def get_fork_point():
+    values = request.get_json()
+    if not values or 'locator' not in values:
+        response = single_line_response('No locator found.')
+        return jsonify(response), constants.STATUS_400
+    response = {'index': blockchain.find_fork_point(values['locator'])}
+    return jsonify(response), constants.STATUS_200
+
+
+@app.route('/blocks', methods=['GET'])
+def get_blocks():
+    start = max(request.args.get('from', 0, type=int), 0)
+    end = request.args.get('to', start + constants.SYNC_BATCH, type=int)
+    end = min(end, start + constants.SYNC_BATCH)
+    blocks = blockchain.prepare_chain_to_json(blockchain.get_blocks(start, end))
+    if wants_binary():
+        return binary_response(codec.encode_blocks(blocks))
+    return jsonify(blocks), constants.STATUS_200
+
+
+@app.route('/blocks', methods=['POST'])
+def post_blocks():
+    values = request.get_json()
+    if not values or 'blocks' not in values:
+        response = single_line_response('No blocks found.')
+        return jsonify(response), constants.STATUS_400
+    try:
+        blocks = [Block.convert_from_json(block) for block in values['blocks']]
+    except (TypeError, ValueError):
+        response = single_line_response('Invalid blocks.')
+        return jsonify(response), constants.STATUS_400
+    if blockchain.apply_blocks(blocks):
+        response = single_line_response('Blocks added')
+        return jsonify(response), constants.STATUS_201
+    response = single_line_response('Blocks were not added.')
+    return jsonify(response), constants.STATUS_409
+
+
 @app.route('/node', methods=['POST'])
 def add_node():
     values = request.get_json()
@@ -292,8 +576,19 @@ if __name__ == '__main__':
     from argparse import ArgumentParser
     parser = ArgumentParser()
     parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--fast-sync', action='store_true',
+                        help="start a new node from a peer's checkpoint")
     args = parser.parse_args()
     port = args.port
+    fast_sync = args.fast_sync
+    # Peers tell from this header which node a message came from
+    broadcast.broadcaster.headers[NODE_PORT_HEADER] = str(port)
     wallet = Wallet(port)
-    blockchain = Blockchain(wallet.public_key, port)
-    app.run(host='0.0.0.0', port=port)
+    blockchain = Blockchain(wallet.public_key, port, fast_sync)
+    try:
+        from waitress import serve
+    except ImportError:
+        print('waitress is not installed, using the development server')
+        app.run(host='0.0.0.0', port=port, threaded=True)
+    else:
+        serve(app, host='0.0.0.0', port=port, threads=constants.SERVER_THREADS)
@@ -1,38 +1,120 @@
 from collections import OrderedDict
 
 from utility.printable import Printable
+from utility.address_table import addresses
 
 
 class Transaction(Printable):
     """A transaction which can be added to a block in the blockchain.
 
+    The sender and recipient are kept as ids of the address table and only
+    expanded to the full keys when they are read. Addresses the table doesn't
+    know yet are kept as keys until the transaction is admitted to the open
+    transactions or confirmed by a block (see intern), so junk transactions
+    never grow the table.
+
     Attributes:
         :sender: The sender of the coins.
         :recipient: The recipient of the coins.
         :signature: The signature of the transaction.
         :amount: The amount of coins sent.
+        :fee: The optional fee paid to the miner (on top of the amount).
+        :sender_id: The address table id of the sender (None until it's
+        interned).
+        :recipient_id: The address table id of the recipient (None until
+        it's interned).
+        :sender (private): The key of the sender while it isn't interned.
+        :recipient (private): The key of the recipient while it isn't
+        interned.
     """
 
-    def __init__(self, sender, recipient, signature, amount, time):
+    # Large chains hold many transactions, so they don't carry a __dict__
+    __slots__ = ('sender_id', 'recipient_id', '__sender', '__recipient',
+                 'amount', 'time', 'signature', 'fee')
+
+    def __init__(self, sender, recipient, signature, amount, time, fee=0):
         self.sender = sender
         self.recipient = recipient
         self.amount = amount
         self.time = time
         self.signature = signature
+        self.fee = fee
+
+    @property
+    def sender(self):
+        sender = self.__sender
+        return sender if sender is not None else addresses.address(self.sender_id)
+
+    @sender.setter
+    def sender(self, val):
+        self.sender_id = addresses.lookup(val)
+        self.__sender = val if self.sender_id is None else None
+
+    @property
+    def recipient(self):
+        recipient = self.__recipient
+        return (recipient if recipient is not None
+                else addresses.address(self.recipient_id))
+
+    @recipient.setter
+    def recipient(self, val):
+        self.recipient_id = addresses.lookup(val)
+        self.__recipient = val if self.recipient_id is None else None
+
+    def intern(self):
+        """Register the sender and recipient in the address table, once the
+        transaction is admitted to the open transactions or confirmed by a
+        block."""
+        # The id is set before the key is dropped, so a concurrent read of
+        # the address always finds one of them
+        if self.sender_id is None:
+            self.sender_id = addresses.intern(self.__sender)
+            self.__sender = None
+        if self.recipient_id is None:
+            self.recipient_id = addresses.intern(self.__recipient)
+            self.__recipient = None
+
+    # Address ids are only valid within one process, so pickled transactions
+    # (e.g. sent to the verifying processes) carry the full keys
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.sender = state['sender']
+        self.recipient = state['recipient']
+        self.amount = state['amount']
+        self.time = state['time']
+        self.signature = state['signature']
+        self.fee = state['fee']
+
+    def to_dict(self):
+        """Converts this transaction into a dictionary (with the full keys),
+        e.g. to send it as JSON."""
+        return {'sender': self.sender,
+                'recipient': self.recipient,
+                'amount': self.amount,
+                'time': self.time,
+                'signature': self.signature,
+                'fee': self.fee}
 
     def to_ordered_dict(self):
         """Converts this transaction into a (hashable) OrderedDict."""
-        return OrderedDict([('sender', self.sender),
-                            ('recipient', self.recipient),
-                            ('amount', self.amount),
-                            ('time', self.time)])
+        ordered = OrderedDict([('sender', self.sender),
+                               ('recipient', self.recipient),
+                               ('amount', self.amount),
+                               ('time', self.time)])
+        # Transactions without a fee hash like they did before fees existed
+        if self.fee:
+            ordered['fee'] = self.fee
+        return ordered
     @staticmethod
     def to_transaction_from_dict(transaction):
         return Transaction(transaction['sender'],
         transaction['recipient'],
         transaction['signature'],
         transaction['amount'],
-        transaction['time'])
+        transaction['time'],
+        transaction.get('fee', 0))
 
     @staticmethod
     def contains_transaction(transactionsList, transaction):
@@ -77,6 +159,7 @@ class Transaction(Printable):
             tx1.recipient == tx2.recipient and 
             tx1.signature == tx2.signature and 
             tx1.amount == tx2.amount and
+            tx1.fee == tx2.fee and
             tx1.time == tx2.time):
                 return True
 
@@ -0,0 +1,46 @@
+"""Provides the table of interned addresses (public keys)."""
+
+from threading import Lock
+
+
+class AddressTable:
+    """Interns every address once and hands out a small integer id for it,
+    so transactions don't each carry their own copy of the (long, hex
+    encoded) public keys and comparing addresses is an int comparison.
+
+    Ids are only valid within the running node, they are never stored or
+    sent to peers.
+    """
+
+    def __init__(self):
+        self.__ids = {}
+        self.__addresses = []
+        self.__lock = Lock()
+
+    def __len__(self):
+        return len(self.__addresses)
+
+    def intern(self, address):
+        """Return the id of an address, registering it if it's new."""
+        address_id = self.__ids.get(address)
+        if address_id is not None:
+            return address_id
+        with self.__lock:
+            address_id = self.__ids.get(address)
+            if address_id is None:
+                address_id = len(self.__addresses)
+                self.__addresses.append(address)
+                self.__ids[address] = address_id
+            return address_id
+
+    def lookup(self, address):
+        """Return the id of an address (None if it was never interned)."""
+        return self.__ids.get(address)
+
+    def address(self, address_id):
+        """Return the address of an id."""
+        return self.__addresses[address_id]
+
+
+# Shared by all transactions of the node
+addresses = AddressTable()
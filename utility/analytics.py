@@ -0,0 +1,241 @@
+"""Provides reports over the chain, computed on NumPy columns.
+
+Run it as a module to print the report of a node's stored chain:
+
+    python -m utility.analytics --port <port_number>
+"""
+
+import numpy as np
+
+import utility.constants as constants
+from utility.address_table import addresses
+
+
+class _Column:
+    """A NumPy array which grows as values are appended (doubling its
+    capacity), so appending a block doesn't copy the whole column."""
+
+    def __init__(self, dtype):
+        self.__values = np.zeros(64, dtype=dtype)
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    @property
+    def values(self):
+        """The appended values (a view, valid until the next change)."""
+        return self.__values[:self.__size]
+
+    def extend(self, values):
+        end = self.__size + len(values)
+        if end > len(self.__values):
+            grown = np.zeros(max(end, 2 * len(self.__values)),
+                             dtype=self.__values.dtype)
+            grown[:self.__size] = self.values
+            self.__values = grown
+        self.__values[self.__size:end] = values
+        self.__size = end
+
+    def truncate(self, size):
+        self.__size = min(self.__size, size)
+
+
+class ChainColumns:
+    """The transactions of the chain as columns (one row per transaction:
+    block index, amount, fee, time, sender and recipient address id) and the
+    blocks as columns (timestamp, first row and number of transactions).
+    Blocks are appended as they arrive and dropped from the top when a
+    reorganisation replaces them, so the columns never have to be rebuilt.
+
+    The reports group the rows by address id with np.bincount (address ids
+    are small consecutive integers, see AddressTable).
+
+    Attributes:
+        :base: The checkpoint the columns start from (None if they cover the
+        whole chain). Its balances are the start of the rich list, the
+        blocks it covers have no rows.
+        :hashes (private): The hash of every block.
+    """
+
+    def __init__(self, base=None):
+        self.base = base
+        self.__base_ids = np.array([addresses.intern(address) for address in
+                                    (base.balances if base else {})], dtype=np.int64)
+        self.__base_amounts = np.array(list(base.balances.values()) if base else [],
+                                       dtype=np.float64)
+        self.__hashes = []
+        self.__timestamps = _Column(np.float64)
+        self.__first_rows = _Column(np.int64)
+        self.__block = _Column(np.int64)
+        self.__amount = _Column(np.float64)
+        self.__fee = _Column(np.float64)
+        self.__time = _Column(np.float64)
+        self.__sender = _Column(np.int64)
+        self.__recipient = _Column(np.int64)
+
+    @property
+    def height(self):
+        """The number of blocks in the columns."""
+        return len(self.__hashes)
+
+    def block_hash(self, index):
+        """Return the hash of the block at the given index."""
+        return self.__hashes[index]
+
+    def add(self, block):
+        """Append the block added to the chain (and its transactions)."""
+        transactions = block.transactions
+        if self.base is not None and block.index < self.base.height:
+            # Covered by the balances of the checkpoint
+            transactions = []
+        for tx in transactions:
+            # Blocks read from the store weren't booked by the ledger yet
+            tx.intern()
+        self.__hashes.append(block.hash)
+        self.__timestamps.extend([block.timestamp])
+        self.__first_rows.extend([len(self.__block)])
+        self.__block.extend(np.full(len(transactions), block.index))
+        self.__amount.extend([tx.amount for tx in transactions])
+        self.__fee.extend([tx.fee for tx in transactions])
+        self.__time.extend([tx.time for tx in transactions])
+        self.__sender.extend([tx.sender_id for tx in transactions])
+        self.__recipient.extend([tx.recipient_id for tx in transactions])
+
+    def truncate(self, height):
+        """Drop the blocks from the given index onwards."""
+        if height >= self.height:
+            return
+        rows = int(self.__first_rows.values[height])
+        del self.__hashes[height:]
+        for column in (self.__timestamps, self.__first_rows):
+            column.truncate(height)
+        for column in (self.__block, self.__amount, self.__fee, self.__time,
+                       self.__sender, self.__recipient):
+            column.truncate(rows)
+
+    def address_volume(self, top=constants.ANALYTICS_TOP):
+        """Return the addresses which moved the most coins (sent plus
+        received), with their sent and received amounts."""
+        size = len(addresses)
+        sent = np.bincount(self.__sender.values, self.__amount.values, size)
+        received = np.bincount(self.__recipient.values, self.__amount.values, size)
+        volume = sent + received
+        mining_id = addresses.lookup(constants.MINING)
+        if mining_id is not None:
+            volume[mining_id] = 0
+        return [{'address': addresses.address(i),
+                 'volume': float(volume[i]),
+                 'sent': float(sent[i]),
+                 'received': float(received[i])}
+                for i in _top(volume, top)]
+
+    def rich_list(self, top=constants.ANALYTICS_TOP):
+        """Return the addresses with the highest balances."""
+        size = len(addresses)
+        balances = (np.bincount(self.__recipient.values, self.__amount.values, size) -
+                    np.bincount(self.__sender.values,
+                                self.__amount.values + self.__fee.values, size) +
+                    np.bincount(self.__base_ids, self.__base_amounts, size))
+        mining_id = addresses.lookup(constants.MINING)
+        if mining_id is not None:
+            balances[mining_id] = 0
+        return [{'address': addresses.address(i), 'balance': float(balances[i])}
+                for i in _top(balances, top)]
+
+    def block_intervals(self, bins=10):
+        """Return the distribution of the seconds between blocks (the genesis
+        block is skipped, it has no real timestamp)."""
+        intervals = np.diff(self.__timestamps.values[1:])
+        if not len(intervals):
+            return None
+        counts, edges = np.histogram(intervals, bins=bins)
+        return dict(_summary(intervals),
+                    histogram={'counts': counts.tolist(), 'edges': edges.tolist()})
+
+    def transactions_per_block(self):
+        """Return the distribution of the number of transactions (with the
+        mining reward) per block."""
+        first_rows = self.__first_rows.values
+        counts = np.diff(np.append(first_rows, len(self.__block)))
+        # Blocks covered by the checkpoint (and the genesis block) have none
+        start = max(1, self.base.height if self.base else 0)
+        counts = counts[start:]
+        if not len(counts):
+            return None
+        return dict(_summary(counts), total=int(counts.sum()))
+
+    def miner_rewards(self, top=constants.ANALYTICS_TOP):
+        """Return the total of the mining rewards (with the fees) and the
+        addresses which earned the most of it."""
+        size = len(addresses)
+        # Without an interned sender there are no mining rewards (-1 is no id)
+        mining_id = addresses.lookup(constants.MINING)
+        rewards = self.__sender.values == (-1 if mining_id is None else mining_id)
+        recipients = self.__recipient.values[rewards]
+        totals = np.bincount(recipients, self.__amount.values[rewards], size)
+        blocks = np.bincount(recipients, minlength=size)
+        return {'total': float(totals.sum()),
+                'blocks': int(rewards.sum()),
+                'miners': [{'address': addresses.address(i),
+                            'rewards': float(totals[i]),
+                            'blocks': int(blocks[i])}
+                           for i in _top(totals, top)]}
+
+    def report(self, top=constants.ANALYTICS_TOP):
+        """Return all reports as a dictionary."""
+        return {'height': self.height,
+                'transactions': len(self.__block),
+                'since': self.base.height if self.base else 0,
+                'address_volume': self.address_volume(top),
+                'rich_list': self.rich_list(top),
+                'block_intervals': self.block_intervals(),
+                'transactions_per_block': self.transactions_per_block(),
+                'miner_rewards': self.miner_rewards(top)}
+
+
+def _top(values, top):
+    """Return the indices of the largest positive values, largest first."""
+    if top <= 0 or not len(values):
+        return []
+    candidates = np.argpartition(-values, min(top, len(values)) - 1)[:top]
+    candidates = candidates[values[candidates] > 0]
+    return candidates[np.argsort(-values[candidates], kind='stable')].tolist()
+
+
+def _summary(values):
+    return {'mean': float(values.mean()),
+            'median': float(np.median(values)),
+            'p90': float(np.percentile(values, 90)),
+            'min': float(values.min()),
+            'max': float(values.max())}
+
+
+def load_columns(store):
+    """Build the columns from a block store.
+
+    A node bootstrapped from a peer's checkpoint doesn't have the
+    transactions before it, its columns start from its latest checkpoint.
+    """
+    from block import Block
+    from utility.checkpoint import Checkpoint
+    checkpoint = Checkpoint.from_dict(store.load_checkpoint())
+    if checkpoint is None or not checkpoint.pruned:
+        checkpoint = None
+    columns = ChainColumns(checkpoint)
+    for block in store.read_blocks():
+        columns.add(Block.convert_from_json(block, trusted=True))
+    return columns
+
+
+if __name__ == '__main__':
+    import json
+    from argparse import ArgumentParser
+    from utility.block_store import BlockStore
+    parser = ArgumentParser(description='Print the report of a stored chain.')
+    parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--top', type=int, default=constants.ANALYTICS_TOP)
+    args = parser.parse_args()
+    # The node may be running and appending to the store, it's only read
+    store = BlockStore(args.port, read_only=True)
+    print(json.dumps(load_columns(store).report(args.top), indent=2))
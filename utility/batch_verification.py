@@ -0,0 +1,49 @@
+"""Provides parallel verification of transaction signatures."""
+
+import multiprocessing
+
+import utility.constants as constants
+from wallet import Wallet
+
+
+class BatchVerifier:
+    """Verifies the signatures of many transactions at once by fanning them
+    out over a pool of processes.
+
+    Attributes:
+        :processes: The number of verifying processes.
+        :min_batch: Batches with fewer transactions are verified in the
+        calling process (the pool isn't worth its overhead for them).
+    """
+
+    def __init__(self, processes=constants.VERIFY_PROCESSES,
+                 min_batch=constants.VERIFY_MIN_BATCH):
+        self.processes = processes
+        self.min_batch = min_batch
+        self.__pool = None
+
+    def verify(self, transactions):
+        """Return a list with the signature check result of each
+        transaction.
+
+        Arguments:
+            :transactions: The transactions that should be verified.
+        """
+        if self.processes <= 1 or len(transactions) < self.min_batch:
+            return Wallet.verify_transactions(transactions)
+        if self.__pool is None:
+            context = multiprocessing.get_context(constants.MULTIPROCESSING_START_METHOD)
+            self.__pool = context.Pool(self.processes)
+        # Transactions of the same sender end up in the same chunk, so every
+        # public key is parsed by one process only
+        order = sorted(range(len(transactions)),
+                       key=lambda i: transactions[i].sender)
+        chunk_size = -(-len(order) // self.processes)
+        chunks = [[transactions[i] for i in order[start:start + chunk_size]]
+                  for start in range(0, len(order), chunk_size)]
+        results = [None] * len(transactions)
+        chunk_results = self.__pool.map(Wallet.verify_transactions, chunks)
+        for i, result in zip(order, (result for chunk in chunk_results
+                                     for result in chunk)):
+            results[i] = result
+        return results
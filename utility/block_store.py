@@ -0,0 +1,304 @@
+"""Provides an append-only, crash-safe store for the blockchain."""
+
+import json
+import os
+import struct
+import zlib
+
+import utility.constants as constants
+from utility import codec
+
+# Every record is framed by its payload length and the crc32 of the payload
+RECORD_HEADER = struct.Struct('>II')
+# Every index entry is the offset of a record in its segment
+INDEX_ENTRY = struct.Struct('>Q')
+
+
+class BlockStore:
+    """Stores one (binary encoded) record per block in segmented append-only
+    log files, next to a separate file for the open transactions, one for
+    the peer nodes and one for the latest checkpoint of the balances.
+
+    Every segment holds up to segment_blocks records and has an index file
+    with the offset of each record, so a block can be read by its index
+    without scanning the log. After a crash the log is truncated to its last
+    valid record.
+
+    Attributes:
+        :directory: The directory holding the files of the node.
+        :segment_blocks: The number of blocks per segment.
+        :sync_every: The number of appended blocks after which the log is
+        fsynced.
+        :height: The number of stored blocks.
+        :read_only: Whether the store is only read (e.g. while the node which
+        owns it is running). Nothing is changed then, not even a partially
+        written last record, it's just left out.
+    """
+
+    def __init__(self, node_id, segment_blocks=constants.SEGMENT_BLOCKS,
+                 sync_every=constants.SYNC_EVERY, read_only=False):
+        self.directory = 'blockchain-{}'.format(node_id)
+        self.segment_blocks = segment_blocks
+        self.sync_every = sync_every
+        self.read_only = read_only
+        self.height = 0
+        self.__unsynced = 0
+        if not read_only:
+            os.makedirs(self.directory, exist_ok=True)
+        self.__recover()
+
+    def append_block(self, block):
+        """Append a block record to the last segment.
+
+        Arguments:
+            :block: The block as a dictionary.
+        """
+        self.__check_writable()
+        segment, position = divmod(self.height, self.segment_blocks)
+        payload = codec.encode_block(block)
+        self.__unsynced += 1
+        sync = self.__unsynced >= self.sync_every
+        with open(self.__log_path(segment), mode='ab') as log:
+            offset = log.tell()
+            log.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            log.write(payload)
+            log.flush()
+            if sync:
+                os.fsync(log.fileno())
+        with open(self.__index_path(segment), mode='ab') as index:
+            index.write(INDEX_ENTRY.pack(offset))
+            index.flush()
+            if sync:
+                os.fsync(index.fileno())
+        if sync:
+            self.__unsynced = 0
+        self.height += 1
+
+    def sync(self):
+        """Fsync the last segment (and its index) to disk."""
+        if self.height == 0:
+            return
+        segment = (self.height - 1) // self.segment_blocks
+        for path in (self.__log_path(segment), self.__index_path(segment)):
+            with open(path, mode='ab') as f:
+                os.fsync(f.fileno())
+        self.__unsynced = 0
+
+    def read_block(self, index):
+        """Return the block at the given index as a dictionary."""
+        if not 0 <= index < self.height:
+            raise IndexError('block index out of range')
+        segment, position = divmod(index, self.segment_blocks)
+        with open(self.__index_path(segment), mode='rb') as f:
+            f.seek(position * INDEX_ENTRY.size)
+            offset = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0]
+        with open(self.__log_path(segment), mode='rb') as log:
+            log.seek(offset)
+            return self.__decode(self.__read_record(log))
+
+    def read_blocks(self, start=0, headers_only=False):
+        """Yield the blocks from the given index up to the last one as
+        dictionaries.
+
+        Arguments:
+            :start: The index of the first block.
+            :headers_only: Whether the transactions are skipped (the blocks
+            are returned with an empty list of transactions).
+        """
+        if start >= self.height:
+            return
+        index = start
+        segment, position = divmod(start, self.segment_blocks)
+        while index < self.height:
+            with open(self.__index_path(segment), mode='rb') as f:
+                f.seek(position * INDEX_ENTRY.size)
+                offset = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0]
+            with open(self.__log_path(segment), mode='rb') as log:
+                log.seek(offset)
+                while position < self.segment_blocks and index < self.height:
+                    yield self.__decode(self.__read_record(log), headers_only)
+                    position += 1
+                    index += 1
+            segment += 1
+            position = 0
+
+    def truncate(self, height):
+        """Drop all blocks from the given index onwards."""
+        self.__check_writable()
+        if height >= self.height:
+            return
+        segment, position = divmod(height, self.segment_blocks)
+        last_segment = (self.height - 1) // self.segment_blocks
+        for dropped in range(segment + 1, last_segment + 1):
+            os.remove(self.__log_path(dropped))
+            os.remove(self.__index_path(dropped))
+        offsets = self.__read_index(segment)
+        self.__truncate_segment(segment, offsets[:position],
+                                offsets[position] if position < len(offsets) else 0)
+        self.height = height
+
+    def load_open_transactions(self):
+        """Return the stored open transactions as dictionaries."""
+        return self.__load_json('mempool.json')
+
+    def save_open_transactions(self, open_transactions):
+        """Replace the stored open transactions.
+
+        Arguments:
+            :open_transactions: The open transactions as dictionaries.
+        """
+        self.__save_json('mempool.json', open_transactions)
+
+    def load_checkpoint(self):
+        """Return the stored checkpoint as a dictionary (None if there is
+        none)."""
+        return self.__load_json('checkpoint.json') or None
+
+    def save_checkpoint(self, checkpoint):
+        """Replace the stored checkpoint.
+
+        Arguments:
+            :checkpoint: The checkpoint as a dictionary.
+        """
+        self.__save_json('checkpoint.json', checkpoint)
+
+    def load_peer_nodes(self):
+        """Return the stored peer nodes."""
+        return self.__load_json('peers.json')
+
+    def save_peer_nodes(self, peer_nodes):
+        """Replace the stored peer nodes.
+
+        Arguments:
+            :peer_nodes: The list of peer node URLs.
+        """
+        self.__save_json('peers.json', peer_nodes)
+
+    def __recover(self):
+        """Find the stored height, truncating every segment to its last valid
+        record (and dropping the segments after an incomplete one)."""
+        segment = 0
+        while os.path.exists(self.__log_path(segment)):
+            offsets = self.__read_index(segment)
+            if not self.__is_intact(segment, offsets):
+                scanned, end = self.__scan_segment(segment)
+                if self.read_only:
+                    # Records whose index entry isn't written yet are left out
+                    offsets = scanned[:len(offsets)]
+                else:
+                    offsets = scanned
+                    self.__truncate_segment(segment, offsets, end)
+            self.height += len(offsets)
+            if len(offsets) < self.segment_blocks:
+                if not self.read_only:
+                    self.__drop_segments_from(segment + 1)
+                break
+            segment += 1
+
+    def __check_writable(self):
+        if self.read_only:
+            raise IOError('the block store is opened read-only')
+
+    def __is_intact(self, segment, offsets):
+        """Check that the index matches the log without reading every
+        record."""
+        size = os.path.getsize(self.__log_path(segment))
+        if not offsets:
+            return size == 0
+        with open(self.__log_path(segment), mode='rb') as log:
+            log.seek(offsets[-1])
+            header = log.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return False
+        length = RECORD_HEADER.unpack(header)[0]
+        return offsets[-1] + RECORD_HEADER.size + length == size
+
+    def __scan_segment(self, segment):
+        """Return the offsets of the valid records of a segment and the end of
+        the last one."""
+        offsets = []
+        end = 0
+        with open(self.__log_path(segment), mode='rb') as log:
+            while len(offsets) < self.segment_blocks:
+                try:
+                    self.__read_record(log)
+                except ValueError:
+                    break
+                offsets.append(end)
+                end = log.tell()
+        return offsets, end
+
+    def __truncate_segment(self, segment, offsets, end):
+        with open(self.__log_path(segment), mode='r+b') as log:
+            log.truncate(end)
+            os.fsync(log.fileno())
+        with open(self.__index_path(segment), mode='wb') as index:
+            index.write(b''.join(INDEX_ENTRY.pack(offset) for offset in offsets))
+            os.fsync(index.fileno())
+
+    def __drop_segments_from(self, segment):
+        while os.path.exists(self.__log_path(segment)):
+            os.remove(self.__log_path(segment))
+            if os.path.exists(self.__index_path(segment)):
+                os.remove(self.__index_path(segment))
+            segment += 1
+
+    def __read_index(self, segment):
+        try:
+            with open(self.__index_path(segment), mode='rb') as f:
+                content = f.read()
+        except IOError:
+            return []
+        # a partially written entry is ignored
+        count = len(content) // INDEX_ENTRY.size
+        return [INDEX_ENTRY.unpack_from(content, i * INDEX_ENTRY.size)[0]
+                for i in range(count)]
+
+    @staticmethod
+    def __read_record(log):
+        """Read the record at the current position of the log, raising
+        ValueError if it's incomplete or corrupted."""
+        header = log.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            raise ValueError('incomplete record header')
+        length, checksum = RECORD_HEADER.unpack(header)
+        payload = log.read(length)
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            raise ValueError('corrupted record')
+        return payload
+
+    @staticmethod
+    def __decode(payload, headers_only=False):
+        # Records written before the binary format are JSON
+        if not codec.is_binary(payload):
+            block = json.loads(payload)
+        elif headers_only:
+            block = codec.decode_block_header(payload)
+        else:
+            return codec.decode_block(payload)
+        if headers_only:
+            block['transactions'] = []
+        return block
+
+    def __load_json(self, name):
+        try:
+            with open(os.path.join(self.directory, name), mode='r') as f:
+                return json.loads(f.read())
+        except (IOError, ValueError):
+            return []
+
+    def __save_json(self, name, content):
+        self.__check_writable()
+        # write a temporary file first, so a crash never leaves half a file
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', mode='w') as f:
+            f.write(json.dumps(content))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def __log_path(self, segment):
+        return os.path.join(self.directory, 'blocks-{:05d}.log'.format(segment))
+
+    def __index_path(self, segment):
+        return os.path.join(self.directory, 'blocks-{:05d}.idx'.format(segment))
@@ -0,0 +1,92 @@
+"""Provides the assembly of the transactions of a block to be mined."""
+
+import json
+from time import time
+
+import utility.constants as constants
+from utility.hash_util import merkle_root
+from utility.verification import Verification
+from transaction import Transaction
+
+
+class BlockTemplate:
+    """The transactions selected for the next block, with the serialized
+    proof of work prefix, so they are not rebuilt for every mining attempt.
+
+    Attributes:
+        :previous_hash: The hash of the block the template builds on.
+        :difficulty: The difficulty the block has to meet.
+        :transactions: The selected transactions (without the reward).
+        :fees: The sum of the fees of the selected transactions.
+        :reward: The mining reward transaction (the last one of the block).
+        :merkle_root: The Merkle root over the selected transactions and the
+        reward.
+        :prefix: The proof of work prefix of the Merkle root and the previous
+        hash.
+        :mempool_version: The version of the open transactions the template
+        was built from.
+    """
+
+    def __init__(self, previous_hash, difficulty, transactions,
+                 mempool_version, reward_address):
+        self.previous_hash = previous_hash
+        self.difficulty = difficulty
+        self.transactions = transactions
+        self.mempool_version = mempool_version
+        self.fees = sum(tx.fee for tx in transactions)
+        # The miner gets the fees of the included transactions on top of the
+        # reward
+        self.reward = Transaction(constants.MINING, reward_address, '',
+                                  constants.MINING_REWARD + self.fees, time())
+        self.merkle_root = merkle_root(transactions + [self.reward])
+        self.prefix = Verification.merkle_proof_prefix(self.merkle_root,
+                                                       previous_hash)
+
+    def is_current(self, previous_hash, mempool):
+        """Check whether the template still matches the chain tip and the open
+        transactions."""
+        return (self.previous_hash == previous_hash and
+                self.mempool_version == mempool.version)
+
+    @staticmethod
+    def assemble(mempool, get_confirmed_balance, previous_hash, difficulty,
+                 reward_address,
+                 max_transactions=constants.BLOCK_MAX_TRANSACTIONS,
+                 max_bytes=constants.BLOCK_MAX_BYTES):
+        """Select the open transactions for the next block.
+
+        Transactions with higher fees come first, then older ones. A
+        transaction is skipped if it doesn't fit into the block or its sender
+        can't afford it on top of the sender's transactions selected before.
+        The signatures aren't checked again, every open transaction was
+        checked when it was admitted.
+
+        Arguments:
+            :mempool: The open transactions.
+            :get_confirmed_balance: Returns the balance of an address over the
+            blocks of the chain.
+            :previous_hash: The hash of the current last block.
+            :difficulty: The difficulty the block has to meet.
+            :reward_address: The address the mining reward goes to.
+            :max_transactions: The maximal number of transactions.
+            :max_bytes: The maximal size of the serialized transactions.
+        """
+        # The open transactions are ordered by age, sorting is stable
+        candidates = sorted(mempool.transactions(), key=lambda tx: -tx.fee)
+        selected = []
+        spent = {}
+        size = 0
+        for tx in candidates:
+            if len(selected) >= max_transactions:
+                break
+            tx_size = len(json.dumps(tx.to_dict()))
+            if size + tx_size > max_bytes:
+                continue
+            cost = tx.amount + tx.fee
+            if spent.get(tx.sender_id, 0) + cost > get_confirmed_balance(tx.sender):
+                continue
+            spent[tx.sender_id] = spent.get(tx.sender_id, 0) + cost
+            size += tx_size
+            selected.append(tx)
+        return BlockTemplate(previous_hash, difficulty, selected,
+                             mempool.version, reward_address)
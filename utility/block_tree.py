@@ -0,0 +1,158 @@
+"""Provides an index of all known blocks, including competing branches."""
+
+from collections import OrderedDict
+
+import utility.constants as constants
+from utility.difficulty import block_work
+
+
+class BlockTree:
+    """Indexes the blocks we know by their hash: the blocks of our chain,
+    the blocks of side branches (which may still overtake it) and orphan
+    blocks, whose parent we don't know yet.
+
+    Every block of the tree knows the cumulative work of the branch it ends,
+    so the best tip can be chosen by work instead of by length.
+
+    Attributes:
+        :max_orphans: The maximal number of orphan blocks, the oldest ones
+        are dropped first.
+        :max_depth: Side blocks more than this many blocks below the tip are
+        dropped.
+        :entries (private): The block and cumulative work by block hash.
+        :side (private): The index of every block which isn't part of our
+        chain by its hash.
+        :orphans (private): The orphan blocks by their hash, oldest first.
+    """
+
+    def __init__(self, max_orphans=constants.MAX_ORPHAN_BLOCKS,
+                 max_depth=constants.MAX_BRANCH_DEPTH):
+        self.max_orphans = max_orphans
+        self.max_depth = max_depth
+        self.__entries = {}
+        self.__side = {}
+        self.__orphans = OrderedDict()
+
+    def __contains__(self, block_hash):
+        return block_hash in self.__entries or block_hash in self.__orphans
+
+    def get(self, block_hash):
+        """Return the (connected) block with the given hash, None if it's
+        unknown."""
+        entry = self.__entries.get(block_hash)
+        return entry[0] if entry else None
+
+    def work(self, block_hash):
+        """Return the cumulative work up to the block with the given hash,
+        None if it's unknown."""
+        entry = self.__entries.get(block_hash)
+        return entry[1] if entry else None
+
+    def reset(self, chain):
+        """Index the blocks of a chain (dropping all other blocks)."""
+        self.__entries = {}
+        self.__side = {}
+        self.__orphans.clear()
+        work = 0
+        for block in chain:
+            work += block_work(block)
+            self.__entries[block.hash] = (block, work)
+
+    def extend(self, block):
+        """Index a block which was appended to our chain."""
+        self.__entries[block.hash] = (block, self.__parent_work(block) +
+                                      block_work(block))
+        self.prune(block.index + 1)
+
+    def connect(self, block):
+        """Index a block whose parent is known as a side block, together
+        with the orphans which descend from it. Returns the blocks which
+        were connected."""
+        connected = []
+        waiting = [block]
+        while waiting:
+            block = waiting.pop()
+            self.__entries[block.hash] = (block, self.__parent_work(block) +
+                                          block_work(block))
+            self.__side[block.hash] = block.index
+            connected.append(block)
+            waiting.extend(self.__take_orphans(block))
+        return connected
+
+    def connect_orphans(self, parent):
+        """Connect the orphans which descend from a block (e.g. one which was
+        appended to our chain) as side blocks and return them."""
+        connected = []
+        for block in self.__take_orphans(parent):
+            connected.extend(self.connect(block))
+        return connected
+
+    def add_orphan(self, block):
+        """Keep a block whose parent is unknown until the parent arrives."""
+        self.__orphans[block.hash] = block
+        while len(self.__orphans) > self.max_orphans:
+            self.__orphans.popitem(last=False)
+
+    def remove(self, blocks):
+        """Drop blocks (e.g. the blocks of an invalid branch)."""
+        for block in blocks:
+            self.__entries.pop(block.hash, None)
+            self.__side.pop(block.hash, None)
+
+    def branch(self, tip_hash, chain):
+        """Return the index where the branch ending in the given block forks
+        off our chain and the blocks of the branch after the fork (None if
+        the branch can't be followed back to our chain).
+
+        Arguments:
+            :tip_hash: The hash of the last block of the branch.
+            :chain: Our chain.
+        """
+        blocks = []
+        block = self.get(tip_hash)
+        while not (block.index < len(chain) and chain[block.index].hash == block.hash):
+            blocks.append(block)
+            block = self.get(block.previous_hash)
+            if block is None:
+                return None
+        blocks.reverse()
+        return block.index + 1, blocks
+
+    def switch(self, displaced, blocks, height):
+        """Record a reorganisation: the displaced blocks of our chain become
+        side blocks, the applied ones part of our chain. Side blocks too far
+        below the new height are dropped.
+
+        Arguments:
+            :displaced: The blocks which were rolled back.
+            :blocks: The blocks which were applied.
+            :height: The height of our chain after the reorganisation.
+        """
+        for block in displaced:
+            self.__side[block.hash] = block.index
+        for block in blocks:
+            self.__entries[block.hash] = (block, self.__parent_work(block) +
+                                          block_work(block))
+            self.__side.pop(block.hash, None)
+        self.prune(height)
+
+    def prune(self, height):
+        """Drop the side blocks more than max_depth blocks below the
+        height."""
+        for block_hash, index in list(self.__side.items()):
+            if index < height - self.max_depth:
+                del self.__side[block_hash]
+                del self.__entries[block_hash]
+
+    def __parent_work(self, block):
+        entry = self.__entries.get(block.previous_hash)
+        return entry[1] if entry else 0
+
+    def __take_orphans(self, parent):
+        """Remove the orphans whose parent is the given block and return the
+        ones which follow it (orphans claiming another index are dropped)."""
+        children = [block for block in self.__orphans.values()
+                    if block.previous_hash == parent.hash]
+        for block in children:
+            del self.__orphans[block.hash]
+        return [block for block in children if block.index == parent.index + 1]
@@ -1,48 +1,67 @@
-import requests
-from block import Block
+import utility.constants as constants
+from utility import codec
+from block import Block, valid_transaction_fields
 from transaction import Transaction
+from utility.broadcaster import Broadcaster
+from utility.gossip import Gossip
+from utility.hash_util import hash_transaction
 from utility.verification import Verification
 from wallet import Wallet
 
-def broadcast_transaction(peer_nodes, transaction):
-    for node in peer_nodes:
-        url = 'http://{}/broadcast-transaction'.format(node)
-        try:
-            response = requests.post(url,
-                                        json={
-                                            'sender': transaction.sender,
-                                            'recipient': transaction.recipient,
-                                            'amount': transaction.amount,
-                                            'signature': transaction.signature,
-                                            'time': transaction.time
-                                        })
-            if (response.status_code == 400 or response.status_code == 500):
-                print('Transaction declined, needs resolving')
-                return False
-        except requests.exceptions.ConnectionError:
-            print('broadcast_transaction: connection error')
-            continue
-    return True
-        
+# Shared by all broadcasts, so every peer keeps one keep-alive session
+broadcaster = Broadcaster()
+# Decides which peers a block or transaction is relayed to
+gossip = Gossip()
+
+
+def broadcast_transactions(peer_nodes, transactions, sources=None):
+    """Relay a batch of transactions (without waiting for the answers). Each
+    transaction goes to its own gossip targets, every peer gets one message
+    with the transactions picked for it.
+
+    Arguments:
+        :peer_nodes: The connected peer nodes.
+        :transactions: The transactions to relay.
+        :sources: The peer each transaction came from (None for the ones
+        created by this node).
+    """
+    if sources is None:
+        sources = [None] * len(transactions)
+    by_peer = {}
+    for transaction, source in zip(transactions, sources):
+        tx_id = hash_transaction(transaction)
+        gossip.mark_seen(tx_id)
+        for node in gossip.targets(peer_nodes, tx_id, source):
+            by_peer.setdefault(node, []).append(transaction.to_dict())
+    for node, dict_transactions in by_peer.items():
+        broadcaster.post([node], '/broadcast-transactions',
+                         {'transactions': dict_transactions}, wait=False,
+                         binary_payload=codec.encode_transactions(dict_transactions))
 
 
 def broadcast_block(peer_nodes, block):
-    resolve_conflicts = False
-    for node in peer_nodes:
-        url = 'http://{}/broadcast-block'.format(node)
-        converted_block = block.__dict__.copy()
-        converted_block['transactions'] = [
-            tx.__dict__ for tx in converted_block['transactions']]
-        try:
-            response = requests.post(url, json={'block': converted_block})
-            if response.status_code == 400 or response.status_code == 500:
-                print('Block declined, needs resolving')
-            if response.status_code == 409:
-                resolve_conflicts = True
-        except requests.exceptions.ConnectionError:
-            print('broadcast_block: connection error')
-            continue
-    return block , resolve_conflicts
+    forward_block(peer_nodes, block.to_dict(), block.hash)
+    return block
+
+
+def forward_block(peer_nodes, block, block_hash, source=None):
+    """Relay a block (as a dictionary) to its gossip targets (without waiting
+    for the answers). Blocks which were relayed before aren't sent again. A
+    peer which can't attach the block syncs with its own peers.
+
+    Arguments:
+        :peer_nodes: The connected peer nodes.
+        :block: The block as a dictionary.
+        :block_hash: The hash of the block (its message id).
+        :source: The peer the block came from (None if it was mined by this
+        node).
+    """
+    gossip.learned(source, block_hash)
+    if not gossip.mark_seen(block_hash):
+        return
+    broadcaster.post(gossip.targets(peer_nodes, block_hash, source),
+                     '/broadcast-block', {'block': block}, wait=False,
+                     binary_payload=codec.encode_block(block))
 
 
 
@@ -51,19 +70,15 @@ def broadcast_block(peer_nodes, block):
 # for when 2 nodes connect so they will know each others previous transactions
 def broadcast_open_transactions(peer_nodes, open_transactions):
     transactionSet = set(open_transactions)
-    for node in peer_nodes:
-        url = 'http://{}/transactions'.format(node)
-        try:
-            # Send a request and store the response
-            response = requests.get(url)
-            # Retrieve the JSON data as a dictionary
-            nodeTransactionList = response.json()
-            # Convert the json 
-            node_tx = [Transaction.to_transaction_from_dict(tx) for tx in nodeTransactionList]
-            transactionSet = transactionSet.union(set(node_tx))
-
-        except requests.exceptions.ConnectionError:
+    for response in broadcaster.get(peer_nodes, '/transactions', binary=True).values():
+        if response is None:
             continue
+        # Retrieve the JSON (or binary) data as a dictionary
+        nodeTransactionList = decode_response(response, codec.decode_transactions)
+        # Convert the json 
+        node_tx = [Transaction.to_transaction_from_dict(tx) for tx in nodeTransactionList
+                   if valid_transaction_fields(tx)]
+        transactionSet = transactionSet.union(set(node_tx))
     return list(transactionSet)
     
 
@@ -73,39 +88,32 @@ def broadcast_chain(peer_nodes, selfChain,open_transactions, replace = False):
     # Initialize the winner chain with the local chain
     winner_chain = selfChain
     winner_open_transactions = open_transactions
-    for node in peer_nodes:
-        url = 'http://{}/chain'.format(node)
+    for node, response in broadcaster.get(peer_nodes, '/chain', binary=True).items():
+        if response is None:
+            continue
+        # Retrieve the JSON (or binary) data as a dictionary
+        node_chain = decode_response(response, codec.decode_blocks)
+        # Convert the dictionary list to a list of block AND
+        # transaction objects
         try:
-            # Send a request and store the response
-            response = requests.get(url)
-            # Retrieve the JSON data as a dictionary
-            node_chain = response.json()
-            # Convert the dictionary list to a list of block AND
-            # transaction objects
-            node_chain = [Block(block['index'], block['previous_hash'],
-                    [Transaction.to_transaction_from_dict(tx)
-                    for tx in block['transactions']],
-                    block['proof'],
-                    block['timestamp']) for block in node_chain
-            ]
-            node_chain_length = len(node_chain)
-            local_chain_length = len(winner_chain)
-            # Store the received chain as the current winner chain if it's
-            # longer AND valid
-            if (node_chain_length > local_chain_length and
-                    Verification.verify_chain(node_chain)):
-                winner_chain = node_chain
-                url = 'http://{}/transactions'.format(node)
-                try:
-                    response = requests.get(url)
-                    open_tx = response.json()
-                    open_tx = [Transaction.to_transaction_from_dict(tx) for tx in open_tx]
-                    winner_open_transactions = open_tx
-                except requests.exceptions.ConnectionError:
-                    continue
-                replace = True
-        except requests.exceptions.ConnectionError:
+            node_chain = [Block.convert_from_json(block) for block in node_chain]
+        except ValueError:
             continue
+        node_chain_length = len(node_chain)
+        local_chain_length = len(winner_chain)
+        # Store the received chain as the current winner chain if it's
+        # longer AND valid
+        if (node_chain_length > local_chain_length and
+                Verification.verify_chain(node_chain)):
+            winner_chain = node_chain
+            response = broadcaster.get([node], '/transactions', binary=True)[node]
+            if response is None:
+                continue
+            open_tx = decode_response(response, codec.decode_transactions)
+            open_tx = [Transaction.to_transaction_from_dict(tx) for tx in open_tx
+                       if valid_transaction_fields(tx)]
+            winner_open_transactions = open_tx
+            replace = True
     return winner_chain, winner_open_transactions, replace
 
 
@@ -115,32 +123,103 @@ def broadcast_chain(peer_nodes, selfChain,open_transactions, replace = False):
 
 def broadcast_chain_all_nodes(peer_nodes, selfChain,open_transactions, Blockchain):
     # Initialize the winner chain with the local chain
-    for node in peer_nodes:
-        url = 'http://{}/chain'.format(node)
-        try:
-            converted_chain = Blockchain.prepare_chain_to_json(selfChain)
-            converted_open_transactions = Blockchain.prepare_transactions_List_to_json(open_transactions)
-            response = requests.post(url, json={'chain': converted_chain, 
-                                                'open_tx': converted_open_transactions })
-        except requests.exceptions.ConnectionError:
-            continue 
+    converted_chain = Blockchain.prepare_chain_to_json(selfChain)
+    converted_open_transactions = Blockchain.prepare_transactions_List_to_json(open_transactions)
+    # Nobody waits for the answers, the peers push their chain back if it
+    # differs
+    broadcaster.post(peer_nodes, '/chain', {'chain': converted_chain,
+                                           'open_tx': converted_open_transactions},
+                     wait=False)
     return True
 
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+def sync_chain(peer_nodes, blockchain):
+    """Compare the tips of all peer nodes with ours. Missing blocks are
+    fetched from chains with more work, peers with less work are sent only
+    the blocks after their fork point. Returns True if our chain was
+    replaced."""
+    replaced = False
+    legacy_nodes = []
+    local = blockchain.get_tip()
+    for node, response in broadcaster.get(peer_nodes, '/tip').items():
+        if response is None:
+            continue
+        if response.status_code == 404:
+            # The peer doesn't know the sync protocol yet
+            legacy_nodes.append(node)
+            continue
+        tip = response.json()
+        broadcaster.set_binary(node, codec.CONTENT_TYPE in tip.get('content_types', []))
+        # Peers which don't report the work of their chain are compared by
+        # height
+        if 'work' in tip:
+            ahead = tip['work'] - local['work']
+        else:
+            ahead = tip['height'] - local['height']
+        if ahead > 0:
+            replaced = pull_chain(node, blockchain, tip['height']) or replaced
+            local = blockchain.get_tip()
+        elif ahead < 0:
+            push_chain(node, blockchain, tip['locator'])
+    if legacy_nodes:
+        broadcast_chain_all_nodes(legacy_nodes, blockchain.chain,
+                                  blockchain.get_open_transactions(), blockchain)
+    return replaced
+
+
+def pull_chain(node, blockchain, height):
+    """Fetch the blocks after the fork point from a peer with a longer chain
+    (in ranges of SYNC_BATCH blocks) and apply them. A new node with
+    fast_sync set starts from the peer's checkpoint first."""
+    if (blockchain.fast_sync and blockchain.get_height() == 1 and
+            height > constants.CHECKPOINT_INTERVAL):
+        fetch_checkpoint(node, blockchain)
+    response = broadcaster.post([node], '/fork-point',
+                                {'locator': blockchain.get_locator()})[node]
+    if response is None or response.status_code != 200:
+        return False
+    start = response.json()['index'] + 1
+    blocks = []
+    while start < height:
+        end = min(start + constants.SYNC_BATCH, height)
+        path = '/blocks?from={}&to={}'.format(start, end)
+        response = broadcaster.get([node], path, binary=True)[node]
+        if response is None or response.status_code != 200:
+            return False
+        try:
+            received = [Block.convert_from_json(block) for block in
+                        decode_response(response, codec.decode_blocks)]
+        except ValueError:
+            return False
+        if not received:
+            break
+        blocks.extend(received)
+        start += len(received)
+    return blockchain.apply_blocks(blocks)
+
+
+def fetch_checkpoint(node, blockchain):
+    """Start from the latest checkpoint of a peer, so only the blocks after
+    it are fetched."""
+    response = broadcaster.get([node], '/checkpoint')[node]
+    if response is None or response.status_code != 200:
+        return False
+    return blockchain.load_checkpoint(response.json())
+
+
+def push_chain(node, blockchain, locator):
+    """Send a peer with a shorter chain the blocks after its fork point (at
+    most SYNC_BATCH of them, a peer further behind pulls the rest itself when
+    it syncs)."""
+    fork = blockchain.find_fork_point(locator)
+    blocks = blockchain.prepare_chain_to_json(
+        blockchain.get_blocks(fork + 1, fork + 1 + constants.SYNC_BATCH))
+    broadcaster.post([node], '/blocks', {'blocks': blocks}, wait=False)
+
+
+def decode_response(response, decode_binary):
+    """Return the content of a peer's response, which is binary encoded if
+    the peer understood our request for it and JSON otherwise."""
+    if response.headers.get('Content-Type', '').startswith(codec.CONTENT_TYPE):
+        return decode_binary(response.content)
+    return response.json()
@@ -0,0 +1,127 @@
+"""Provides concurrent delivery of messages to peer nodes."""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import utility.constants as constants
+from utility import codec
+
+
+class Broadcaster:
+    """Sends requests to many peer nodes at once from a pool of threads, so
+    one slow peer doesn't hold up the others.
+
+    Every peer gets its own keep-alive session. The number of queued and
+    running requests is bounded; fire-and-forget requests are dropped when
+    the queue is full.
+
+    Attributes:
+        :workers: The number of sending threads.
+        :timeout: The (connect, read) timeout of a request in seconds.
+        :dropped: The number of fire-and-forget requests dropped because the
+        queue was full.
+        :sent: The number of requests sent.
+        :headers: The headers sent with every request.
+        :binary_peers: The peers which announced they understand the binary
+        encoding (all others are sent JSON).
+    """
+
+    def __init__(self, workers=constants.BROADCAST_WORKERS,
+                 timeout=(constants.BROADCAST_CONNECT_TIMEOUT,
+                          constants.BROADCAST_READ_TIMEOUT),
+                 queue_size=constants.BROADCAST_QUEUE_SIZE):
+        self.workers = workers
+        self.timeout = timeout
+        self.dropped = 0
+        self.sent = 0
+        self.headers = {}
+        self.binary_peers = set()
+        self.__executor = ThreadPoolExecutor(max_workers=workers)
+        self.__slots = BoundedSemaphore(queue_size)
+        self.__sessions = {}
+        self.__lock = Lock()
+
+    def post(self, peer_nodes, path, payload, wait=True, binary_payload=None):
+        """POST a JSON payload to the same path of all peer nodes.
+
+        Returns a dictionary of each node and its response (None if the node
+        couldn't be reached). Returns an empty dictionary right away if wait
+        is False.
+
+        Arguments:
+            :peer_nodes: The nodes to send to.
+            :path: The path of the endpoint, e.g. '/broadcast-block'.
+            :payload: The JSON payload.
+            :wait: Whether to wait for the responses.
+            :binary_payload: The binary encoded payload, sent instead of the
+            JSON one to the peers which understand it.
+        """
+        def request_arguments(node):
+            if binary_payload is not None and node in self.binary_peers:
+                return {'data': binary_payload,
+                        'headers': {'Content-Type': codec.CONTENT_TYPE}}
+            return {'json': payload}
+        return self.__send('post', peer_nodes, path, wait, request_arguments)
+
+    def get(self, peer_nodes, path, binary=False):
+        """GET the same path of all peer nodes and return a dictionary of each
+        node and its response (None if the node couldn't be reached).
+
+        Arguments:
+            :binary: Whether to ask the peers which understand it for a binary
+            encoded response.
+        """
+        def request_arguments(node):
+            if binary and node in self.binary_peers:
+                return {'headers': {'Accept': codec.CONTENT_TYPE}}
+            return {}
+        return self.__send('get', peer_nodes, path, True, request_arguments)
+
+    def set_binary(self, node, binary):
+        """Remember whether a peer understands the binary encoding."""
+        if binary:
+            self.binary_peers.add(node)
+        else:
+            self.binary_peers.discard(node)
+
+    def __send(self, method, peer_nodes, path, wait, request_arguments):
+        futures = {}
+        for node in list(peer_nodes):
+            if wait:
+                self.__slots.acquire()
+            elif not self.__slots.acquire(blocking=False):
+                self.dropped += 1
+                print('broadcast: queue full, dropped message to {}'.format(node))
+                continue
+            self.sent += 1
+            futures[node] = self.__executor.submit(
+                self.__request, method, node, path, **request_arguments(node))
+        if not wait:
+            return {}
+        return {node: future.result() for node, future in futures.items()}
+
+    def __request(self, method, node, path, **kwargs):
+        url = 'http://{}{}'.format(node, path)
+        try:
+            return getattr(self.__session(node), method)(
+                url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            print('broadcast: {} {} failed'.format(method.upper(), url))
+            return None
+        finally:
+            self.__slots.release()
+
+    def __session(self, node):
+        with self.__lock:
+            session = self.__sessions.get(node)
+            if session is None:
+                session = requests.Session()
+                session.headers.update(self.headers)
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=self.workers)
+                session.mount('http://', adapter)
+                self.__sessions[node] = session
+            return session
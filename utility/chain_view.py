@@ -0,0 +1,99 @@
+"""Provides a read-only snapshot of the blockchain."""
+
+
+class ChainSnapshot:
+    """An immutable view on the blocks a chain had when the snapshot was
+    taken.
+
+    Taking a snapshot doesn't copy the blocks. It only remembers the list and
+    its length, which works because the blockchain only ever appends to its
+    list in place (a reorganisation replaces the list instead).
+
+    Attributes:
+        :height: The number of blocks in the snapshot.
+    """
+
+    __slots__ = ('__blocks', '__height')
+
+    def __init__(self, blocks):
+        self.__blocks = blocks
+        self.__height = len(blocks)
+
+    @property
+    def height(self):
+        return self.__height
+
+    @property
+    def tip(self):
+        """The last block of the snapshot."""
+        return self.__blocks[self.__height - 1]
+
+    def block(self, index):
+        """Return the block at the given index."""
+        if not 0 <= index < self.__height:
+            raise IndexError('block index out of range')
+        return self.__blocks[index]
+
+    def blocks(self, start=0, end=None):
+        """Return the blocks from the start index up to (excluding) the end
+        index as a list."""
+        start, end, _ = slice(start, end).indices(self.__height)
+        return self.__blocks[start:end]
+
+    def iter_blocks(self, start=0, end=None):
+        """Yield the blocks from the start index up to (excluding) the end
+        index."""
+        blocks = self.__blocks
+        for index in range(*slice(start, end).indices(self.__height)):
+            yield blocks[index]
+
+    def index_of(self, block_hash):
+        """Return the index of the block with the given hash (None if the
+        snapshot doesn't hold it). The search starts at the tip, where the
+        blocks peers ask about usually are."""
+        for index in range(self.__height - 1, -1, -1):
+            if self.__blocks[index].hash == block_hash:
+                return index
+        return None
+
+    def __len__(self):
+        return self.__height
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, step = key.indices(self.__height)
+            return self.__blocks[start:end:step]
+        if key < 0:
+            key += self.__height
+        return self.block(key)
+
+    def __iter__(self):
+        return self.iter_blocks()
+
+
+class BranchView:
+    """A branch of the block tree on top of the blocks of the chain it forks
+    off, which can be indexed like a chain (the chain isn't copied), e.g. to
+    find the difficulty the next block of the branch has to meet.
+
+    Attributes:
+        :chain: The chain the branch forks off.
+        :fork: The index of the first block of the branch.
+        :blocks: The blocks of the branch (blocks appended to this list
+        extend the view).
+    """
+
+    def __init__(self, chain, fork, blocks):
+        self.chain = chain
+        self.fork = fork
+        self.blocks = blocks
+
+    def __len__(self):
+        return self.fork + len(self.blocks)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index >= self.fork:
+            return self.blocks[index - self.fork]
+        return self.chain[index]
@@ -0,0 +1,43 @@
+"""Provides checkpoints of the balance state of the chain."""
+
+
+class Checkpoint:
+    """The confirmed balances after the first height blocks of the chain, so
+    a node can start from it instead of replaying the whole chain.
+
+    Attributes:
+        :height: The number of blocks the balances cover.
+        :hash: The hash of the last block the balances cover.
+        :balances: The confirmed balance by address (addresses with a zero
+        balance are left out).
+        :pruned: The number of leading blocks the node holds without their
+        transactions (0 unless it was bootstrapped from a peer's checkpoint).
+    """
+
+    def __init__(self, height, block_hash, balances, pruned=0):
+        self.height = height
+        self.hash = block_hash
+        self.balances = balances
+        self.pruned = pruned
+
+    def matches(self, chain):
+        """Check whether the checkpoint covers a prefix of the given
+        chain."""
+        return (0 < self.height <= len(chain) and
+                chain[self.height - 1].hash == self.hash)
+
+    def to_dict(self):
+        return {'height': self.height,
+                'hash': self.hash,
+                'balances': self.balances,
+                'pruned': self.pruned}
+
+    @staticmethod
+    def from_dict(checkpoint):
+        """Create a checkpoint from its dictionary (None if it's malformed)."""
+        try:
+            return Checkpoint(int(checkpoint['height']), checkpoint['hash'],
+                              dict(checkpoint['balances']),
+                              int(checkpoint.get('pruned', 0)))
+        except (KeyError, TypeError, ValueError):
+            return None
@@ -0,0 +1,208 @@
+"""Provides a compact binary encoding of blocks and transactions.
+
+The encoding works on the same dictionaries the JSON format uses. Keys,
+signatures and hashes travel as raw bytes instead of hex strings, numbers as
+8 byte values (ints and floats are kept apart, so a decoded block hashes
+exactly like the encoded one). Blocks and transactions whose fields are
+missing or have the wrong types are refused (ValueError), so a bad record is
+never written.
+"""
+
+import struct
+
+from block import check_block_fields, check_transaction_fields
+
+# Written first, so binary payloads can be told apart from JSON ones
+FORMAT_VERSION = b'\xb2'
+# Payloads from before Merkle roots (their blocks have no merkle_root field)
+LEGACY_FORMAT_VERSION = b'\xb1'
+
+CONTENT_TYPE = 'application/x-blockchain'
+
+TRANSACTION_FIELDS = ('sender', 'recipient', 'signature', 'amount', 'time', 'fee')
+BLOCK_FIELDS = ('index', 'previous_hash', 'timestamp', 'proof', 'difficulty', 'hash',
+                'merkle_root')
+LEGACY_BLOCK_FIELDS = BLOCK_FIELDS[:-1]
+
+INT64 = struct.Struct('>q')
+FLOAT64 = struct.Struct('>d')
+LENGTH = struct.Struct('>I')
+
+
+def is_binary(payload):
+    """Check whether a payload was encoded by this codec (and isn't JSON)."""
+    return payload[:1] in (FORMAT_VERSION, LEGACY_FORMAT_VERSION)
+
+
+def encode_transactions(transactions):
+    """Encode a list of transaction dictionaries."""
+    out = [FORMAT_VERSION, LENGTH.pack(len(transactions))]
+    for tx in transactions:
+        _write_transaction(out, tx)
+    return b''.join(out)
+
+
+def decode_transactions(payload):
+    """Decode a list of transaction dictionaries."""
+    reader = _Reader(payload)
+    return [_read_transaction(reader) for _ in range(reader.length())]
+
+
+def encode_block(block):
+    """Encode a block dictionary."""
+    out = [FORMAT_VERSION]
+    _write_block(out, block)
+    return b''.join(out)
+
+
+def decode_block(payload):
+    """Decode a block dictionary."""
+    return _read_block(_Reader(payload))
+
+
+def decode_block_header(payload):
+    """Decode the header fields (and hash) of a block dictionary, skipping
+    its transactions."""
+    reader = _Reader(payload)
+    return _read_fields(reader, reader.block_fields)
+
+
+def encode_blocks(blocks):
+    """Encode a list of block dictionaries."""
+    return b''.join(iter_encode_blocks(blocks, len(blocks)))
+
+
+def iter_encode_blocks(blocks, count):
+    """Encode block dictionaries one at a time, e.g. to stream them. The
+    result joined equals encode_blocks.
+
+    Arguments:
+        :blocks: An iterable of count block dictionaries.
+        :count: The number of blocks.
+    """
+    yield FORMAT_VERSION + LENGTH.pack(count)
+    for block in blocks:
+        out = []
+        _write_block(out, block)
+        yield b''.join(out)
+
+
+def decode_blocks(payload):
+    """Decode a list of block dictionaries."""
+    reader = _Reader(payload)
+    return [_read_block(reader) for _ in range(reader.length())]
+
+
+def _write_block(out, block):
+    check_block_fields(block)
+    for field in BLOCK_FIELDS:
+        _write_value(out, block.get(field))
+    out.append(LENGTH.pack(len(block['transactions'])))
+    for tx in block['transactions']:
+        _write_transaction(out, tx)
+
+
+def _read_block(reader):
+    block = _read_fields(reader, reader.block_fields)
+    block['transactions'] = [_read_transaction(reader)
+                             for _ in range(reader.length())]
+    return block
+
+
+def _write_transaction(out, tx):
+    check_transaction_fields(tx)
+    for field in TRANSACTION_FIELDS:
+        _write_value(out, tx.get(field))
+
+
+def _read_transaction(reader):
+    return _read_fields(reader, TRANSACTION_FIELDS)
+
+
+def _read_fields(reader, fields):
+    values = {}
+    for field in fields:
+        value = reader.value()
+        # Fields missing in the encoded dictionary stay missing
+        if value is not None:
+            values[field] = value
+    return values
+
+
+def _write_value(out, value):
+    """Write a tagged value: n(one), i(nt), I (big int), f(loat), h(ex
+    string as raw bytes) or s(tring)."""
+    if value is None:
+        out.append(b'n')
+    elif isinstance(value, bool):
+        raise TypeError('booleans are not supported')
+    elif isinstance(value, int):
+        if -2 ** 63 <= value < 2 ** 63:
+            out.append(b'i' + INT64.pack(value))
+        else:
+            _write_bytes(out, b'I', str(value).encode())
+    elif isinstance(value, float):
+        out.append(b'f' + FLOAT64.pack(value))
+    elif isinstance(value, str):
+        if _is_hex(value):
+            _write_bytes(out, b'h', bytes.fromhex(value))
+        else:
+            _write_bytes(out, b's', value.encode('utf8'))
+    else:
+        raise TypeError('can not encode {}'.format(type(value).__name__))
+
+
+def _write_bytes(out, tag, data):
+    out.append(tag + LENGTH.pack(len(data)))
+    out.append(data)
+
+
+def _is_hex(value):
+    # Only strings which decode and re-encode to the same text are packed
+    if len(value) % 2 != 0:
+        return False
+    try:
+        return bytes.fromhex(value).hex() == value
+    except ValueError:
+        return False
+
+
+class _Reader:
+    """Reads tagged values from an encoded payload."""
+
+    def __init__(self, payload):
+        if not is_binary(payload):
+            raise ValueError('not a binary payload')
+        self.payload = payload
+        self.position = 1
+        if payload[:1] == LEGACY_FORMAT_VERSION:
+            self.block_fields = LEGACY_BLOCK_FIELDS
+        else:
+            self.block_fields = BLOCK_FIELDS
+
+    def read(self, size):
+        data = self.payload[self.position:self.position + size]
+        if len(data) < size:
+            raise ValueError('truncated payload')
+        self.position += size
+        return data
+
+    def length(self):
+        return LENGTH.unpack(self.read(LENGTH.size))[0]
+
+    def value(self):
+        tag = self.read(1)
+        if tag == b'n':
+            return None
+        if tag == b'i':
+            return INT64.unpack(self.read(INT64.size))[0]
+        if tag == b'f':
+            return FLOAT64.unpack(self.read(FLOAT64.size))[0]
+        data = self.read(self.length())
+        if tag == b'h':
+            return data.hex()
+        if tag == b's':
+            return data.decode('utf8')
+        if tag == b'I':
+            return int(data.decode())
+        raise ValueError('unknown tag {!r}'.format(tag))
@@ -1,8 +1,144 @@
 
+import os
+
 MINING_REWARD = 10
 
 MINING = 'MINING'
 
+# The difficulty of the genesis block (a proof digest must be below
+# 2 ** 256 / difficulty, 256 means one leading zero byte)
+INITIAL_DIFFICULTY = 256
+
+# The number of seconds a block should take to be mined on average
+TARGET_BLOCK_TIME = 10
+
+# The number of blocks after which the difficulty is retargeted
+DIFFICULTY_ADJUSTMENT_INTERVAL = 10
+
+# The maximal factor the difficulty changes by in one retargeting
+MAX_DIFFICULTY_ADJUSTMENT = 4
+
+# A block's timestamp has to be later than the median timestamp of the
+# MEDIAN_TIME_BLOCKS blocks before it, and at most MAX_FUTURE_BLOCK_TIME
+# seconds ahead of our clock (the retargeting trusts the timestamps)
+MEDIAN_TIME_BLOCKS = 11
+MAX_FUTURE_BLOCK_TIME = 30
+
+# The number of blocks stored per segment of the block store
+SEGMENT_BLOCKS = 1000
+
+# The number of appended blocks after which the block store is fsynced
+SYNC_EVERY = 16
+
+# The number of processes sharing the proof of work nonce space
+MINING_PROCESSES = os.cpu_count() or 1
+
+# The number of proofs a mining process tests between checks for cancellation
+MINING_BATCH = 2000
+
+# How the mining and verifying processes are started. They are spawned
+# rather than forked: a forked child inherits the locks other threads of the
+# node hold at that moment (e.g. the key cache's) and deadlocks on them
+MULTIPROCESSING_START_METHOD = 'spawn'
+
+# The number of processes verifying transaction signatures in parallel
+VERIFY_PROCESSES = os.cpu_count() or 1
+
+# Batches with fewer signatures are verified without the process pool
+VERIFY_MIN_BATCH = 200
+
+# The number of parsed public keys kept for signature verification
+KEY_CACHE_SIZE = 1024
+
+# The maximal number of open transactions (the oldest ones are evicted)
+MEMPOOL_MAX_SIZE = 5000
+
+# The number of seconds an open transaction may wait to be mined
+MEMPOOL_MAX_AGE = 3 * 60 * 60
+
+# The maximal number of transactions in a block (without the reward)
+BLOCK_MAX_TRANSACTIONS = 1000
+
+# The maximal size of the serialized transactions of a block in bytes
+BLOCK_MAX_BYTES = 1000000
+
+# The number of threads sending messages to peer nodes
+BROADCAST_WORKERS = 16
+
+# The timeouts (in seconds) for connecting to and hearing back from a peer
+BROADCAST_CONNECT_TIMEOUT = 1
+BROADCAST_READ_TIMEOUT = 5
+
+# The maximal number of queued and running messages to peer nodes
+BROADCAST_QUEUE_SIZE = 256
+
+# The number of peers a block or transaction is relayed to
+GOSSIP_FANOUT = 8
+
+# The number of block and transaction ids a node remembers (to relay each
+# one only once), and for how many seconds
+GOSSIP_SEEN_SIZE = 100000
+GOSSIP_SEEN_TTL = 60 * 60
+
+# The number of ids remembered per peer (the ones it's known to have)
+GOSSIP_INVENTORY_SIZE = 10000
+
+# The maximal number of blocks requested from a peer at once while syncing
+SYNC_BATCH = 500
+
+# The number of most recent blocks listed one by one in a block locator
+# (further back the gaps between the listed blocks double)
+LOCATOR_DENSE_BLOCKS = 10
+
+# The number of blocks received before their parent which are kept until
+# the parent arrives
+MAX_ORPHAN_BLOCKS = 100
+
+# The minimal number of seconds between two syncs with the peers started by
+# orphan blocks (anyone can send orphans, so they mustn't each start one)
+ORPHAN_SYNC_INTERVAL = 10
+
+# The results of adding a received block (an invalid one gives False): it
+# was added to our chain, we hold it already (on any branch or as an
+# orphan), or it was kept as a side block or orphan
+BLOCK_ADDED = 'added'
+BLOCK_KNOWN = 'known'
+BLOCK_KEPT = 'kept'
+
+# Side branches forking off further back than this many blocks from the
+# tip are dropped
+MAX_BRANCH_DEPTH = 100
+
+# A checkpoint of the balances is written every CHECKPOINT_INTERVAL blocks,
+# MAX_BRANCH_DEPTH blocks below the tip (so no reorganisation reaches it)
+CHECKPOINT_INTERVAL = 1000
+
+# The number of transactions of an address history returned by default, and
+# at most
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+# The number of addresses listed per ranking of the analytics (rich list,
+# volume, miners) by default
+ANALYTICS_TOP = 10
+
+# The number of threads serving requests
+SERVER_THREADS = 16
+
+# The number of finished mining jobs whose status can still be fetched
+MINING_JOB_HISTORY = 100
+
+# The number of transactions waiting to be validated, further ones are
+# refused until the queue drains
+INGEST_QUEUE_SIZE = 10000
+
+# The maximal number of queued transactions validated (and saved and relayed)
+# together
+INGEST_BATCH = 500
+
+# The seconds a request waits for its transactions to be validated
+INGEST_TIMEOUT = 5
+
 
 
 '''Successful responses 2xx'''
@@ -26,6 +162,13 @@ The request has been received but not yet acted upon. It is noncommittal,
 STATUS_202 = 202
 
 
+'''Redirection messages 3xx'''
+
+'''304 Not Modified
+This is used for caching purposes. It tells the client that the response has not been modified,
+ so the client can continue to use the same cached version of the response.
+'''
+STATUS_304 = 304
 
 
 '''Client error responses 4xx'''
@@ -44,6 +187,12 @@ Although the HTTP standard specifies "unauthorized", semantically this response
 STATUS_401 = 401
 
 
+'''
+404 Not Found
+The server can not find the requested resource.
+'''
+STATUS_404 = 404
+
 
 '''
 409 Conflict
@@ -65,15 +214,7 @@ The request method is not supported by the server and cannot be handled.
 '''
 STATUS_501 = 501
 
-
-
-
-
-
-
-
-
-
-
-
-
+'''503 Service Unavailable
+The server is not ready to handle the request. Common causes are a server that is down for maintenance or that is overloaded.
+'''
+STATUS_503 = 503
@@ -0,0 +1,78 @@
+"""Provides the proof of work difficulty and its retargeting."""
+
+import utility.constants as constants
+
+# A proof is valid if its digest (as a number) is below MAX_TARGET / difficulty
+MAX_TARGET = 2 ** 256
+
+
+def target(difficulty):
+    """Return the numeric target a proof of work digest has to be below.
+
+    Arguments:
+        :difficulty: The difficulty stored in the block header.
+    """
+    return MAX_TARGET // difficulty
+
+
+def block_work(block):
+    """Return the work a block proves: the expected number of hashes needed
+    to find its proof (MAX_TARGET / target, i.e. its difficulty)."""
+    return MAX_TARGET // target(block.difficulty)
+
+
+def block_interval(chain, window=constants.DIFFICULTY_ADJUSTMENT_INTERVAL):
+    """Return the average time between the last blocks of a chain (None if
+    there are not enough blocks yet). The genesis block is skipped, it has no
+    real timestamp.
+
+    Arguments:
+        :chain: The chain whose blocks are measured.
+        :window: The number of intervals averaged.
+    """
+    window = min(window, len(chain) - 2)
+    if window < 1:
+        return None
+    return (chain[-1].timestamp - chain[-1 - window].timestamp) / window
+
+
+def median_time_past(chain, index=None, window=constants.MEDIAN_TIME_BLOCKS):
+    """Return the median timestamp of the blocks before the given index (by
+    default the next block of the chain).
+
+    Arguments:
+        :chain: The chain (or a view of a branch) the block is part of.
+        :index: The index of the block.
+        :window: The number of blocks before it taken into account.
+    """
+    if index is None:
+        index = len(chain)
+    timestamps = sorted(chain[i].timestamp
+                        for i in range(max(index - window, 0), index))
+    return timestamps[len(timestamps) // 2]
+
+
+def next_difficulty(chain, index=None):
+    """Return the difficulty required for the block at the given index (by
+    default the next block of the chain).
+
+    The difficulty is retargeted every DIFFICULTY_ADJUSTMENT_INTERVAL blocks
+    from the time the previous interval took, so blocks are found every
+    TARGET_BLOCK_TIME seconds on average.
+
+    Arguments:
+        :chain: The chain the block is added to.
+        :index: The index of the block.
+    """
+    if index is None:
+        index = len(chain)
+    interval = constants.DIFFICULTY_ADJUSTMENT_INTERVAL
+    previous = chain[index - 1]
+    if index % interval != 0 or index <= interval:
+        return previous.difficulty
+    expected = constants.TARGET_BLOCK_TIME * interval
+    actual = previous.timestamp - chain[index - 1 - interval].timestamp
+    # Limit the adjustment, so a few odd timestamps can't swing it too far
+    actual = max(expected / constants.MAX_DIFFICULTY_ADJUSTMENT,
+                 min(actual, expected * constants.MAX_DIFFICULTY_ADJUSTMENT))
+    return max(1, int(previous.difficulty * expected / actual))
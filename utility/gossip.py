@@ -0,0 +1,153 @@
+"""Provides the bookkeeping to relay blocks and transactions by gossip."""
+
+import random
+import socket
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from time import time
+
+import utility.constants as constants
+
+# Sent with every message, so the receiver knows which of its peers it came
+# from (and doesn't send it back)
+NODE_PORT_HEADER = 'X-Node-Port'
+
+
+class SeenSet:
+    """A set of message ids which forgets ids after ttl seconds or when it
+    holds more than max_size ids (the oldest first).
+
+    Attributes:
+        :max_size: The maximal number of ids.
+        :ttl: The seconds an id is remembered.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__ids = OrderedDict()
+
+    def __contains__(self, message_id):
+        self.__expire()
+        return message_id in self.__ids
+
+    def __len__(self):
+        return len(self.__ids)
+
+    def add(self, message_id):
+        """Add an id and return True if it wasn't in the set yet."""
+        self.__expire()
+        new = message_id not in self.__ids
+        self.__ids[message_id] = time()
+        self.__ids.move_to_end(message_id)
+        while len(self.__ids) > self.max_size:
+            self.__ids.popitem(last=False)
+        return new
+
+    def __expire(self):
+        # The ids are in the order they were added, so we can stop at a
+        # fresh one
+        now = time()
+        while self.__ids and now - next(iter(self.__ids.values())) > self.ttl:
+            self.__ids.popitem(last=False)
+
+
+class Gossip:
+    """Decides which peers a block or transaction is relayed to. Every
+    message is identified by its id (the block hash or transaction id).
+
+    A message is only relayed the first time it's seen, never back to the
+    peer it came from and never to a peer known to have it. Of the remaining
+    peers a random subset of fanout peers is picked.
+
+    Attributes:
+        :fanout: The number of peers a message is relayed to.
+        :seen (private): The ids of the messages this node has seen.
+        :inventory (private): The ids of the messages each peer is known to
+        have.
+    """
+
+    def __init__(self, fanout=constants.GOSSIP_FANOUT,
+                 seen_size=constants.GOSSIP_SEEN_SIZE,
+                 seen_ttl=constants.GOSSIP_SEEN_TTL,
+                 inventory_size=constants.GOSSIP_INVENTORY_SIZE):
+        self.fanout = fanout
+        self.seen_ttl = seen_ttl
+        self.inventory_size = inventory_size
+        self.__seen = SeenSet(seen_size, seen_ttl)
+        self.__inventory = {}
+        self.__lock = threading.Lock()
+
+    def has_seen(self, message_id):
+        """Check whether a message was seen already."""
+        with self.__lock:
+            return message_id in self.__seen
+
+    def mark_seen(self, message_id):
+        """Remember a message and return True if it wasn't seen before."""
+        with self.__lock:
+            return self.__seen.add(message_id)
+
+    def learned(self, peer, message_id):
+        """Remember that a peer has a message (it sent or received it)."""
+        if peer is None:
+            return
+        with self.__lock:
+            inventory = self.__inventory.get(peer)
+            if inventory is None:
+                inventory = SeenSet(self.inventory_size, self.seen_ttl)
+                self.__inventory[peer] = inventory
+            inventory.add(message_id)
+
+    def targets(self, peer_nodes, message_id, source=None):
+        """Return the peers a message is relayed to (and remember that they
+        have it).
+
+        Arguments:
+            :peer_nodes: The connected peer nodes.
+            :message_id: The id of the message.
+            :source: The peer the message came from (None if it was created
+            by this node).
+        """
+        with self.__lock:
+            candidates = [node for node in peer_nodes
+                          if node != source and
+                          message_id not in self.__inventory.get(node, ())]
+        if len(candidates) > self.fanout:
+            candidates = random.sample(candidates, self.fanout)
+        for node in candidates:
+            self.learned(node, message_id)
+        return candidates
+
+    def forget_peer(self, peer):
+        """Drop the inventory of a removed peer."""
+        with self.__lock:
+            self.__inventory.pop(peer, None)
+
+
+def source_peer(peer_nodes, address, port):
+    """Return the peer node a request came from (None if it's not one of
+    them).
+
+    Arguments:
+        :peer_nodes: The connected peer nodes (host:port).
+        :address: The IP address the request came from.
+        :port: The port the sending node listens on (from its
+        NODE_PORT_HEADER).
+    """
+    if not port:
+        return None
+    for node in peer_nodes:
+        host, _, node_port = node.rpartition(':')
+        if node_port == port and _resolve(host) == _resolve(address):
+            return node
+    return None
+
+
+@lru_cache(maxsize=256)
+def _resolve(host):
+    try:
+        return socket.gethostbyname(host)
+    except (socket.error, UnicodeError):
+        return host
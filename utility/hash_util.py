@@ -19,8 +19,93 @@ def hash_block(block):
     Arguments:
         :block: The block that should be hashed.
     """
-    hashable_block = block.__dict__.copy()
+    # The stored hash of the block isn't part of its content
+    hashable_block = block.header()
+    if block.merkle_root is not None:
+        # The Merkle root covers the transactions
+        return hash_header(hashable_block)
+    # Blocks from before Merkle roots cover their transactions directly
     hashable_block['transactions'] = [
-        tx.to_ordered_dict() for tx in hashable_block['transactions']
+        tx.to_ordered_dict() for tx in block.transactions
     ]
     return hash_string_256(json.dumps(hashable_block, sort_keys=True).encode()) # encode the json object to utf-8b 
+
+
+def hash_transaction(transaction):
+    """Returns the canonical id of a transaction (a hash over all of its
+    fields, including the signature).
+
+    Arguments:
+        :transaction: The transaction that should be hashed.
+    """
+    fields = [transaction.sender,
+              transaction.recipient,
+              transaction.amount,
+              transaction.time,
+              transaction.signature]
+    if transaction.fee:
+        fields.append(transaction.fee)
+    return hash_string_256(json.dumps(fields).encode())
+
+
+def hash_header(header):
+    """Hashes the header of a block with a Merkle root (see Block.header),
+    which is all its hash covers, so the hash can be checked without the
+    transactions.
+
+    Arguments:
+        :header: The header of the block as a dictionary.
+    """
+    return hash_string_256(json.dumps(header, sort_keys=True).encode())
+
+
+def merkle_parent(left, right):
+    """Returns the (raw) hash of an inner node of a Merkle tree from the raw
+    hashes of its children."""
+    # The prefix keeps inner nodes apart from transaction ids
+    return hl.sha256(b'\x01' + left + right).digest()
+
+
+def merkle_root(transactions):
+    """Returns the root of the Merkle tree over the ids of the transactions
+    (see hash_transaction).
+
+    Arguments:
+        :transactions: The transactions of a block.
+    """
+    level = [bytes.fromhex(hash_transaction(tx)) for tx in transactions]
+    if not level:
+        return hash_string_256(b'')
+    while len(level) > 1:
+        level = _merkle_level(level)
+    return level[0].hex()
+
+
+def merkle_proof(transactions, position):
+    """Returns the sibling hashes on the path from a transaction id to the
+    Merkle root, each with whether it's the left child (see
+    Verification.verify_merkle_proof).
+
+    Arguments:
+        :transactions: The transactions of a block.
+        :position: The position of the transaction in the block.
+    """
+    level = [bytes.fromhex(hash_transaction(tx)) for tx in transactions]
+    proof = []
+    while len(level) > 1:
+        sibling = position ^ 1
+        # The last node of an odd level has no sibling, it moves up as is
+        if sibling < len(level):
+            proof.append({'hash': level[sibling].hex(),
+                          'left': sibling < position})
+        level = _merkle_level(level)
+        position //= 2
+    return proof
+
+
+def _merkle_level(level):
+    parents = [merkle_parent(level[i], level[i + 1])
+               for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        parents.append(level[-1])
+    return parents
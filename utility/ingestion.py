@@ -0,0 +1,129 @@
+"""Provides batched ingestion of received transactions."""
+
+import queue
+import threading
+from concurrent.futures import Future
+
+import utility.constants as constants
+from utility.broadcast import broadcast_transactions, gossip
+from utility.hash_util import hash_transaction
+
+
+class TransactionIngestor:
+    """Admits transactions through a bounded queue. A worker thread takes
+    them off in batches and validates each batch with
+    Blockchain.add_transactions: one parallel signature check, one lock of
+    the chain and one write of the open transactions per batch. The new
+    transactions of a batch are relayed by gossip, with one message per
+    peer. Transactions which were relayed before are skipped (e.g. the ones
+    a peer sends back after they were mined).
+
+    Attributes:
+        :blockchain: The blockchain the transactions are added to.
+        :batch: The maximal number of transactions validated together.
+        :admitted: The number of transactions which were added.
+        :rejected: The number of invalid transactions.
+        :refused: The number of transactions refused because the queue was
+        full.
+        :batches: The number of validated batches.
+    """
+
+    def __init__(self, blockchain, queue_size=constants.INGEST_QUEUE_SIZE,
+                 batch=constants.INGEST_BATCH):
+        self.blockchain = blockchain
+        self.batch = batch
+        self.admitted = 0
+        self.rejected = 0
+        self.refused = 0
+        self.batches = 0
+        self.__queue = queue.Queue(queue_size)
+        self.__worker = None
+        self.__lock = threading.Lock()
+
+    def submit(self, transaction, source=None):
+        """Queue a transaction and return a future with its result (True if
+        it's open now or was seen before, False if it's invalid).
+
+        Raises queue.Full if the queue is full.
+
+        Arguments:
+            :transaction: The received transaction.
+            :source: The peer the transaction came from (None if it was
+            created by this node).
+        """
+        self.__start()
+        future = Future()
+        try:
+            self.__queue.put_nowait((transaction, source, future))
+        except queue.Full:
+            self.refused += 1
+            raise
+        return future
+
+    def submit_many(self, transactions, source=None):
+        """Queue transactions and return a future for each of them. The
+        transactions which don't fit into the queue get None."""
+        futures = []
+        for transaction in transactions:
+            try:
+                futures.append(self.submit(transaction, source))
+            except queue.Full:
+                futures.append(None)
+        return futures
+
+    def stop(self):
+        """Stop the worker once the queued transactions are done."""
+        with self.__lock:
+            if self.__worker is not None:
+                self.__queue.put(None)
+                self.__worker = None
+
+    def __start(self):
+        with self.__lock:
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__run, daemon=True)
+                self.__worker.start()
+
+    def __run(self):
+        running = True
+        while running:
+            batch = []
+            item = self.__queue.get()
+            # Take what else is waiting, up to a full batch
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch:
+                    break
+                try:
+                    item = self.__queue.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                running = False
+            if batch:
+                self.__ingest(batch)
+
+    def __ingest(self, batch):
+        fresh = []
+        for transaction, source, future in batch:
+            tx_id = hash_transaction(transaction)
+            gossip.learned(source, tx_id)
+            if gossip.has_seen(tx_id):
+                future.set_result(True)
+            else:
+                fresh.append((transaction, source, future))
+        transactions = [transaction for transaction, _, _ in fresh]
+        try:
+            results, added = self.blockchain.add_transactions(transactions)
+        except Exception as e:
+            print('Adding transactions failed: {}'.format(e))
+            results, added = [False] * len(fresh), []
+        for (_, _, future), result in zip(fresh, results):
+            future.set_result(result)
+        self.batches += 1
+        self.admitted += len(added)
+        self.rejected += results.count(False)
+        if added:
+            sources = {id(transaction): source for transaction, source, _ in fresh}
+            broadcast_transactions(self.blockchain.get_peer_nodes(), added,
+                                   [sources[id(tx)] for tx in added])
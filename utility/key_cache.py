@@ -0,0 +1,54 @@
+"""Provides a bounded cache of parsed public keys."""
+
+from collections import OrderedDict
+from threading import Lock
+import binascii
+
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+import utility.constants as constants
+
+
+class KeyCache:
+    """A least recently used cache of signature verifiers, keyed by the hex
+    encoded public key, so a key which shows up in many transactions is only
+    parsed once.
+
+    Attributes:
+        :maxsize: The maximal number of cached verifiers.
+        :hits: The number of lookups served from the cache.
+        :misses: The number of lookups which had to parse the key.
+    """
+
+    def __init__(self, maxsize=constants.KEY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__verifiers = OrderedDict()
+        self.__lock = Lock()
+
+    def get_verifier(self, public_key):
+        """Return the PKCS1_v1_5 verifier for a hex encoded public key.
+
+        Arguments:
+            :public_key: The hex encoded DER public key.
+        """
+        with self.__lock:
+            verifier = self.__verifiers.get(public_key)
+            if verifier is not None:
+                self.__verifiers.move_to_end(public_key)
+                self.hits += 1
+                return verifier
+            self.misses += 1
+        verifier = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(public_key)))
+        with self.__lock:
+            self.__verifiers[public_key] = verifier
+            if len(self.__verifiers) > self.maxsize:
+                self.__verifiers.popitem(last=False)
+        return verifier
+
+    def clear(self):
+        """Drop all cached verifiers."""
+        with self.__lock:
+            self.__verifiers.clear()
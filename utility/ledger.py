@@ -0,0 +1,134 @@
+"""Provides an incrementally maintained balance index."""
+
+from math import isclose
+
+from utility.address_table import addresses
+
+
+class Ledger:
+    """Keeps the balance of every participant up to date as blocks are added
+    to or dropped from the chain, so a balance lookup doesn't need to scan
+    the whole blockchain.
+
+    Attributes:
+        :balances (private): Confirmed balance per address id (received -
+        sent) over all blocks of the chain.
+        :pending_spent (private): Amount per address id which was sent in open
+        transactions (to avoid double spending).
+    """
+
+    def __init__(self):
+        self.__balances = {}
+        self.__pending_spent = {}
+
+    def get_balance(self, participant):
+        """Return the confirmed balance minus the pending spends of a
+        participant."""
+        participant = addresses.lookup(participant)
+        return (self.__balances.get(participant, 0) -
+                self.__pending_spent.get(participant, 0))
+
+    def get_confirmed_balance(self, participant):
+        """Return the balance of a participant over the blocks of the chain
+        only (ignoring open transactions)."""
+        return self.__balances.get(addresses.lookup(participant), 0)
+
+    def apply_block(self, block):
+        """Book all transactions of a block which was appended to the chain."""
+        for tx in block.transactions:
+            tx.intern()
+            self.__move(self.__balances, tx.sender_id, -(tx.amount + tx.fee))
+            self.__move(self.__balances, tx.recipient_id, tx.amount)
+
+    def revert_block(self, block):
+        """Undo all transactions of a block which was dropped from the
+        chain."""
+        for tx in block.transactions:
+            self.__move(self.__balances, tx.sender_id, tx.amount + tx.fee)
+            self.__move(self.__balances, tx.recipient_id, -tx.amount)
+
+    def rebuild(self, chain):
+        """Recompute the confirmed balances from scratch."""
+        self.__balances = {}
+        for block in chain:
+            self.apply_block(block)
+
+    def snapshot(self, reverted=()):
+        """Return the confirmed balance by address (leaving out zero
+        balances), e.g. for a checkpoint.
+
+        Arguments:
+            :reverted: The last blocks of the chain, which the balances
+            shouldn't cover.
+        """
+        balances = dict(self.__balances)
+        for block in reversed(reverted):
+            for tx in block.transactions:
+                self.__move(balances, tx.sender_id, tx.amount + tx.fee)
+                self.__move(balances, tx.recipient_id, -tx.amount)
+        return {addresses.address(participant): amount
+                for participant, amount in balances.items()
+                if not isclose(amount, 0, abs_tol=1e-9)}
+
+    def restore(self, balances, chain=()):
+        """Start from the confirmed balances of a checkpoint (by address)
+        and book the blocks after it.
+
+        Arguments:
+            :balances: The balances of the checkpoint.
+            :chain: The blocks of the chain after the checkpoint.
+        """
+        self.__balances = {addresses.intern(participant): amount
+                           for participant, amount in balances.items()}
+        for block in chain:
+            self.apply_block(block)
+
+    def add_pending(self, transaction):
+        """Reserve the amount of a new open transaction."""
+        transaction.intern()
+        self.__move(self.__pending_spent, transaction.sender_id,
+                    transaction.amount + transaction.fee)
+
+    def remove_pending(self, transaction):
+        """Release the amount of an open transaction which left the pool."""
+        self.__move(self.__pending_spent, transaction.sender_id,
+                    -(transaction.amount + transaction.fee))
+
+    def reset_pending(self, open_transactions):
+        """Recompute the pending spends from a list of open transactions."""
+        self.__pending_spent = {}
+        for tx in open_transactions:
+            self.add_pending(tx)
+
+    def is_consistent(self, chain, open_transactions, checkpoint=None):
+        """Rebuild the index from scratch and compare it with the incremental
+        result.
+
+        Arguments:
+            :chain: The chain the index should reflect.
+            :open_transactions: The open transactions the pending spends
+            should reflect.
+            :checkpoint: The checkpoint the chain was loaded from (its
+            balances are the start, the blocks it covers aren't replayed).
+        """
+        fresh = Ledger()
+        if checkpoint is None:
+            fresh.rebuild(chain)
+        else:
+            fresh.restore(checkpoint.balances, chain[checkpoint.height:])
+        fresh.reset_pending(open_transactions)
+        return (Ledger.__same_amounts(self.__balances, fresh.__balances) and
+                Ledger.__same_amounts(self.__pending_spent, fresh.__pending_spent))
+
+    @staticmethod
+    def __move(index, participant, amount):
+        index[participant] = index.get(participant, 0) + amount
+
+    @staticmethod
+    def __same_amounts(index1, index2):
+        # amounts may be floats, so small rounding differences are tolerated
+        for participant in set(index1) | set(index2):
+            if not isclose(index1.get(participant, 0), index2.get(participant, 0),
+                           abs_tol=1e-9):
+                return False
+        return True
@@ -0,0 +1,105 @@
+"""Provides the pool of open transactions."""
+
+from collections import OrderedDict
+from time import time
+
+import utility.constants as constants
+from utility.hash_util import hash_transaction
+
+
+class Mempool:
+    """Holds the open transactions keyed by their id, in the order they were
+    added (which is the order they are put into a block).
+
+    Attributes:
+        :max_size: The maximal number of transactions, the oldest ones are
+        evicted first.
+        :max_age: The number of seconds a transaction is kept.
+        :version: A counter which changes whenever the pool changes.
+    """
+
+    def __init__(self, transactions=(), max_size=constants.MEMPOOL_MAX_SIZE,
+                 max_age=constants.MEMPOOL_MAX_AGE):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.version = 0
+        self.__transactions = OrderedDict()
+        self.__added = {}
+        for tx in transactions:
+            self.add(tx)
+
+    def __contains__(self, transaction):
+        return hash_transaction(transaction) in self.__transactions
+
+    def __iter__(self):
+        return iter(list(self.__transactions.values()))
+
+    def __len__(self):
+        return len(self.__transactions)
+
+    def get(self, tx_id):
+        """Return the transaction with the given id (None if it's unknown)."""
+        return self.__transactions.get(tx_id)
+
+    def transactions(self):
+        """Return a list of the open transactions, oldest first."""
+        return list(self.__transactions.values())
+
+    def add(self, transaction):
+        """Add a transaction and return the list of transactions which were
+        evicted to make room for it (or because they expired)."""
+        tx_id = hash_transaction(transaction)
+        if tx_id in self.__transactions:
+            return []
+        evicted = self.evict_expired()
+        while len(self.__transactions) >= self.max_size:
+            evicted.append(self.__pop_oldest())
+        transaction.intern()
+        self.__transactions[tx_id] = transaction
+        self.__added[tx_id] = time()
+        self.version += 1
+        return evicted
+
+    def remove(self, transaction):
+        """Remove a transaction and return it (None if it wasn't open)."""
+        tx_id = hash_transaction(transaction)
+        if tx_id not in self.__transactions:
+            return None
+        del self.__added[tx_id]
+        self.version += 1
+        return self.__transactions.pop(tx_id)
+
+    def remove_transactions(self, transactions):
+        """Remove all transactions (e.g. the ones included in a block) and
+        return the ones which were open."""
+        removed = [self.remove(tx) for tx in transactions]
+        return [tx for tx in removed if tx is not None]
+
+    def evict_expired(self, now=None):
+        """Remove the transactions older than max_age and return them."""
+        if now is None:
+            now = time()
+        evicted = []
+        # The oldest transactions are first, so we can stop at a fresh one
+        while (self.__transactions and
+               now - self.__added[next(iter(self.__transactions))] > self.max_age):
+            evicted.append(self.__pop_oldest())
+        return evicted
+
+    def replace(self, transactions):
+        """Replace all open transactions."""
+        self.clear()
+        for tx in transactions:
+            self.add(tx)
+
+    def clear(self):
+        """Remove all open transactions."""
+        self.__transactions.clear()
+        self.__added.clear()
+        self.version += 1
+
+    def __pop_oldest(self):
+        tx_id, transaction = self.__transactions.popitem(last=False)
+        del self.__added[tx_id]
+        self.version += 1
+        return transaction
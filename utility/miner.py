@@ -0,0 +1,131 @@
+"""Provides a proof of work miner which shares the nonce space across a
+process pool."""
+
+import hashlib as hl
+import multiprocessing
+from threading import Lock
+from time import time
+
+import utility.constants as constants
+from utility.verification import Verification
+from utility.difficulty import target
+
+# Shared with the worker processes by _init_worker
+_stop = None
+_hashes = None
+
+
+def _init_worker(stop, hashes):
+    global _stop, _hashes
+    _stop = stop
+    _hashes = hashes
+
+
+def _search(prefix, proof_target, start, step, batch):
+    """Test the proofs start, start + step, start + 2 * step, ... until one is
+    valid or the search is stopped.
+
+    Arguments:
+        :prefix: The constant part of the proof of work input.
+        :proof_target: The number a valid digest has to be below.
+        :start: The first proof to test.
+        :step: The distance between two tested proofs.
+        :batch: The number of proofs tested between checks of the stop event.
+    """
+    # The prefix is hashed once, every guess only hashes the proof suffix
+    base = hl.sha256(prefix)
+    proof = start
+    tested = 0
+    found = None
+    while found is None and not _stop.is_set():
+        for _ in range(batch):
+            guess = base.copy()
+            guess.update(str(proof).encode())
+            tested += 1
+            if Verification.valid_digest(guess.digest(), proof_target):
+                found = proof
+                break
+            proof += step
+    with _hashes.get_lock():
+        _hashes.value += tested
+    return found
+
+
+class Miner:
+    """Searches proofs of work with a pool of processes. Each process tests
+    its own share of the nonce space.
+
+    Attributes:
+        :processes: The number of mining processes.
+        :batch: The number of proofs a process tests between checks for
+        cancellation.
+        :hashrate: The hashes per second of the last mining run.
+        :hashes: The number of hashes tested in the last mining run.
+    """
+
+    def __init__(self, processes=constants.MINING_PROCESSES,
+                 batch=constants.MINING_BATCH):
+        self.processes = processes
+        self.batch = batch
+        self.hashrate = 0
+        self.hashes = 0
+        self.__context = multiprocessing.get_context(
+            constants.MULTIPROCESSING_START_METHOD)
+        self.__stop = self.__context.Event()
+        self.__hashes = self.__context.Value('Q', 0)
+        self.__pool = None
+        self.__lock = Lock()
+
+    def mine(self, transactions, last_hash,
+             difficulty=constants.INITIAL_DIFFICULTY):
+        """Return the first proof found for the transactions and the hash of
+        the previous block at the given difficulty, or None if mining was
+        cancelled."""
+        return self.mine_prefix(Verification.proof_prefix(transactions, last_hash),
+                                difficulty)
+
+    def mine_prefix(self, prefix, difficulty=constants.INITIAL_DIFFICULTY):
+        """Return the first proof found for an already serialized proof of
+        work prefix (see Verification.proof_prefix), or None if mining was
+        cancelled."""
+        proof_target = target(difficulty)
+        with self.__lock:
+            self.__stop.clear()
+            self.__hashes.value = 0
+            start = time()
+            if self.processes > 1:
+                proofs = self.__mine_parallel(prefix, proof_target)
+            else:
+                _init_worker(self.__stop, self.__hashes)
+                proofs = [_search(prefix, proof_target, 0, 1, self.batch)]
+            elapsed = time() - start
+            self.hashes = self.__hashes.value
+            self.hashrate = self.hashes / elapsed if elapsed > 0 else 0
+        found = [proof for proof in proofs if proof is not None]
+        if not found:
+            return None
+        return min(found)
+
+    def cancel(self):
+        """Stop a running mining run (e.g. because a competing block was
+        received)."""
+        self.__stop.set()
+
+    def __mine_parallel(self, prefix, proof_target):
+        if self.__pool is None:
+            self.__pool = self.__context.Pool(self.processes,
+                                              initializer=_init_worker,
+                                              initargs=(self.__stop, self.__hashes))
+        # The first process to find a proof stops all the others
+        results = [
+            self.__pool.apply_async(
+                _search, (prefix, proof_target, worker, self.processes,
+                          self.batch),
+                callback=self.__on_result)
+            for worker in range(self.processes)
+        ]
+        return [result.get() for result in results]
+
+    def __on_result(self, proof):
+        if proof is not None:
+            self.__stop.set()
@@ -0,0 +1,140 @@
+"""Provides a background mining service."""
+
+import threading
+from collections import OrderedDict
+from itertools import count
+from time import time
+
+import utility.constants as constants
+
+
+class MiningJob:
+    """A request to mine one block (or blocks until it's stopped).
+
+    Attributes:
+        :id: The id of the job.
+        :continuous: Whether the job keeps mining until it's stopped.
+        :status: One of 'mining', 'done', 'stopped' or 'failed'.
+        :blocks: The indices and hashes of the blocks the job mined.
+        :started: The time the job was started.
+        :finished: The time the job ended (None while it's running).
+        :message: Why the job failed (None otherwise).
+    """
+
+    def __init__(self, job_id, continuous):
+        self.id = job_id
+        self.continuous = continuous
+        self.status = 'mining'
+        self.blocks = []
+        self.started = time()
+        self.finished = None
+        self.message = None
+        self.stop_requested = False
+
+    @property
+    def running(self):
+        return self.status == 'mining'
+
+    def to_dict(self):
+        return {'id': self.id,
+                'continuous': self.continuous,
+                'status': self.status,
+                'blocks': list(self.blocks),
+                'started': self.started,
+                'finished': self.finished,
+                'message': self.message}
+
+
+class MiningService:
+    """Mines in a background thread, so requests don't wait for the proof of
+    work (or for the peers the block is sent to). Only one job runs at a
+    time. When a competing block arrives the miner is cancelled and the job
+    starts over on the new tip.
+
+    Attributes:
+        :blockchain: The blockchain the blocks are mined for.
+        :jobs (private): The most recent jobs by id.
+        :active (private): The running job (None if there is none).
+        :last_block_latency: The seconds from starting to mine on a tip until
+        the mined block was appended and sent to the peers.
+        :blocks_mined: The number of blocks mined by the service.
+    """
+
+    def __init__(self, blockchain, history=constants.MINING_JOB_HISTORY):
+        self.blockchain = blockchain
+        self.history = history
+        self.last_block_latency = None
+        self.blocks_mined = 0
+        self.__jobs = OrderedDict()
+        self.__active = None
+        self.__ids = count(1)
+        self.__lock = threading.Lock()
+
+    def start(self, continuous=False):
+        """Start a mining job and return it. If a job is running already, it
+        is returned instead."""
+        with self.__lock:
+            if self.__active is not None and self.__active.running:
+                return self.__active
+            job = MiningJob(next(self.__ids), continuous)
+            self.__jobs[job.id] = job
+            while len(self.__jobs) > self.history:
+                self.__jobs.popitem(last=False)
+            self.__active = job
+        threading.Thread(target=self.__run, args=(job,), daemon=True).start()
+        return job
+
+    def stop(self, job_id=None):
+        """Stop the given job (by default the running one) and return it, or
+        None if there is no such job."""
+        with self.__lock:
+            job = self.__active if job_id is None else self.__jobs.get(job_id)
+        if job is None:
+            return None
+        if job.running:
+            job.stop_requested = True
+            self.blockchain.miner.cancel()
+        return job
+
+    def get_job(self, job_id):
+        """Return the job with the given id (None if it's unknown)."""
+        with self.__lock:
+            return self.__jobs.get(job_id)
+
+    def status(self):
+        """Return the state of the service and its metrics."""
+        with self.__lock:
+            active = self.__active if self.__active and self.__active.running else None
+        return {'mining': active is not None,
+                'job': active.to_dict() if active else None,
+                'hashrate': self.blockchain.miner.hashrate,
+                'last_block_latency': self.last_block_latency,
+                'blocks_mined': self.blocks_mined}
+
+    def __run(self, job):
+        try:
+            while not job.stop_requested:
+                if self.blockchain.public_key is None:
+                    job.message = 'No wallet is set up.'
+                    job.status = 'failed'
+                    break
+                start = time()
+                # None means mining was cancelled, a new tip arrived (and
+                # mining starts over on it) or the job was stopped
+                block = self.blockchain.mine_block()
+                if block is None:
+                    continue
+                self.last_block_latency = time() - start
+                self.blocks_mined += 1
+                job.blocks.append({'index': block.index, 'hash': block.hash})
+                if not job.continuous:
+                    job.status = 'done'
+                    break
+            else:
+                job.status = 'stopped'
+        except Exception as e:
+            print('Mining failed: {}'.format(e))
+            job.message = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished = time()
@@ -1,4 +1,7 @@
 class Printable:
-    """A base class which implements printing functionality."""
+    """A base class which implements printing functionality (subclasses
+    provide to_dict)."""
+    __slots__ = ()
+
     def __repr__(self):
-        return str(self.__dict__)
+        return str(self.to_dict())
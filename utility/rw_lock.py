@@ -0,0 +1,92 @@
+"""Provides a reader-writer lock."""
+
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """Lets any number of readers hold the lock at the same time, but a
+    writer only alone. Waiting writers go first, so a steady stream of
+    readers can't starve them.
+
+    The thread holding the write lock may take the read or write lock again,
+    a thread holding the read lock may take the read lock again (but not the
+    write lock).
+
+    Attributes:
+        :condition (private): Guards the counters below.
+        :readers (private): The number of threads holding the read lock.
+        :writer (private): The thread holding the write lock (None if there
+        is none).
+        :writer_depth (private): How often the writer took the lock.
+        :waiting_writers (private): The number of threads waiting for the
+        write lock.
+        :local (private): The read depth of the current thread.
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = 0
+        self.__writer = None
+        self.__writer_depth = 0
+        self.__waiting_writers = 0
+        self.__local = threading.local()
+
+    @contextmanager
+    def read(self):
+        """Hold the read lock for the duration of a with block."""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """Hold the write lock for the duration of a with block."""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def acquire_read(self):
+        depth = getattr(self.__local, 'depth', 0)
+        me = threading.get_ident()
+        with self.__condition:
+            # Nested reads (and reads of the writer) must not wait for
+            # writers, they would wait for themselves
+            if depth == 0 and self.__writer != me:
+                while self.__writer is not None or self.__waiting_writers:
+                    self.__condition.wait()
+            self.__readers += 1
+        self.__local.depth = depth + 1
+
+    def release_read(self):
+        with self.__condition:
+            self.__readers -= 1
+            if self.__readers == 0:
+                self.__condition.notify_all()
+        self.__local.depth -= 1
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self.__condition:
+            if self.__writer == me:
+                self.__writer_depth += 1
+                return
+            if getattr(self.__local, 'depth', 0):
+                raise RuntimeError('can not upgrade a read lock to a write lock')
+            self.__waiting_writers += 1
+            while self.__writer is not None or self.__readers:
+                self.__condition.wait()
+            self.__waiting_writers -= 1
+            self.__writer = me
+            self.__writer_depth = 1
+
+    def release_write(self):
+        with self.__condition:
+            self.__writer_depth -= 1
+            if self.__writer_depth == 0:
+                self.__writer = None
+                self.__condition.notify_all()
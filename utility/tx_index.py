@@ -0,0 +1,184 @@
+"""Provides the index of the transactions of the chain."""
+
+import json
+from bisect import bisect_left
+
+import utility.constants as constants
+from utility.address_table import addresses
+from utility.hash_util import hash_transaction
+
+
+class TxIndex:
+    """Indexes the transactions of the chain by their id and by address, so
+    a transaction (or the history of an address) is found without scanning
+    the chain.
+
+    Blocks are indexed in the order of the chain and dropped from the top
+    (when a reorganisation replaces them). Every indexed block is appended
+    as one JSON line to a log file, so a restarted node only reads the log.
+    A line holds the transaction ids and, for each transaction, the log ids
+    of its sender and recipient. An address is written out in full only in
+    the line of the block it first appears in, which assigns its log id.
+
+    Attributes:
+        :path: The log file of the index.
+        :transactions (private): The block index and position of every
+        transaction by its id.
+        :history (private): The block index and position of the transactions
+        of every address by its id, oldest first.
+        :blocks (private): The hash, log offset, transaction ids, address
+        ids and number of newly logged addresses of every indexed block.
+        :logged (private): The address id of every log id, in the order the
+        addresses were first written to the log.
+        :log_ids (private): The log id of every logged address by its id.
+        :size (private): The size of the log file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__transactions = {}
+        self.__history = {}
+        self.__blocks = []
+        self.__logged = []
+        self.__log_ids = {}
+        self.__size = 0
+        self.__load()
+
+    @property
+    def height(self):
+        """The number of indexed blocks."""
+        return len(self.__blocks)
+
+    def block_hash(self, index):
+        """Return the hash of the indexed block at the given index."""
+        return self.__blocks[index][0]
+
+    def locate(self, tx_id):
+        """Return the block index and position of a transaction (None if
+        it's not part of an indexed block)."""
+        return self.__transactions.get(tx_id)
+
+    def history(self, address, limit=constants.HISTORY_PAGE_SIZE, before=None):
+        """Return the block indices and positions of the transactions of an
+        address, newest first.
+
+        Arguments:
+            :address: The address (public key).
+            :limit: The maximal number of transactions.
+            :before: Only transactions before this block index and position
+            are returned (e.g. the last one of the previous page).
+        """
+        refs = self.__history.get(addresses.lookup(address), [])
+        end = len(refs) if before is None else bisect_left(refs, tuple(before))
+        return refs[max(end - limit, 0):end][::-1]
+
+    def add(self, block):
+        """Index the transactions of the block appended to the chain."""
+        new_addresses = []
+        new_ids = {}
+
+        def log_id(address):
+            address_id = self.__log_ids.get(addresses.lookup(address))
+            if address_id is not None:
+                return address_id
+            if address not in new_ids:
+                new_ids[address] = len(self.__logged) + len(new_addresses)
+                new_addresses.append(address)
+            return new_ids[address]
+        # The mining reward has no sender
+        entry = {'index': block.index,
+                 'hash': block.hash,
+                 'transactions': [[hash_transaction(tx),
+                                   None if tx.sender == constants.MINING
+                                   else log_id(tx.sender),
+                                   log_id(tx.recipient)]
+                                  for tx in block.transactions]}
+        entry['addresses'] = new_addresses
+        line = json.dumps(entry) + '\n'
+        try:
+            with open(self.path, mode='a') as f:
+                f.write(line)
+        except IOError:
+            print('Saving failed!')
+        self.__index_entry(entry, len(line))
+
+    def truncate(self, height):
+        """Drop the blocks from the given index onwards."""
+        if height >= len(self.__blocks):
+            return
+        offset = self.__blocks[height][1]
+        while len(self.__blocks) > height:
+            self.__drop_last()
+        try:
+            with open(self.path, mode='r+') as f:
+                f.truncate(offset)
+        except IOError:
+            print('Saving failed!')
+        self.__size = offset
+
+    def __drop_last(self):
+        index = len(self.__blocks) - 1
+        _, _, tx_ids, touched, logged = self.__blocks.pop()
+        for _ in range(logged):
+            del self.__log_ids[self.__logged.pop()]
+        for tx_id in tx_ids:
+            # A transaction could be in an earlier block as well
+            if self.__transactions.get(tx_id, (None,))[0] == index:
+                del self.__transactions[tx_id]
+        for participant in touched:
+            refs = self.__history[participant]
+            while refs and refs[-1][0] == index:
+                refs.pop()
+            if not refs:
+                del self.__history[participant]
+
+    def __load(self):
+        """Rebuild the index from its log, dropping a partially written last
+        line (e.g. after a crash)."""
+        try:
+            with open(self.path, mode='r') as f:
+                lines = f.readlines()
+        except IOError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                if not line.endswith('\n') or entry['index'] != len(self.__blocks):
+                    raise ValueError('Unexpected line in the transaction index log')
+                self.__index_entry(entry, len(line))
+            except (ValueError, KeyError, TypeError):
+                with open(self.path, mode='r+') as f:
+                    f.truncate(self.__size)
+                return
+
+    def __index_entry(self, entry, size):
+        """Index a log entry. Raises ValueError (and indexes nothing) if it
+        refers to an address which wasn't logged."""
+        index = entry['index']
+        logged = len(self.__logged)
+        new_ids = [addresses.intern(address) for address in entry['addresses']]
+        known = logged + len(new_ids)
+        for _, sender, recipient in entry['transactions']:
+            if not (isinstance(recipient, int) and 0 <= recipient < known and
+                    (sender is None or isinstance(sender, int) and 0 <= sender < known)):
+                raise ValueError('Unknown address in the transaction index log')
+        for address_id in new_ids:
+            self.__log_ids[address_id] = len(self.__logged)
+            self.__logged.append(address_id)
+        tx_ids = []
+        touched = set()
+        for position, (tx_id, sender, recipient) in enumerate(entry['transactions']):
+            tx_ids.append(tx_id)
+            self.__transactions[tx_id] = (index, position)
+            participants = [self.__logged[recipient]]
+            # The mining reward would list every block under the sender
+            if sender is not None:
+                participants.append(self.__logged[sender])
+            for participant in participants:
+                refs = self.__history.setdefault(participant, [])
+                if not refs or refs[-1] != (index, position):
+                    refs.append((index, position))
+                touched.add(participant)
+        self.__blocks.append((entry['hash'], self.__size, tx_ids, touched,
+                              len(new_ids)))
+        self.__size += size
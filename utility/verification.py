@@ -1,16 +1,54 @@
 """Provides verification helper methods."""
 
-from utility.hash_util import hash_string_256, hash_block
+import hashlib as hl
+from time import time
+
+from utility.difficulty import next_difficulty, median_time_past, target
+from utility.hash_util import hash_header, merkle_parent
+import utility.constants as constants
+from utility.batch_verification import BatchVerifier
+from block import valid_transaction_fields
 from wallet import Wallet
 
 
 class Verification:
     """A helper class which offer various static and class-based verification
     and validation methods."""
+    # Shared by all checks, so there is only one pool of verifying processes
+    batch_verifier = BatchVerifier()
+
+    @staticmethod
+    def proof_prefix(transactions, last_hash):
+        """Return the constant part of the proof of work input (everything
+        but the proof number), encoded to bytes.
+
+        Arguments:
+            :transactions: The transactions of the block for which the proof
+            is created.
+            :last_hash: The previous block's hash which will be stored in the
+            current block.
+        """
+        return (str([tx.to_ordered_dict() for tx in transactions]) +
+                str(last_hash)).encode()
+
+    @staticmethod
+    def merkle_proof_prefix(merkle_root, last_hash):
+        """Return the constant part of the proof of work input of a block
+        with a Merkle root (it stands in for the transactions), encoded to
+        bytes."""
+        return (str(merkle_root) + str(last_hash)).encode()
+
     @staticmethod
-    def valid_proof(transactions, last_hash, proof):
+    def valid_digest(digest, proof_target):
+        """Check whether a raw proof of work digest solves the puzzle (is
+        below the target when read as a number)."""
+        return int.from_bytes(digest, 'big') < proof_target
+
+    @classmethod
+    def valid_proof(cls, transactions, last_hash, proof,
+                    difficulty=constants.INITIAL_DIFFICULTY):
         """Validate a proof of work number and see if it solves the puzzle
-        algorithm (two leading 0s)
+        algorithm (a digest below the target of the difficulty)
 
         Arguments:
             :transactions: The transactions of the block for which the proof
@@ -18,42 +56,158 @@ class Verification:
             :last_hash: The previous block's hash which will be stored in the
             current block.
             :proof: The proof number we're testing.
+            :difficulty: The difficulty stored in the block.
         """
+        return cls.valid_prefix_proof(cls.proof_prefix(transactions, last_hash),
+                                      proof, difficulty)
+
+    @classmethod
+    def valid_block_proof(cls, block):
+        """Validate the proof of work of a block. It covers the Merkle root
+        of the block, blocks from before Merkle roots cover their
+        transactions (but the mining reward) directly."""
+        if block.merkle_root is None:
+            return cls.valid_proof(block.transactions[:-1], #the last tx is the mining so it's ignored
+                                   block.previous_hash,
+                                   block.proof,
+                                   block.difficulty)
+        return cls.valid_prefix_proof(
+            cls.merkle_proof_prefix(block.merkle_root, block.previous_hash),
+            block.proof, block.difficulty)
+
+    @classmethod
+    def valid_prefix_proof(cls, prefix, proof, difficulty):
+        """Validate a proof of work number for a serialized proof of work
+        prefix (see proof_prefix and merkle_proof_prefix)."""
         # Create a string with all the hash inputs
-        guess = (str([tx.to_ordered_dict() for tx in transactions]
-                     ) + str(last_hash) + str(proof)).encode()
+        guess = prefix + str(proof).encode()
         # Hash the string
         # IMPORTANT: This is NOT the same hash as will be stored in the
         # previous_hash. It's a not a block's hash. It's only used for the
         # proof-of-work algorithm.
-        guess_hash = hash_string_256(guess)
-        # Only a hash (which is based on the above inputs) which starts with
-        # two 0s is treated as valid
-        # This condition is of course defined by you. You could also require
-        # 10 leading 0s - this would take significantly longer (and this
-        # allows you to control the speed at which new blocks can be added)
-        return guess_hash[0:2] == '00'
+        guess_hash = hl.sha256(guess).digest()
+        # Only a hash (which is based on the above inputs) which is below the
+        # target is treated as valid
+        # The higher the difficulty, the lower the target - this allows you
+        # to control the speed at which new blocks can be added (the
+        # difficulty is retargeted from the time the last blocks took)
+        return cls.valid_digest(guess_hash, target(difficulty))
+
+    @staticmethod
+    def valid_timestamp(block, chain, now=None):
+        """Check that the timestamp of a block is later than the median of
+        the blocks before it and not more than MAX_FUTURE_BLOCK_TIME seconds
+        ahead of now.
+
+        Arguments:
+            :block: The block which is checked.
+            :chain: The chain (or branch) holding the blocks before it.
+            :now: The current time (by default our clock).
+        """
+        if now is None:
+            now = time()
+        return (median_time_past(chain, block.index) < block.timestamp <=
+                now + constants.MAX_FUTURE_BLOCK_TIME)
 
     @classmethod
-    def verify_chain(cls, blockchain):
+    def verify_chain(cls, blockchain, start=1):
         """ Verify the current blockchain and return True if it's valid, False
-        otherwise."""
-        for (index, block) in enumerate(blockchain):
-            if index == 0:
-                continue
-            if block.previous_hash != hash_block(blockchain[index - 1]):
+        otherwise.
+
+        Arguments:
+            :blockchain: The chain that should be verified.
+            :start: The index of the first block to verify (the blocks before
+            it are trusted, e.g. because they are already part of our chain).
+        """
+        for index in range(max(start, 1), len(blockchain)):
+            block = blockchain[index]
+            if (block.index != index or
+                    block.previous_hash != blockchain[index - 1].hash):
                 return False
-            if not cls.valid_proof(block.transactions[:-1],
-                                   block.previous_hash,
-                                   block.proof):
+            if block.difficulty != next_difficulty(blockchain, index):
+                print('Difficulty is invalid')
+                return False
+            if not cls.valid_timestamp(block, blockchain):
+                print('Timestamp is invalid')
+                return False
+            if not cls.valid_block_proof(block):
                 print('Proof of work is invalid')
                 return False
-            for tx in block.transactions[:-1]:
-                if not Wallet.verify_transaction(tx):
-                    print('fake transaction')
-                    return False
+        # The signatures of all blocks are checked in one batch (the last
+        # transaction of a block is the mining reward, it isn't signed)
+        signed_transactions = [tx for block in blockchain[max(start, 1):]
+                               for tx in block.transactions[:-1]]
+        if not all(map(cls.valid_amounts, signed_transactions)):
+            print('Amount is invalid')
+            return False
+        if not cls.verify_signatures(signed_transactions):
+            print('fake transaction')
+            return False
         return True
 
+    @classmethod
+    def verify_signatures(cls, transactions):
+        """Return True if the signatures of all transactions are valid, False
+        otherwise."""
+        return all(cls.batch_verifier.verify(transactions))
+
+    @staticmethod
+    def verify_merkle_proof(tx_id, proof, merkle_root):
+        """Check that a transaction id is part of the Merkle tree with the
+        given root.
+
+        Arguments:
+            :tx_id: The id of the transaction (see hash_transaction).
+            :proof: The sibling hashes from the transaction id up to the root
+            (see merkle_proof).
+            :merkle_root: The Merkle root of the block.
+        """
+        try:
+            node = bytes.fromhex(tx_id)
+            for step in proof:
+                sibling = bytes.fromhex(step['hash'])
+                if step['left']:
+                    node = merkle_parent(sibling, node)
+                else:
+                    node = merkle_parent(node, sibling)
+        except (KeyError, TypeError, ValueError):
+            return False
+        return node.hex() == merkle_root
+
+    @classmethod
+    def verify_inclusion(cls, tx_id, inclusion):
+        """Check an inclusion proof (see Blockchain.get_merkle_proof): the
+        header hashes to the block hash and its Merkle root holds the
+        transaction. Whether the block is part of the best chain has to be
+        checked against its hash.
+
+        Arguments:
+            :tx_id: The id of the transaction.
+            :inclusion: The inclusion proof as a dictionary.
+        """
+        try:
+            header = inclusion['header']
+            return (hash_header(header) == inclusion['block_hash'] and
+                    cls.verify_merkle_proof(tx_id, inclusion['proof'],
+                                            header['merkle_root']))
+        except (KeyError, TypeError):
+            return False
+
+    @staticmethod
+    def valid_fields(transaction):
+        """Check that every field of a transaction has the right type (the
+        time isn't signed, so any peer could replace it)."""
+        return valid_transaction_fields(transaction.to_dict())
+
+    @staticmethod
+    def valid_amounts(transaction):
+        """Check that the amount and fee of a transaction are numbers, the
+        amount is positive and the fee isn't negative."""
+        for value in (transaction.amount, transaction.fee):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return False
+        return transaction.amount > 0 and transaction.fee >= 0
+
     @staticmethod
     def verify_transaction(transaction, get_balance, check_funds=True):
         """Verify a transaction by checking whether the sender has sufficient coins.
@@ -63,7 +217,7 @@ class Verification:
         """
         if check_funds:
             sender_balance = get_balance(transaction.sender)
-            return (sender_balance >= transaction.amount and
+            return (sender_balance >= transaction.amount + transaction.fee and
                     Wallet.verify_transaction(transaction))
         else:
             return Wallet.verify_transaction(transaction)
@@ -71,5 +225,4 @@ class Verification:
     @classmethod
     def verify_transactions(cls, open_transactions, get_balance):
         """Verifies all open transactions."""
-        return all([cls.verify_transaction(tx, get_balance, False)
-                    for tx in open_transactions])
+        return cls.verify_signatures(open_transactions)
@@ -4,21 +4,28 @@ from Crypto.Hash import SHA256
 import Crypto.Random
 import binascii
 
+from utility.key_cache import KeyCache
+
 
 class Wallet:
     """Creates, loads and holds private and public keys. Manages transaction
     signing and verification."""
+    # Parsed public keys of senders, shared by all verifications
+    key_cache = KeyCache()
 
     def __init__(self, node_id):
         self.private_key = None
         self.public_key = None
         self.node_id = node_id
+        # The signer of our own private key, parsed once per key pair
+        self.__signer = None
 
     def create_keys(self):
         """Create a new pair of private and public keys."""
         private_key, public_key = self.generate_keys()
         self.private_key = private_key
         self.public_key = public_key
+        self.__signer = None
 
     def save_keys(self):
         """Saves the keys to a file (wallet.txt)."""
@@ -40,6 +47,7 @@ class Wallet:
                 keys = f.readlines()
                 self.public_key = keys[0][:-1]
                 self.private_key = keys[1]
+                self.__signer = None
             return True
         except (IOError, IndexError):
             print('Loading wallet failed...')
@@ -54,19 +62,32 @@ class Wallet:
             binascii.hexlify(public_key.exportKey(format='DER')).decode('ascii')
         )
 
-    def sign_transaction(self, sender, recipient, amount):
+    def sign_transaction(self, sender, recipient, amount, fee=0):
         """Sign a transaction and return the signature.
 
         Arguments:
             :sender: The sender of the transaction.
             :recipient: The recipient of the transaction.
             :amount: The amount of the transaction.
+            :fee: The fee of the transaction.
         """
-        signer = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(self.private_key)))
-        h = SHA256.new((str(sender) + str(recipient) + str(amount)).encode('utf8'))
+        if self.__signer is None:
+            self.__signer = PKCS1_v1_5.new(
+                RSA.importKey(binascii.unhexlify(self.private_key)))
+        signer = self.__signer
+        h = Wallet.signed_hash(sender, recipient, amount, fee)
         signature = signer.sign(h)
         return binascii.hexlify(signature).decode('ascii')
 
+    @staticmethod
+    def signed_hash(sender, recipient, amount, fee=0):
+        """Return the SHA256 hash of the signed content of a transaction."""
+        content = str(sender) + str(recipient) + str(amount)
+        # Transactions without a fee are signed like before fees existed
+        if fee:
+            content += str(fee)
+        return SHA256.new(content.encode('utf8'))
+
     @staticmethod
     def verify_transaction(transaction):
         """Verify the signature of a transaction.
@@ -74,8 +95,30 @@ class Wallet:
         Arguments:
             :transaction: The transaction that should be verified.
         """
-        public_key = RSA.importKey(binascii.unhexlify(transaction.sender))
-        verifier = PKCS1_v1_5.new(public_key)
-        h = SHA256.new((str(transaction.sender) + str(transaction.recipient) +
-        str(transaction.amount)).encode('utf8'))
+        verifier = Wallet.key_cache.get_verifier(transaction.sender)
+        h = Wallet.signed_hash(transaction.sender, transaction.recipient,
+                               transaction.amount, transaction.fee)
         return verifier.verify(h, binascii.unhexlify(transaction.signature))
+
+    @staticmethod
+    def verify_transactions(transactions):
+        """Verify the signatures of a list of transactions and return a list
+        with the result of each one. The public key of every sender is only
+        parsed once (the parsed keys are cached across calls).
+
+        Arguments:
+            :transactions: The transactions that should be verified.
+        """
+        results = []
+        for transaction in transactions:
+            try:
+                verifier = Wallet.key_cache.get_verifier(transaction.sender)
+                h = Wallet.signed_hash(transaction.sender,
+                                       transaction.recipient,
+                                       transaction.amount, transaction.fee)
+                results.append(verifier.verify(
+                    h, binascii.unhexlify(transaction.signature)))
+            except (ValueError, TypeError, IndexError):
+                # a malformed key or signature is just an invalid transaction
+                results.append(False)
+        return results